@@ -21,6 +21,29 @@ def datalayer_value(shape: Shape, datalayer: Datalayer, when: dt.date | None = N
     return shape.datalayer_value(datalayer, when=when)
 
 
+@register.simple_tag
+def datalayer_values(shape: Shape, datalayers, when: dt.date | None = None):
+    """
+    Value at the given date, first and last value of each Data Layer for the shape.
+
+    Returns a (Data Layer, value, first value, last value) tuple per Data Layer,
+    the values of all Data Layers are selected at once (three queries in total).
+    """
+    # coerce empty string
+    if when == "":
+        when = None
+
+    datalayers = list(datalayers)
+    values = Datalayer.values_for_shape(shape, datalayers, when=when)
+    first_values = Datalayer.values_for_shape(shape, datalayers, mode="up")
+    last_values = Datalayer.values_for_shape(shape, datalayers)
+
+    return [
+        (dl, values[dl.id], first_values[dl.id], last_values[dl.id])
+        for dl in datalayers
+    ]
+
+
 # TODO: this is more of a hack to allow calling the datalayer_value() method
 # with a parameter from inside a template. Is there a better way?
 @register.filter
@@ -349,7 +349,7 @@ def tools_picker(request):
             else:
                 all_layers = Datalayer.objects.visible_to(request.user).all()
             context["datalayers"] = []
-            for layer in all_layers:
+            for layer in all_layers.select_related("category").prefetch_related("tags"):
                 if layer.is_available():
                     context["datalayers"].append(layer)
 
@@ -7,12 +7,19 @@ import pytest
 from django.contrib.auth import get_user_model
 from django.contrib.gis.geos import GEOSGeometry
 
+from datalayers.catalog import catalog
 from datalayers.models import Datalayer
 from shapes.models import Shape, Type
 
 User = get_user_model()
 
 
+@pytest.fixture(autouse=True)
+def reset_catalog():
+    # tables created by a test are removed with the rollback of its transaction
+    catalog.invalidate()
+
+
 # --- User fixtures ---
 
 
@@ -2,17 +2,28 @@
 #
 # SPDX-License-Identifier: AGPL-3.0-only
 
+import base64
+import csv
 import datetime as dt
+import hashlib
+import json
+import math
+from contextlib import closing
+from decimal import Decimal
+from functools import wraps
 from io import BytesIO
 from typing import Literal
 
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from ninja import Field, Query, Router, Schema
 from ninja.errors import AuthorizationError
 from ninja.security import SessionAuth
-from psycopg import sql
+from psycopg import postgres, sql
 
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import connection
 from django.forms.models import model_to_dict
 from django.http import (
@@ -21,17 +32,49 @@ from django.http import (
     HttpResponseBadRequest,
     HttpResponseNotFound,
     JsonResponse,
+    StreamingHttpResponse,
 )
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
 from django.utils.text import slugify
 
 from datalayers.datasources.base_layer import LayerTimeResolution, LayerValueType
-from datalayers.models import Datalayer
+from datalayers.export import RESOLUTIONS, iter_export
+from datalayers.models import DATA_CHUNK_SIZE, Datalayer
 from datalayers.utils import get_conn_string
 from shapes.models import Shape, Type
 
 router = Router(tags=["Data Layers"])
 
+# Arrow types of the PostgreSQL column types, numeric is converted to float like
+# pandas.read_sql() does. The types of other columns are inferred from their values.
+ARROW_TYPES = {
+    "bool": pa.bool_(),
+    "int2": pa.int16(),
+    "int4": pa.int32(),
+    "int8": pa.int64(),
+    "float4": pa.float32(),
+    "float8": pa.float64(),
+    "numeric": pa.float64(),
+    "date": pa.date32(),
+    "time": pa.time64("us"),
+    "timestamp": pa.timestamp("us"),
+    "timestamptz": pa.timestamp("us", tz="UTC"),
+    "text": pa.string(),
+    "varchar": pa.string(),
+    "bpchar": pa.string(),
+}
+
+# Rows per record batch (parquet row group) of the arrow and parquet formats
+ARROW_CHUNK_SIZE = 64 * 1024
+
+# Formats of the data endpoint that are streamed and support pagination
+STREAMED_FORMATS = ["csv", "json", "ndjson", "parquet", "arrow"]
+
+# Rows per page of the data endpoint if only a cursor is given
+DATA_PAGE_SIZE = 10_000
+
 
 class DatalayerFilterSchema(Schema):
     datalayer_id: int | None = Field(
@@ -58,6 +101,343 @@ def _get_datalayer_from_request(request, filters) -> Datalayer:
     return get_object_or_404(Datalayer.objects.visible_to(request.user), **lookup)
 
 
+def _shapes_version() -> tuple[int, int, dt.datetime | None]:
+    """Number of shapes and types and when one was last updated, in one query."""
+    query = sql.SQL(
+        "SELECT s.count, t.count, GREATEST(s.updated_at, t.updated_at) "
+        "FROM (SELECT COUNT(*), MAX(updated_at) AS updated_at FROM {shapes}) AS s, "
+        "(SELECT COUNT(*), MAX(updated_at) AS updated_at FROM {types}) AS t"
+    ).format(
+        shapes=sql.Identifier(Shape._meta.db_table),
+        types=sql.Identifier(Type._meta.db_table),
+    )
+    with connection.cursor() as c:
+        c.execute(query.as_string(connection))
+        return c.fetchone()
+
+
+def _not_modified(request, *datalayers: Datalayer) -> HttpResponse | None:
+    """
+    Conditional request for a response computed from the Data Layers.
+
+    The ETag is derived from the request, the data versions of the Data Layers and
+    the version of the shapes (the responses include shape names, keys and types,
+    which loadshapes changes), so it is checked before any data query. Returns the
+    304 response if the client has the current version. The validators are added to
+    the response of the view by @_conditional.
+    """
+    shape_count, type_count, shapes_updated_at = _shapes_version()
+
+    version = ":".join(
+        [
+            request.get_full_path(),
+            *(
+                f"{dl.pk}-{dl.data_version}-{dl.updated_at.isoformat()}"
+                for dl in datalayers
+            ),
+            f"{shape_count}-{type_count}-{shapes_updated_at}",
+        ]
+    )
+    etag = quote_etag(hashlib.sha256(version.encode()).hexdigest()[:32])
+    last_modified = max(
+        d
+        for d in [
+            *(dl.updated_at for dl in datalayers),
+            *(dl.data_updated_at for dl in datalayers),
+            shapes_updated_at,
+        ]
+        if d is not None
+    )
+
+    request.datalayer_validators = (etag, last_modified)
+    return get_conditional_response(
+        request, etag=etag, last_modified=int(last_modified.timestamp())
+    )
+
+
+def _conditional(view):
+    """Add the ETag/Last-Modified of _not_modified() to the responses of the view."""
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+
+        validators = getattr(request, "datalayer_validators", None)
+        if validators is not None and response.status_code in [200, 304]:
+            etag, last_modified = validators
+            response["ETag"] = etag
+            response["Last-Modified"] = http_date(last_modified.timestamp())
+
+            # clients have to revalidate, the data changes with every processing
+            patch_cache_control(response, private=True, no_cache=True)
+
+        return response
+
+    return wrapper
+
+
+class _Echo:
+    """File-like object returning what is written, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def _clean_value(value):
+    # same values as pandas.read_sql() returns (coerce_float) with NaN as missing
+    if isinstance(value, Decimal):
+        value = float(value)
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def _stream_csv(chunks):
+    writer = csv.writer(_Echo(), lineterminator="\n")
+
+    # closing the response (i.e. client disconnected) ends the cursor transaction
+    with closing(chunks):
+        for i, (columns, rows) in enumerate(chunks):
+            lines = [writer.writerow([c.name for c in columns])] if i == 0 else []
+            lines += [writer.writerow([_clean_value(v) for v in row]) for row in rows]
+            yield "".join(lines)
+
+
+def _json_records(chunks):
+    for columns, rows in chunks:
+        names = [c.name for c in columns]
+        yield [
+            json.dumps(
+                dict(zip(names, map(_clean_value, row), strict=True)),
+                cls=DjangoJSONEncoder,
+            )
+            for row in rows
+        ]
+
+
+def _stream_json(chunks, meta: dict):
+    # the response is assembled from the meta data and the records, to be able to
+    # send it before all rows are read
+    yield json.dumps(meta, cls=DjangoJSONEncoder)[:-1] + ', "data": ['
+
+    with closing(chunks):
+        first = True
+        for records in _json_records(chunks):
+            if records:
+                yield ("" if first else ", ") + ", ".join(records)
+                first = False
+
+    yield "]}"
+
+
+def _stream_ndjson(chunks):
+    with closing(chunks):
+        for records in _json_records(chunks):
+            yield "".join(f"{record}\n" for record in records)
+
+
+class _ArrowSink:
+    """Output stream for the pyarrow writers, keeps the written bytes until taken."""
+
+    closed = False
+
+    def __init__(self) -> None:
+        self._buffers = []
+        self._position = 0
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._buffers.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = b"".join(self._buffers)
+        self._buffers = []
+        return data
+
+
+def _arrow_schema(columns, rows, meta: dict) -> pa.Schema:
+    """Schema of the columns, types that aren't in ARROW_TYPES are inferred from rows."""
+    fields = []
+    for i, column in enumerate(columns):
+        info = postgres.types.get(column.type_code)
+        arrow_type = ARROW_TYPES.get(info.name if info else None)
+        if arrow_type is None:
+            try:
+                arrow_type = pa.array([row[i] for row in rows]).type
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                arrow_type = pa.string()
+            # no values to infer the type from
+            if pa.types.is_null(arrow_type):
+                arrow_type = pa.string()
+        fields.append(pa.field(column.name, arrow_type))
+    return pa.schema(fields, metadata=meta)
+
+
+def _record_batch(schema: pa.Schema, rows) -> pa.RecordBatch:
+    arrays = []
+    for field, values in zip(schema, zip(*rows, strict=True), strict=True):
+        if pa.types.is_floating(field.type):
+            values = [_clean_value(v) for v in values]
+        elif pa.types.is_string(field.type):
+            values = [v if v is None or isinstance(v, str) else str(v) for v in values]
+        arrays.append(pa.array(values, type=field.type))
+    return pa.record_batch(arrays, schema=schema)
+
+
+def _stream_arrow(chunks, fmt: str, meta: dict):
+    sink = _ArrowSink()
+    writer = None
+
+    with closing(chunks):
+        for columns, rows in chunks:
+            if writer is None:
+                schema = _arrow_schema(columns, rows, meta)
+                if fmt == "parquet":
+                    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+                else:
+                    options = pa.ipc.IpcWriteOptions(compression="zstd")
+                    writer = pa.ipc.new_stream(sink, schema, options=options)
+
+            # one record batch (or parquet row group) per chunk
+            if rows:
+                writer.write_batch(_record_batch(schema, rows))
+            yield sink.take()
+
+    writer.close()
+    yield sink.take()
+
+
+def _encode_cursor(key: tuple) -> str:
+    """Opaque token of the (temporal, shape_id) key of the last row of a page."""
+    temporal, shape_id = key
+    if isinstance(temporal, dt.date):
+        temporal = temporal.isoformat()
+    token = json.dumps([str(temporal), shape_id]).encode()
+    return base64.urlsafe_b64encode(token).decode().rstrip("=")
+
+
+def _decode_cursor(datalayer: Datalayer, token: str) -> tuple:
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        temporal, shape_id = json.loads(base64.urlsafe_b64decode(padded))
+        key = (datalayer.parse_temporal(temporal), int(shape_id))
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+    if key[0] is None:
+        raise ValueError("Invalid cursor")
+    return key
+
+
+class _Prefetched:
+    """
+    Chunks of utils.iter_chunks() with the first one already fetched.
+
+    The query runs when the first chunk is fetched, so errors of it are raised before
+    the response is started and not after the status and first bytes are sent.
+    """
+
+    def __init__(self, chunks) -> None:
+        self._chunks = chunks
+        self._first = [next(chunks)]
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._first:
+            return self._first.pop()
+        return next(self._chunks)
+
+    def close(self) -> None:
+        self._chunks.close()
+
+
+def _streaming_response(fmt: str, chunks, name: str, meta: dict):
+    """Response of the streamed formats, see STREAMED_FORMATS."""
+    chunks = _Prefetched(chunks)
+
+    # JSON has the meta data next to the records, the other formats have no place
+    # for empty values
+    arrow_meta = {k: v for k, v in meta.items() if v is not None}
+
+    match fmt:
+        case "csv":
+            return StreamingHttpResponse(
+                _stream_csv(chunks),
+                content_type="text/csv; charset=utf-8",
+                headers={"Content-Disposition": f'attachment; filename="{name}.csv"'},
+            )
+        case "ndjson":
+            return StreamingHttpResponse(
+                _stream_ndjson(chunks), content_type="application/x-ndjson"
+            )
+        case "json":
+            return StreamingHttpResponse(
+                _stream_json(chunks, meta), content_type="application/json"
+            )
+        case "parquet":
+            return StreamingHttpResponse(
+                _stream_arrow(chunks, fmt, arrow_meta),
+                content_type="application/vnd.apache.parquet",
+                headers={
+                    "Content-Disposition": f'attachment; filename="{name}.parquet"'
+                },
+            )
+        case "arrow":
+            return StreamingHttpResponse(
+                _stream_arrow(chunks, fmt, arrow_meta),
+                content_type="application/vnd.apache.arrow.stream",
+                headers={
+                    "Content-Disposition": f'attachment; filename="{name}.arrows"'
+                },
+            )
+        case _:
+            raise ValueError(f"Unsupported streamed format {fmt}")
+
+
+def _resample_shapes(datalayer: Datalayer, resample: str, filters: dict):
+    """
+    Mean of the values of all shapes per period, as DataFrame.
+
+    The periods are timestamps, like pandas.resample() returns them.
+    """
+    query, params = datalayer.data_query(**filters)
+    temporal_column = str(datalayer.temporal_resolution)
+    query = sql.SQL(
+        "SELECT {bucket} AS {temporal_column}, "
+        "AVG(value)::double precision AS value "
+        "FROM ({query}) AS data GROUP BY 1 ORDER BY 1"
+    ).format(
+        bucket=datalayer.resample_column(resample),
+        temporal_column=sql.Identifier(temporal_column),
+        query=query,
+    )
+
+    df = pd.read_sql(query.as_string(connection), con=get_conn_string(), params=params)
+    df[temporal_column] = pd.to_datetime(df[temporal_column])
+    return df
+
+
+def _parse_temporal(value: str, resolution: LayerTimeResolution) -> dt.datetime:
+    """Parse a date of the format of the temporal resolution, raises ValueError."""
+    # we use ISO weeks exclusively so we need to tell the parser that it starts on monday.
+    if resolution == LayerTimeResolution.WEEK:
+        value += "-1"
+    return dt.datetime.strptime(value, resolution.format())
+
+
 @router.get("datalayer/", summary="Data Layer metadata")
 def datalayer(
     request,
@@ -161,6 +541,7 @@ def datalayer(
     summary="Data download",
     description="Access the harmonized data of a Data Layer.",
 )
+@_conditional
 def data(
     request,
     filters: DatalayerFilterSchema = Query(...),
@@ -186,17 +567,29 @@ def data(
     aggregate: Literal["sum", "min", "max", "mean", "median", "std", "count"]
     | None = Query(
         None,
-        description="[Pandas aggregate function](https://pandas.pydata.org/pandas-docs/stable/reference/api/pandas.DataFrame.aggregate.html) for `agg()` function to be applied before returning data.",
+        description="[Pandas aggregate function](https://pandas.pydata.org/pandas-docs/stable/reference/api/pandas.DataFrame.aggregate.html) applied to the values of each Shape, or of each period if resampled, before returning data.",
     ),
     resample: str | None = Query(
         None,
-        description="[Pandas Offset string](https://pandas.pydata.org/pandas-docs/stable/user_guide/timeseries.html#dateoffset-objects) for `resample()` function to be applied before returning data. Only works on plotly format.",
+        description="[Pandas Offset string](https://pandas.pydata.org/pandas-docs/stable/user_guide/timeseries.html#dateoffset-objects) to resample the values of each Shape before returning data, supported are `D`, `W`, `MS`, `ME`, `QS`, `QE`, `YS` and `YE`. The values of a period are aggregated with `aggregate` (`mean` by default).",
     ),
-    fmt: Literal["json", "csv", "excel", "plotly"] = Query(
+    fmt: Literal[
+        "json", "ndjson", "csv", "excel", "plotly", "parquet", "arrow"
+    ] = Query(
         "json",
-        description="File format of response.",
+        description="File format of response. JSON, NDJSON (one record per line), CSV, Parquet and Arrow (IPC stream) are streamed.",
         alias="format",
     ),
+    limit: int | None = Query(
+        None,
+        ge=1,
+        le=1_000_000,
+        description="Number of rows per page, ordered by time and Shape. The token of the next page is returned in the `X-Next-Cursor` header (and as `next_cursor` in JSON), absent on the last page. Not supported with `resample` or `aggregate`, for the Excel and Plotly formats and for Data Layers with multiple values per Shape and time.",
+    ),
+    cursor: str | None = Query(
+        None,
+        description=f"Token of the page to return, from the `X-Next-Cursor` header of the previous page. Pages have {DATA_PAGE_SIZE} rows if `limit` is not set.",
+    ),
 ):
     # determine filters
     datalayer = _get_datalayer_from_request(request, filters)
@@ -205,6 +598,10 @@ def data(
     if not datalayer.data_visible_to(request.user):
         raise AuthorizationError
 
+    not_modified = _not_modified(request, datalayer)
+    if not_modified is not None:
+        return not_modified
+
     shape = None
     if shape_id is not None:
         shape = get_object_or_404(Shape, pk=shape_id)
@@ -221,54 +618,96 @@ def data(
     start_date_obj = None
     end_date_obj = None
     if start_date:
-        # we use ISO weeks exclusively so we need to tell the parser that it starts on monday.
-        if datalayer.temporal_resolution == LayerTimeResolution.WEEK:
-            start_date += "-1"
         try:
-            start_date_obj = dt.datetime.strptime(
-                start_date, datalayer.temporal_resolution.format()
-            )
+            start_date_obj = _parse_temporal(start_date, datalayer.temporal_resolution)
         except ValueError:
             return HttpResponse(
                 f"Start date is not valid for data layer, needed format is `{datalayer.temporal_resolution.format()}`",
                 status=422,
             )
     if end_date:
-        # we use ISO weeks exclusively so we need to tell the parser that it starts on monday.
-        if datalayer.temporal_resolution == LayerTimeResolution.WEEK:
-            end_date += "-1"
-
         try:
-            end_date_obj = dt.datetime.strptime(
-                end_date, datalayer.temporal_resolution.format()
-            )
+            end_date_obj = _parse_temporal(end_date, datalayer.temporal_resolution)
         except ValueError:
             return HttpResponse(
                 f"End date is not valid for data layer, needed format is `{datalayer.temporal_resolution.format()}`",
                 status=422,
             )
 
-    # get data
-    df = datalayer.data(
-        start_date=start_date_obj,
-        end_date=end_date_obj,
-        shape=shape,
-        shape_type=shape_type,
-    )
+    # get data, resampled and/or aggregated by the database
+    resample = resample or None
+    filters = {
+        "start_date": start_date_obj,
+        "end_date": end_date_obj,
+        "shape": shape,
+        "shape_type": shape_type,
+        "resample": resample,
+        "aggregate": aggregate,
+    }
 
-    # if a aggregate function is presents
-    if aggregate:
-        df = df.groupby("dh_shape_id", as_index=False)["value"].agg(aggregate)
+    # keyset pagination, the key of the next page is determined before the rows are
+    # streamed, so it can be sent in the headers
+    paginated = limit is not None or cursor is not None
+    next_cursor = None
+    if paginated:
+        if fmt not in STREAMED_FORMATS:
+            return HttpResponse(
+                f"Pagination is only supported for the formats {', '.join(STREAMED_FORMATS)}",
+                status=422,
+            )
+
+        try:
+            filters["after"] = _decode_cursor(datalayer, cursor) if cursor else None
+            filters["limit"] = limit or DATA_PAGE_SIZE
+            next_key = datalayer.data_next_key(**filters)
+        except ValueError as e:
+            return HttpResponse(str(e), status=422)
+
+        if next_key is not None:
+            next_cursor = _encode_cursor(next_key)
+
+    # text formats are streamed from a server-side cursor, so large Data Layers
+    # don't need to fit into the memory of the worker
+    if fmt in STREAMED_FORMATS:
+        chunk_size = (
+            ARROW_CHUNK_SIZE if fmt in ["parquet", "arrow"] else DATA_CHUNK_SIZE
+        )
+        try:
+            chunks = datalayer.iter_data(**filters, chunk_size=chunk_size)
+        except ValueError as e:
+            return HttpResponse(str(e), status=422)
+
+        meta = {
+            "temporal_column": str(datalayer.temporal_resolution),
+            "temporal_format": datalayer.temporal_resolution.format_db(),
+        }
+        if paginated:
+            meta["next_cursor"] = next_cursor
+
+        response = _streaming_response(fmt, chunks, name, meta)
+
+        if next_cursor is not None:
+            query = request.GET.copy()
+            query["cursor"] = next_cursor
+            next_url = request.build_absolute_uri(f"{request.path}?{query.urlencode()}")
+            response["X-Next-Cursor"] = next_cursor
+            response["Link"] = f'<{next_url}>; rel="next"'
+
+        return response
+
+    try:
+        # the plotly trace is aggregated per shape, or resampled over all shapes
+        if fmt == "plotly" and resample and not aggregate:
+            df = _resample_shapes(datalayer, resample, {**filters, "resample": None})
+        elif fmt == "plotly":
+            df = datalayer.data(**{**filters, "resample": None})
+        else:
+            df = datalayer.data(**filters)
+    except ValueError as e:
+        return HttpResponse(str(e), status=422)
 
     # return data according to format
     match fmt:
-        case "csv":
-            file = BytesIO()
-            df.to_csv(file, index=False)
-            file.seek(0)
-            response = FileResponse(file, as_attachment=True, filename=f"{name}.csv")
-            response["Content-Type"] = "text/csv; charset=utf-8"
-            return response
         case "excel":
             file = BytesIO()
             df.to_excel(file, index=False)
@@ -276,16 +715,6 @@ def data(
             response = FileResponse(file, as_attachment=True, filename=f"{name}.xlsx")
             response["Content-Type"] = "application/vnd.ms-excel"
             return response
-        case "json":
-            return JsonResponse(
-                {
-                    "temporal_column": str(datalayer.temporal_resolution),
-                    "temporal_format": datalayer.temporal_resolution.format_db(),
-                    "data": df.fillna(np.nan)
-                    .replace([np.nan], [None])
-                    .to_dict("records"),
-                }
-            )
         case "plotly":
             if shape:
                 name = f"{shape.name} ({shape.type.name})"
@@ -309,15 +738,6 @@ def data(
                 }
                 return JsonResponse(json_data)
 
-            if resample and len(resample) > 0:
-                df[str(datalayer.temporal_resolution)] = pd.to_datetime(
-                    df[str(datalayer.temporal_resolution)]
-                )
-                df = df.set_index(str(datalayer.temporal_resolution))
-                df = df.resample(resample).mean()
-                df[str(datalayer.temporal_resolution)] = df.index
-                df = df.dropna()
-
             chart_type = "scatter"
             if datalayer.chart_type == "bar":
                 chart_type = "bar"
@@ -333,6 +753,131 @@ def data(
             return HttpResponseBadRequest("Invalid format")
 
 
+@router.get(
+    "export/",
+    summary="Joined data download of multiple Data Layers",
+    description="Access the harmonized data of multiple Data Layers joined by Shape and time, i.e., to build a feature matrix.",
+)
+@_conditional
+def export(
+    request,
+    datalayer_keys: str = Query(
+        ...,
+        description="Comma separated list of the keys of the Data Layers.",
+    ),
+    shape_id: int | None = Query(
+        None,
+        description="Filter to specific Shape by it's Data Hub ID.",
+    ),
+    shape_key: str | None = Query(
+        None,
+        description="Filter to specific Shape by it's key (takes precedence over shape_id if both are present).",
+    ),
+    shape_type_key: str | None = Query(
+        None, description="Filter to specific Shape Type", alias="shape_type"
+    ),
+    resolution: Literal["year", "month", "week", "date"] | None = Query(
+        None,
+        description="Temporal resolution of the rows, defaults to the coarsest one of the Data Layers. Values of finer Data Layers are aggregated, values of coarser ones are repeated for each period they contain. Weeks belong to the month and year of their Monday.",
+    ),
+    start_date: str | None = Query(
+        None,
+        description="Include only data at/after the given date. Format according to the resolution.",
+    ),
+    end_date: str | None = Query(
+        None,
+        description="Include only data before/at the given date. Format according to the resolution.",
+    ),
+    aggregate: Literal["sum", "min", "max", "mean", "median", "std", "count"] = Query(
+        "mean",
+        description="Aggregate function for the values of a period of finer Data Layers (and of Data Layers with multiple values per Shape and time). Boolean values support `min`, `max` and `count`, categorical ones only `count`.",
+    ),
+    layout: Literal["wide", "long"] = Query(
+        "wide",
+        description="`wide` has a column per Data Layer (named by its key), `long` a row per value with the key in the `datalayer` column.",
+    ),
+    fmt: Literal["json", "ndjson", "csv", "parquet", "arrow"] = Query(
+        "json",
+        description="File format of response.",
+        alias="format",
+    ),
+):
+    keys = [key.strip() for key in datalayer_keys.split(",") if key.strip()]
+    datalayers = Datalayer.objects.visible_to(request.user).in_bulk(
+        keys, field_name="key"
+    )
+
+    layers = []
+    for key in keys:
+        if key not in datalayers:
+            return HttpResponseNotFound(f"Data Layer {key} not found")
+        if not datalayers[key].data_visible_to(request.user):
+            raise AuthorizationError
+        if not datalayers[key].is_loaded():
+            return HttpResponseNotFound(f"Data Layer {key} has no data")
+        layers.append(datalayers[key])
+
+    not_modified = _not_modified(request, *layers)
+    if not_modified is not None:
+        return not_modified
+
+    name = "_".join(keys)
+
+    shape = None
+    if shape_id is not None:
+        shape = get_object_or_404(Shape, pk=shape_id)
+        name = f"{name}_{slugify(shape.name)}"
+    elif shape_key is not None:
+        shape = get_object_or_404(Shape, key=shape_key)
+        name = f"{name}_{slugify(shape.name)}"
+
+    shape_type = None
+    if shape_type_key is not None:
+        shape_type = get_object_or_404(Type, key=shape_type_key)
+
+    if resolution is not None:
+        resolution = LayerTimeResolution(resolution)
+    else:
+        resolution = max(
+            (dl.temporal_resolution for dl in layers), key=RESOLUTIONS.index
+        )
+
+    dates = {}
+    for param, value in [("start_date", start_date), ("end_date", end_date)]:
+        if not value:
+            continue
+        try:
+            dates[param] = _parse_temporal(value, resolution).date()
+        except ValueError:
+            return HttpResponse(
+                f"{param} is not valid for the resolution, needed format is `{resolution.format()}`",
+                status=422,
+            )
+
+    try:
+        chunks = iter_export(
+            layers,
+            chunk_size=ARROW_CHUNK_SIZE
+            if fmt in ["parquet", "arrow"]
+            else DATA_CHUNK_SIZE,
+            resolution=resolution,
+            layout=layout,
+            aggregate=aggregate,
+            shape=shape,
+            shape_type=shape_type,
+            **dates,
+        )
+    except ValueError as e:
+        return HttpResponse(str(e), status=422)
+
+    meta = {
+        "temporal_column": str(resolution),
+        "temporal_format": resolution.format_db(),
+        "layout": layout,
+    }
+    return _streaming_response(fmt, chunks, name, meta)
+
+
 @router.get(
     "vector/",
     summary="Data Layer vector data",
@@ -352,6 +897,7 @@ def vector(
 
 
 @router.get("plotly/", summary="Plotly min/max/mean traces")
+@_conditional
 def plotly(
     request,
     filters: DatalayerFilterSchema = Query(...),
@@ -368,6 +914,11 @@ def plotly(
     error_y: bool = False,
 ):
     datalayer = _get_datalayer_from_request(request, filters)
+
+    not_modified = _not_modified(request, datalayer)
+    if not_modified is not None:
+        return not_modified
+
     shape_type = get_object_or_404(Type, key=shape_type_key)
 
     # Aggregation over a shape type is not possible with categorical values
@@ -390,20 +941,35 @@ def plotly(
         temporal_column=sql.Identifier(str(datalayer.temporal_resolution)),
     )
 
+    # the mean/min/max traces are averaged over the periods by the database
+    if resample:
+        try:
+            bucket = datalayer.resample_column(resample)
+        except ValueError as e:
+            return HttpResponse(str(e), status=422)
+
+        query = sql.SQL(
+            "SELECT {bucket} AS {temporal_column}, AVG(value) AS value, AVG(min) AS min, AVG(max) AS max \
+            FROM ({query}) AS traces \
+            GROUP BY 1 \
+            ORDER BY 1"
+        ).format(
+            bucket=bucket,
+            temporal_column=sql.Identifier(str(datalayer.temporal_resolution)),
+            query=query,
+        )
+
     df = pd.read_sql(
         query.as_string(connection),
         con=get_conn_string(),
         params={"type": shape_type.id},
     )
 
-    if resample and len(resample) > 0:
+    # periods are timestamps, like pandas.resample() returns them
+    if resample:
         df[str(datalayer.temporal_resolution)] = pd.to_datetime(
             df[str(datalayer.temporal_resolution)]
         )
-        df = df.set_index(str(datalayer.temporal_resolution))
-        df = df.resample(resample).mean()
-        df[str(datalayer.temporal_resolution)] = df.index
-        df = df.dropna()
 
     if aggregate:
         start_date = datalayer.first_time()
@@ -465,12 +1031,17 @@ def plotly(
 
 
 @router.get("meta/", summary="Data Layer Meta and Plot configuration")
+@_conditional
 def meta(
     request,
     filters: DatalayerFilterSchema = Query(...),
 ):
     datalayer = _get_datalayer_from_request(request, filters)
 
+    not_modified = _not_modified(request, datalayer)
+    if not_modified is not None:
+        return not_modified
+
     layout = {
         "title": {
             "text": datalayer.name,
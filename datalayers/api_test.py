@@ -2,12 +2,19 @@
 #
 # SPDX-License-Identifier: AGPL-3.0-only
 
+import json
+from io import BytesIO
 from urllib.parse import urlencode
 
+import pyarrow as pa
+import pyarrow.parquet as pq
 import pytest
 
+from django.db import connection
 from django.urls import reverse
 
+from datalayers.models import Datalayer
+
 
 class TestMyModelView:
     @pytest.fixture(autouse=True)
@@ -97,3 +104,198 @@ class TestMyModelView:
         )
 
         assert response.status_code == 200
+
+    #
+    # Streamed formats
+    #
+    def test_data_streamed_formats(self, client, dl_listed):
+        url = reverse("api-1.0.0:data", args=[])
+
+        response = client.get(
+            f"{url}?{urlencode({'datalayer_key': dl_listed.key, 'format': 'csv'})}"
+        )
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        assert lines[0] == "dh_shape_id,shape_key,type_key,shape_name,year,value"
+        assert len(lines) == 21
+
+        response = client.get(
+            f"{url}?{urlencode({'datalayer_key': dl_listed.key, 'format': 'json'})}"
+        )
+        data = json.loads(b"".join(response.streaming_content))
+        assert data["temporal_column"] == "year"
+        assert [r["value"] for r in data["data"]] == list(range(1, 21))
+
+        response = client.get(
+            f"{url}?{urlencode({'datalayer_key': dl_listed.key, 'format': 'ndjson', 'aggregate': 'sum'})}"
+        )
+        records = b"".join(response.streaming_content).decode().splitlines()
+        assert [json.loads(r)["value"] for r in records] == [210]
+
+    def test_data_arrow_formats(self, client, dl_listed):
+        url = reverse("api-1.0.0:data", args=[])
+
+        response = client.get(
+            f"{url}?{urlencode({'datalayer_key': dl_listed.key, 'format': 'parquet'})}"
+        )
+        table = pq.read_table(BytesIO(b"".join(response.streaming_content)))
+        assert table.num_rows == 20
+        assert pa.types.is_integer(table.schema.field("year").type)
+        assert table.column("value").to_pylist() == list(range(1, 21))
+
+        response = client.get(
+            f"{url}?{urlencode({'datalayer_key': dl_listed.key, 'format': 'arrow', 'resample': 'YS'})}"
+        )
+        table = pa.ipc.open_stream(b"".join(response.streaming_content)).read_all()
+        assert table.schema.field("year").type == pa.date32()
+        assert table.schema.metadata[b"temporal_column"] == b"year"
+
+    def test_data_pagination(self, client, dl_listed):
+        url = reverse("api-1.0.0:data", args=[])
+        params = {"datalayer_key": dl_listed.key, "format": "ndjson", "limit": 8}
+
+        values = []
+        pages = 0
+        while True:
+            response = client.get(f"{url}?{urlencode(params)}")
+            records = b"".join(response.streaming_content).decode().splitlines()
+            values += [json.loads(r)["value"] for r in records]
+            pages += 1
+
+            if "X-Next-Cursor" not in response:
+                break
+            params["cursor"] = response["X-Next-Cursor"]
+
+        assert pages == 3
+        assert values == list(range(1, 21))
+
+        params["cursor"] = "invalid"
+        assert client.get(f"{url}?{urlencode(params)}").status_code == 422
+
+    #
+    # Joined export
+    #
+    def test_export(self, client, super_user, dl_listed, dl_private):
+        client.force_login(super_user)
+        url = reverse("api-1.0.0:export", args=[])
+        keys = f"{dl_listed.key},{dl_private.key}"
+
+        response = client.get(f"{url}?{urlencode({'datalayer_keys': keys})}")
+        data = json.loads(b"".join(response.streaming_content))
+        assert data["temporal_column"] == "year"
+        assert len(data["data"]) == 20
+        assert data["data"][0][dl_listed.key] == data["data"][0][dl_private.key]
+
+        # Data Layers with the resolution of the export aren't aggregated
+        response = client.get(
+            f"{url}?{urlencode({'datalayer_keys': keys, 'aggregate': 'std'})}"
+        )
+        data = json.loads(b"".join(response.streaming_content))
+        assert data["data"][0][dl_listed.key] is not None
+
+        response = client.get(
+            f"{url}?{urlencode({'datalayer_keys': keys, 'layout': 'long', 'start_date': '2020', 'format': 'ndjson'})}"
+        )
+        records = [
+            json.loads(r)
+            for r in b"".join(response.streaming_content).decode().splitlines()
+        ]
+        assert [r["datalayer"] for r in records] == [dl_listed.key, dl_private.key]
+
+        response = client.get(
+            f"{url}?{urlencode({'datalayer_keys': keys, 'resolution': 'month'})}"
+        )
+        assert response.status_code == 422
+
+    def test_export_text_month(self, client, super_user, dl_listed, shape_country):
+        client.force_login(super_user)
+        url = reverse("api-1.0.0:export", args=[])
+
+        dl = Datalayer.objects.create(key="test_monthly", name="Monthly")
+        dl.process([shape_country])
+        dl.get_class().save()
+
+        # month columns of restored dumps can be TEXT
+        with connection.cursor() as c:
+            c.execute("ALTER TABLE test_monthly ALTER COLUMN month TYPE text")
+
+        keys = f"{dl_listed.key},{dl.key}"
+        response = client.get(
+            f"{url}?{urlencode({'datalayer_keys': keys, 'start_date': '2020'})}"
+        )
+        data = json.loads(b"".join(response.streaming_content))
+        assert data["data"][0][dl.key] == 6.5
+
+        response = client.get(
+            f"{url}?{urlencode({'datalayer_keys': keys, 'resolution': 'month', 'format': 'ndjson'})}"
+        )
+        records = b"".join(response.streaming_content).decode().splitlines()
+        assert [json.loads(r)[dl.key] for r in records[-12:]] == list(range(1, 13))
+
+    #
+    # Conditional requests
+    #
+    def test_data_not_modified(self, client, dl_listed):
+        url = reverse("api-1.0.0:data", args=[])
+        url = f"{url}?{urlencode({'datalayer_key': dl_listed.key, 'format': 'csv'})}"
+
+        response = client.get(url)
+        etag = response["ETag"]
+        assert response.has_header("Last-Modified")
+
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+        assert response["ETag"] == etag
+
+        dl_listed.bump_data_version()
+
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        assert response["ETag"] != etag
+
+    def test_meta_not_modified_shapes(self, client, dl_listed, shape_country):
+        url = reverse("api-1.0.0:meta", args=[])
+        url = f"{url}?{urlencode({'datalayer_key': dl_listed.key})}"
+
+        etag = client.get(url)["ETag"]
+        assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+
+        # reloaded shapes change the response without a new data version
+        shape_country.name = "Renamed Country"
+        shape_country.save()
+
+        assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+    def test_export_not_modified(self, client, super_user, dl_listed, dl_private):
+        client.force_login(super_user)
+        url = reverse("api-1.0.0:export", args=[])
+        url = f"{url}?{urlencode({'datalayer_keys': f'{dl_listed.key},{dl_private.key}'})}"
+
+        etag = client.get(url)["ETag"]
+        assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+
+        dl_private.bump_data_version()
+
+        assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+    #
+    # Output format
+    #
+    def test_data_output_format(self, client, dl_listed):
+        url = reverse("api-1.0.0:data", args=[])
+
+        # values reduced per shape only have the shape id
+        response = client.get(
+            f"{url}?{urlencode({'datalayer_key': dl_listed.key, 'format': 'json', 'aggregate': 'sum'})}"
+        )
+        data = json.loads(b"".join(response.streaming_content))
+        assert data["data"] == [
+            {"dh_shape_id": data["data"][0]["dh_shape_id"], "value": 210}
+        ]
+
+        # the plotly trace of resampled values has timestamps
+        response = client.get(
+            f"{url}?{urlencode({'datalayer_key': dl_listed.key, 'format': 'plotly', 'resample': 'YS'})}"
+        )
+        trace = response.json()
+        assert trace["x"][0] == "2001-01-01T00:00:00"
+        assert trace["y"] == list(range(1, 21))
@@ -0,0 +1,90 @@
+# SPDX-FileCopyrightText: 2026 Jonathan Ströbele <mail@jonathanstroebele.de>
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import time
+from dataclasses import dataclass
+
+from django.core.cache import cache
+from django.db import connection, transaction
+
+# Key of the catalog version in the Django cache, shared by all processes (web
+# workers, management commands) so a save in one invalidates the others.
+VERSION_CACHE_KEY = "datalayers:catalog:version"
+
+# Seconds a process uses its catalog before checking the shared version again
+VERSION_CHECK_INTERVAL = 1.0
+
+
+@dataclass
+class TableInfo:
+    """Loaded table of the database."""
+
+    # estimated by the planner statistics, updated by ANALYZE after each save
+    rows: int
+
+
+class Catalog:
+    """
+    Tables in the database, with row counts.
+
+    Loaded with a single query on first use and kept for the whole process, so
+    checking if a Data Layer is loaded doesn't need a query. Changes of the tables
+    (save, reset, delete) have to call invalidate().
+    """
+
+    def __init__(self) -> None:
+        self._tables: dict[str, TableInfo] | None = None
+        self._version = None
+        self._checked_at = 0.0
+
+    def _load(self) -> dict[str, TableInfo]:
+        # same tables as connection.introspection.table_names()
+        query = """
+            SELECT c.relname, GREATEST(c.reltuples, 0)::bigint
+            FROM pg_catalog.pg_class AS c
+            JOIN pg_catalog.pg_namespace AS n ON n.oid = c.relnamespace
+            WHERE c.relkind IN ('r', 'p', 'v', 'f', 'm')
+                AND n.nspname NOT IN ('pg_catalog', 'pg_toast')
+                AND pg_catalog.pg_table_is_visible(c.oid)
+        """
+        with connection.cursor() as c:
+            c.execute(query)
+            return {name: TableInfo(rows=rows) for name, rows in c.fetchall()}
+
+    def _check_version(self) -> None:
+        now = time.monotonic()
+        if now - self._checked_at < VERSION_CHECK_INTERVAL:
+            return
+        self._checked_at = now
+
+        version = cache.get(VERSION_CACHE_KEY)
+        if version != self._version:
+            self._tables = None
+            self._version = version
+
+    @property
+    def tables(self) -> dict[str, TableInfo]:
+        self._check_version()
+        if self._tables is None:
+            self._tables = self._load()
+        return self._tables
+
+    def get(self, table: str) -> TableInfo | None:
+        return self.tables.get(table)
+
+    def __contains__(self, table: str) -> bool:
+        return table in self.tables
+
+    def invalidate(self) -> None:
+        """Reload the catalog in this and (on their next check) all other processes."""
+        self._tables = None
+        self._version = time.time_ns()
+        cache.set(VERSION_CACHE_KEY, self._version, timeout=None)
+
+        # other processes might reload before the changes are committed
+        if connection.in_atomic_block:
+            transaction.on_commit(self.invalidate)
+
+
+catalog = Catalog()
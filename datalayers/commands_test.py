@@ -0,0 +1,37 @@
+# SPDX-FileCopyrightText: 2026 Jonathan Ströbele <mail@jonathanstroebele.de>
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import pytest
+
+from django.core.management import call_command
+
+from datalayers.models import Datalayer
+
+
+@pytest.mark.django_db(transaction=True)
+def test_dl_process_jobs(shape_country):
+    # the workers use their own connections, so the data must be committed
+    for key in ["test_csv", "test_csv2"]:
+        Datalayer.objects.create(key=key, name=key)
+
+    call_command("dl_process", "test_csv,test_csv2", jobs=2)
+
+    for key in ["test_csv", "test_csv2"]:
+        dl = Datalayer.objects.get(key=key)
+        assert dl.is_loaded()
+        assert dl.count_values() == 20
+
+
+def test_dl_rename_indexes(dl_listed, shape_country):
+    call_command(
+        "dl_rename", "test_csv", "test_csv_renamed", rename_model=True, rename_db=True
+    )
+
+    # the indexes of the renamed table don't clash with the ones of a new table
+    dl = Datalayer.objects.create(key="test_csv", name="Data Layer 1")
+    dl.process([shape_country])
+    dl.get_class().save()
+
+    assert dl.is_loaded()
+    assert Datalayer.objects.get(key="test_csv_renamed").count_values() == 20
@@ -3,6 +3,7 @@
 # SPDX-License-Identifier: AGPL-3.0-only
 
 import datetime as dt
+import hashlib
 import os
 import subprocess
 from enum import Enum
@@ -13,13 +14,23 @@ import geopandas
 import numpy as np
 import pandas as pd
 from psycopg import sql
+from sqlalchemy.types import Date
 
-from django.db import connection
+from django.db import connection, transaction
 from django.utils import formats
 from django.utils.translation import gettext as _
 
+from datalayers.catalog import catalog
+from datalayers.loader import (
+    copy_dataframe,
+    create_indexes,
+    has_unique_index,
+    upsert_query,
+)
 from datalayers.utils import get_conn_string, get_engine
 
+from .value_buffer import ValueBuffer, date_to_days
+
 
 class LayerTimeResolution(Enum):
     YEAR = "year"
@@ -109,9 +120,24 @@ class BaseLayer:
     def __init__(self) -> None:
         self.layer = None
         self.output = "db"
-        self.rows = []
         self.df = None
 
+        # Values collected by add_value(), created on the first value since time_col
+        # is usually set in the __init__() of derived classes.
+        self.buffer: ValueBuffer | None = None
+
+        # Legacy: rows appended as dicts directly to this list are still saved, new
+        # Data Layers should always use add_value().
+        self.rows = []
+
+        # Set of (shape_id, temporal) of all added values, built on the first call of
+        # has_value() and kept up to date by add_value() from then on.
+        self._value_index: set[tuple[int, int]] | None = None
+
+        # If set add_value() raises an error for a shape/temporal that already has a
+        # value, instead of silently storing a duplicate.
+        self.reject_duplicate_values = False
+
         self.time_col: LayerTimeResolution = LayerTimeResolution.YEAR
         self.value_type: LayerValueType = LayerValueType.VALUE
 
@@ -139,6 +165,25 @@ class BaseLayer:
         # https://pandas.pydata.org/docs/reference/api/pandas.DataFrame.to_sql.html
         self.pandas_to_sql_dtype: dict | None = None
 
+        # Flush the collected values in chunks into a staging table while process()
+        # runs, once the buffer holds more rows/bytes than set here. save() then
+        # swaps the staging table in. Columns are typed by the first chunk, so use
+        # property_dtypes/pandas_to_sql_dtype for columns with varying types.
+        self.flush_max_rows: int | None = None
+        self.flush_max_bytes: int | None = None
+        self._flushed_rows = 0
+
+        # Optional numpy dtypes (int64, float64, bool, object) of custom columns in
+        # add_value(properties={...}). Not declared columns are inferred from values.
+        self.property_dtypes: dict[str, str] | None = None
+
+        # Only process what is new since the last save (source files, time ranges)
+        # and append it to the existing table, see is_source_processed().
+        self.incremental = False
+
+        # Source files marked by mark_source_processed(), stored by save()
+        self._processed_sources: dict[str, dict] = {}
+
     @property
     def key(self):
         return self.layer.key
@@ -235,46 +280,392 @@ class BaseLayer:
                 f"Processed value ({value}) is not matching Data Layer ({self.value_type})."
             )
 
-        if properties is None:
-            properties = {}
+        if self.reject_duplicate_values or self._value_index is not None:
+            index = self._get_value_index()
+            key = (shape.id, self._temporal_key(temporal))
 
-        self.rows.append(
-            {
-                f"{str(self.time_col)}": temporal,
-                "shape_id": shape.id,
-                "value": value,
-            }
-            | properties
-        )
+            if self.reject_duplicate_values and key in index:
+                raise ValueError(
+                    f"Value for shape (id={shape.id}) and temporal ({temporal}) already added."
+                )
+
+            index.add(key)
+
+        self.get_buffer().append(temporal, shape.id, value, properties)
+
+        if self._should_flush():
+            self.flush()
+
+    def merge_values(self, buffer: ValueBuffer | None, rows: list | None = None):
+        """Add values collected by another instance of the Data Layer class."""
+        if buffer is not None and len(buffer) > 0:
+            if self.reject_duplicate_values or self._value_index is not None:
+                index = self._get_value_index()
+                keys = set(zip(buffer.shape_id, buffer.temporal))
+
+                if self.reject_duplicate_values and not index.isdisjoint(keys):
+                    shape_id, _ = next(iter(index & keys))
+                    raise ValueError(
+                        f"Value for shape (id={shape_id}) already added for the same temporal."
+                    )
+
+                index.update(keys)
+
+            self.get_buffer().extend(buffer)
+
+        if rows:
+            self.rows.extend(rows)
+
+        if self._should_flush():
+            self.flush()
+
+    def get_buffer(self) -> ValueBuffer:
+        if self.buffer is None:
+            self.buffer = ValueBuffer(
+                str(self.time_col),
+                temporal_is_date=self.time_col != LayerTimeResolution.YEAR,
+                property_dtypes=self.property_dtypes,
+            )
+        return self.buffer
+
+    def _temporal_key(self, temporal) -> int:
+        if isinstance(temporal, dt.date):
+            return date_to_days(temporal)
+        return int(temporal)
+
+    def _get_value_index(self) -> set[tuple[int, int]]:
+        if self._value_index is None:
+            index = set()
+            if self.buffer is not None:
+                index.update(zip(self.buffer.shape_id, self.buffer.temporal))
+
+            # Note: rows appended directly to self.rows after the index has been
+            # built are not tracked.
+            temporal_column = str(self.time_col)
+            for row in self.rows:
+                index.add((row["shape_id"], self._temporal_key(row[temporal_column])))
+
+            # values already flushed into the staging table
+            if self._flushed_rows > 0:
+                query = sql.SQL("SELECT shape_id, {temporal} FROM {table}").format(
+                    temporal=sql.Identifier(temporal_column),
+                    table=sql.Identifier(self.get_staging_table()),
+                )
+                with connection.cursor() as c:
+                    c.execute(query)
+                    for shape_id, temporal in c.fetchall():
+                        index.add((shape_id, self._temporal_key(temporal)))
+
+            self._value_index = index
+
+        return self._value_index
 
     def has_value(self, shape, temporal) -> bool:
         """Check if a value for the given shape/temporal is already collected."""
-        for row in self.rows:
-            if row["shape_id"] == shape.id and row[f"{str(self.time_col)}"] == temporal:
-                return True
-
-        return False
+        return (shape.id, self._temporal_key(temporal)) in self._get_value_index()
 
     def len_values(self) -> int:
         """Get the amount of added values."""
-        return len(self.rows)
+        if self.df is not None:
+            return len(self.df)
 
-    def save(self, *, db_if_exists: str = "replace", fs_path: Path | None = None):
-        if self.df is None:
-            self.df = pd.DataFrame(self.rows)
+        count = len(self.rows) + self._flushed_rows
+        if self.buffer is not None:
+            count += len(self.buffer)
+        return count
 
-        if self.output == "db":
-            self.df.to_sql(
-                self.layer.key,
-                get_engine(),
-                index=False,
-                if_exists=db_if_exists,
-                dtype=self.pandas_to_sql_dtype,
+    def get_df(self) -> pd.DataFrame:
+        """
+        DataFrame of the collected values, views of the buffer where possible.
+
+        Values already flushed into the staging table are not included.
+        """
+        if self.df is not None:
+            return self.df
+
+        if self.buffer is not None:
+            df = self.buffer.to_dataframe()
+        else:
+            df = pd.DataFrame()
+
+        if self.rows:
+            df = pd.concat([df, pd.DataFrame(self.rows)], ignore_index=True)
+
+        return df
+
+    def get_sql_dtype(self) -> dict | None:
+        """Column types for the table, dates collected by add_value() are datetime64."""
+        if self.df is not None or self.time_col == LayerTimeResolution.YEAR:
+            return self.pandas_to_sql_dtype
+
+        return {str(self.time_col): Date()} | (self.pandas_to_sql_dtype or {})
+
+    def _source_hash(self, path: Path) -> str:
+        file_hash = hashlib.sha256()
+        with Path(path).open("rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                file_hash.update(chunk)
+        return file_hash.hexdigest()
+
+    def is_source_processed(self, path: Path, shapes) -> bool:
+        """
+        Check if a source file has been processed for all shapes and saved and is
+        unchanged since.
+
+        Files with the same size and modification time are unchanged. If only the
+        modification time differs (i.e., the file was downloaded again), the hash of
+        the content decides. A file processed for only some of the shapes (i.e., with
+        --shape-type or before shapes were added) has to be processed again.
+        """
+        if self.layer is None:
+            return False
+
+        source = self.layer.processed_sources.filter(name=Path(path).as_posix()).first()
+        if source is None:
+            return False
+
+        if not {shape.id for shape in shapes} <= set(source.shape_ids):
+            return False
+
+        stat = Path(path).stat()
+        if source.size != stat.st_size:
+            return False
+        if source.mtime == stat.st_mtime_ns:
+            return True
+
+        if not source.hash:
+            return False
+
+        file_hash = self._source_hash(path)
+        if source.hash != file_hash:
+            return False
+
+        # same content, remember the new modification time
+        self.mark_source_processed(path, shapes, file_hash=file_hash)
+        return True
+
+    def mark_source_processed(
+        self, path: Path, shapes, file_hash: str | None = None
+    ) -> None:
+        """
+        Remember a source file as processed for the shapes, it's stored by the next
+        save().
+
+        The content is only hashed in incremental mode, so full runs don't read all
+        files again.
+        """
+        if file_hash is None and self.incremental:
+            file_hash = self._source_hash(path)
+
+        stat = Path(path).stat()
+        self._processed_sources[Path(path).as_posix()] = {
+            "size": stat.st_size,
+            "mtime": stat.st_mtime_ns,
+            "hash": file_hash or "",
+            "shape_ids": sorted({shape.id for shape in shapes}),
+        }
+
+    def _save_processed_sources(self, *, replace: bool) -> None:
+        if self.layer is None:
+            return
+
+        # a replaced table only contains the values of the current run
+        if replace:
+            self.layer.processed_sources.all().delete()
+
+        for name, fields in self._processed_sources.items():
+            source = None
+            if not replace:
+                source = self.layer.processed_sources.filter(name=name).first()
+
+            # the values of other shapes from the same file are kept in the table
+            if source is not None and source.size == fields["size"]:
+                if source.mtime == fields["mtime"] or (
+                    source.hash and source.hash == fields["hash"]
+                ):
+                    fields["shape_ids"] = sorted(
+                        set(fields["shape_ids"]) | set(source.shape_ids)
+                    )
+
+            self.layer.processed_sources.update_or_create(name=name, defaults=fields)
+        self._processed_sources = {}
+
+    def get_processed_until(self, shape=None):
+        """
+        Latest point in time with a saved value (of the shape), None if not loaded.
+
+        Data Layers without source files (APIs) use this in incremental mode to
+        only fetch/process the time range after it.
+        """
+        if self.layer is None or not self.layer.is_loaded():
+            return None
+        return self.layer.last_time(shape=shape)
+
+    def get_staging_table(self) -> str:
+        return f"_{self.key}_staging"
+
+    def _should_flush(self) -> bool:
+        if self.output != "db" or self.layer is None or self.buffer is None:
+            return False
+
+        if self.flush_max_rows is not None and len(self.buffer) >= self.flush_max_rows:
+            return True
+
+        return (
+            self.flush_max_bytes is not None
+            and self.buffer.nbytes >= self.flush_max_bytes
+        )
+
+    def _write_staging(self, df: pd.DataFrame) -> None:
+        # The first chunk replaces a staging table left behind by a crashed run
+        copy_dataframe(
+            df,
+            self.get_staging_table(),
+            if_exists="replace" if self._flushed_rows == 0 else "append",
+            dtype=self.get_sql_dtype(),
+        )
+        self._flushed_rows += len(df)
+
+    def flush(self) -> None:
+        """Write the collected values into the staging table and free the memory."""
+        if self.df is not None:
+            # DataFrames set by the Data Layer class are kept, save() can be called
+            # multiple times
+            self._write_staging(self.df)
+        elif self.len_values() > self._flushed_rows:
+            self._write_staging(self.get_df())
+
+        if self.buffer is not None:
+            self.buffer.clear()
+        self.rows = []
+
+    def discard(self) -> None:
+        """Drop values flushed into the staging table, i.e., for dry runs."""
+        if self._flushed_rows == 0:
+            return
+
+        query = sql.SQL("DROP TABLE IF EXISTS {table}").format(
+            table=sql.Identifier(self.get_staging_table())
+        )
+        with connection.cursor() as c:
+            c.execute(query)
+
+        self._flushed_rows = 0
+
+    def _swap_staging(self, db_if_exists: str) -> None:
+        """Move the staging table into place, in one transaction."""
+        table = sql.Identifier(self.layer.key)
+        staging = sql.Identifier(self.get_staging_table())
+
+        with transaction.atomic(), connection.cursor() as c:
+            exists = self.layer.key in connection.introspection.table_names(c)
+
+            if exists and db_if_exists == "fail":
+                raise ValueError(f"Table {self.layer.key} already exists.")
+
+            replace = not (exists and db_if_exists in ("append", "upsert"))
+            if not replace:
+                columns = [
+                    col.name
+                    for col in connection.introspection.get_table_description(
+                        c, self.get_staging_table()
+                    )
+                ]
+
+                if db_if_exists == "upsert":
+                    c.execute(self._upsert_query(columns))
+                else:
+                    c.execute(
+                        sql.SQL(
+                            "INSERT INTO {table} ({columns}) SELECT {columns} FROM {staging}"
+                        ).format(
+                            table=table,
+                            columns=sql.SQL(", ").join(map(sql.Identifier, columns)),
+                            staging=staging,
+                        )
+                    )
+                c.execute(sql.SQL("DROP TABLE {staging}").format(staging=staging))
+            else:
+                c.execute(sql.SQL("DROP TABLE IF EXISTS {table}").format(table=table))
+                c.execute(
+                    sql.SQL("ALTER TABLE {staging} RENAME TO {table}").format(
+                        staging=staging, table=table
+                    )
+                )
+
+            # after the bulk load, building the indexes once is much faster than
+            # updating them for every row
+            create_indexes(self.layer.key, str(self.time_col))
+
+            self._save_processed_sources(replace=replace)
+            catalog.invalidate()
+            self.layer.update_stats()
+            self.layer.bump_data_version()
+
+        self._flushed_rows = 0
+
+    def _upsert_query(self, columns: list[str]) -> sql.Composed:
+        key = ["shape_id", str(self.time_col)]
+
+        # tables saved before the unique index existed get it now
+        create_indexes(self.layer.key, str(self.time_col))
+        if not has_unique_index(self.layer.key, key):
+            raise ValueError(
+                f"Table {self.layer.key} has no unique index on {', '.join(key)} "
+                "(it contains duplicate values), use replace instead of upsert."
             )
+
+        return upsert_query(self.layer.key, self.get_staging_table(), columns, key)
+
+    def _clear_values(self) -> None:
+        self.df = None
+        if self.buffer is not None:
+            self.buffer.clear()
+        self.rows = []
+        self._value_index = None
+
+    def save(self, *, db_if_exists: str = "replace", fs_path: Path | None = None):
+        if self.output == "db":
+            if (
+                self.incremental
+                and self.layer.key in connection.introspection.table_names()
+            ):
+                if self.len_values() == 0:
+                    # nothing new, but sources with a new modification time and the
+                    # same content are remembered
+                    with transaction.atomic():
+                        self._save_processed_sources(replace=False)
+                    return
+
+                # new values are merged into the already saved ones
+                if db_if_exists == "replace":
+                    db_if_exists = (
+                        "upsert"
+                        if has_unique_index(
+                            self.layer.key, ["shape_id", str(self.time_col)]
+                        )
+                        else "append"
+                    )
+
+            # Everything is written into the staging table first and then swapped
+            # in, so a crash never leaves a half written table behind.
+            if self._flushed_rows == 0 and self.len_values() == 0:
+                self._write_staging(self.get_df())
+            else:
+                self.flush()
+
+            self._swap_staging(db_if_exists)
+
+            # values are appended, a second save() must not add them again
+            if self.incremental:
+                self._clear_values()
         elif self.output == "fs":
+            if self._flushed_rows > 0:
+                raise ValueError("Values have already been flushed to the database.")
+
             if fs_path is None:
                 fs_path = self.get_data_path() / f"{self.layer.key}.csv"
-            self.df.to_csv(fs_path, index=False)
+            self.get_df().to_csv(fs_path, index=False)
         else:
             raise ValueError(f"Unknown save option {self.output}.")
 
@@ -3,7 +3,9 @@
 # SPDX-License-Identifier: AGPL-3.0-only
 
 import datetime as dt
+from types import SimpleNamespace
 
+import numpy as np
 import pytest
 
 from .base_layer import BaseLayer, LayerTimeResolution, LayerValueType
@@ -66,3 +68,47 @@ def test_layer_is_valid_value():
     layer.ordinal_values = ["low", "high"]
     assert layer.is_valid_value("high") is True
     assert layer.is_valid_value("extreme") is False
+
+
+def test_layer_add_value():
+    shape = SimpleNamespace(id=1)
+
+    layer = BaseLayer()
+    layer.time_col = LayerTimeResolution.YEAR
+    layer.value_type = LayerValueType.FLOAT
+
+    layer.add_value(shape, 2000, 1.0)
+    layer.add_value(shape, 2001, 2.0, properties={"value_std": 0.5})
+
+    assert layer.len_values() == 2
+
+    df = layer.get_df()
+    assert list(df.columns) == ["year", "shape_id", "value", "value_std"]
+    assert df["year"].tolist() == [2000, 2001]
+    assert np.isnan(df.at[0, "value_std"])
+
+    with pytest.raises(ValueError):
+        layer.add_value(shape, 2002, "foo")
+
+
+def test_layer_has_value():
+    shape = SimpleNamespace(id=1)
+
+    layer = BaseLayer()
+    layer.time_col = LayerTimeResolution.DAY
+    layer.add_value(shape, dt.date(2000, 1, 1), 1.0)
+
+    assert layer.has_value(shape, dt.date(2000, 1, 1)) is True
+    assert layer.has_value(shape, dt.date(2000, 1, 2)) is False
+
+    # index is kept up to date after the first lookup
+    layer.add_value(shape, dt.date(2000, 1, 2), 1.0)
+    assert layer.has_value(shape, dt.date(2000, 1, 2)) is True
+    assert layer.has_value(SimpleNamespace(id=2), dt.date(2000, 1, 2)) is False
+
+    layer = BaseLayer()
+    layer.reject_duplicate_values = True
+    layer.add_value(shape, 2000, 1.0)
+    with pytest.raises(ValueError):
+        layer.add_value(shape, 2000, 2.0)
+    assert layer.len_values() == 1
@@ -0,0 +1,122 @@
+# SPDX-FileCopyrightText: 2026 Jonathan Ströbele <mail@jonathanstroebele.de>
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+from pathlib import Path
+
+import numpy as np
+import rasterio
+
+from shapes.models import Shape
+
+from .tiff_layer import TiffLayer
+from .zonal import HistogramStore, band_histogram, class_histograms
+
+
+class CategoricalLayer(TiffLayer):
+    """
+    Extends TiffLayer for GeoTiffs with class values (land cover, climate zones).
+
+    Instead of consume() per shape band, derived Data Layers implement
+    consume_histogram() and get the number of cells per class value of a shape.
+    The histograms of all shapes are computed in one pass over each file and stored
+    next to it, so all Data Layers derived from the same files share them.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+
+        # Use the stored histograms, otherwise every shape band is passed through
+        # consume() as with a TiffLayer.
+        self.use_histograms = True
+
+        # Size of the windows read for the histograms, see TiffLayer.window_max_bytes
+        self.histogram_window_max_bytes = 64 * 1024 * 1024
+
+    def consume_histogram(self, file, histogram: np.ndarray, shape):
+        """
+        Implement this method in the Derived Data Layer.
+
+        histogram[value] is the number of cells of the shape with the class value.
+        With coverage_weights it's the covered area in cells, so a fraction.
+        """
+        raise NotImplementedError
+
+    def consume(self, file, band, shape):
+        self.consume_histogram(file, band_histogram(band), shape)
+
+    def consume_weighted(self, file, band, weights, shape):
+        self.consume_histogram(file, band_histogram(band, weights), shape)
+
+    def count_cells(self, histogram: np.ndarray, values):
+        """Number of cells with any of the given class values."""
+        # summed by numpy like histogram.sum(), so weighted counts of all classes match
+        classes = sorted({value for value in values if value < len(histogram)})
+        return histogram[classes].sum()
+
+    def get_histogram_store(self, path: Path) -> HistogramStore:
+        name = "coverage-histograms" if self.coverage_weights else "histograms"
+        return HistogramStore(path.with_name(f"{path.name}.{name}.npz"), path)
+
+    def get_histograms(self, param_dir, file, shapes) -> HistogramStore:
+        """Stored histograms of the file, missing shapes are added."""
+        path = param_dir / file
+        store = self.get_histogram_store(path)
+
+        missing = [
+            shape
+            for shape in shapes
+            if store.get(shape.id, self.get_shape_version(shape)) is None
+        ]
+        if not missing:
+            return store
+
+        with rasterio.open(path) as src:
+            nodata = self.get_nodata(src, file)
+            cache = self.get_pixel_cache(src)
+
+            pixels = [self.get_shape_pixels(src, shape, cache) for shape in missing]
+            counts = class_histograms(
+                src,
+                pixels,
+                nodata,
+                self.window_max_bytes or self.histogram_window_max_bytes,
+            )
+
+            if cache is not None:
+                cache.save()
+
+        for shape, p, histogram in zip(missing, pixels, counts, strict=True):
+            store.add(shape.id, self.get_shape_version(shape), p.overlaps, histogram)
+        store.save()
+
+        return store
+
+    def process_files(self, param_dir, files, shapes):
+        shapes = list(shapes)
+
+        # histograms are stored per shape model, parallel processing works on bands
+        parallel = self.workers is not None and self.workers > 1
+        if (
+            not self.use_histograms
+            or parallel
+            or not all(isinstance(shape, Shape) for shape in shapes)
+        ):
+            super().process_files(param_dir, files, shapes)
+            return
+
+        for file in files:
+            store = self.get_histograms(param_dir, file, shapes)
+
+            for shape in shapes:
+                overlaps, histogram = store.get(shape.id, self.get_shape_version(shape))
+
+                # in case the GeoTiff is not overlapping with the current shape
+                if not overlaps:
+                    continue
+
+                if histogram.sum() == 0:
+                    self.warn_no_cells(file, shape)
+                    continue
+
+                self.consume_histogram(file, histogram, shape)
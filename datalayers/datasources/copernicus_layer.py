@@ -6,13 +6,11 @@ import os
 import re
 from pathlib import Path
 
-import numpy as np
-
 from datalayers.datasources.base_layer import LayerValueType
-from datalayers.datasources.tiff_layer import TiffLayer
+from datalayers.datasources.categorical_layer import CategoricalLayer
 
 
-class CopernicusLayer(TiffLayer):
+class CopernicusLayer(CategoricalLayer):
     """Extends TiffParameter class for Copernicus consumption."""
 
     def __init__(self) -> None:
@@ -75,25 +73,14 @@ class CopernicusLayer(TiffLayer):
 
         raise ValueError(f"Unknown Copernicus mapping key: {key}.")
 
-    def consume(self, file, band, shape):
+    def consume_histogram(self, file, histogram, shape):
         x = re.search(r"([0-9]{4})", os.path.basename(file))
         year = int(x[1])
 
-        total_cells = np.count_nonzero(~np.isnan(band))
-        values, count = np.unique(band, return_counts=True)
-        stats = dict(zip(values, count))
-
-        aoi_cells = 0
-        for key in self.area_of_interest:
-            val = self.get_value_for_key(key)
-
-            if val in stats:
-                aoi_cells += stats[val]
-
-        self.rows.append(
-            {
-                "year": year,
-                "shape_id": shape.id,
-                "value": aoi_cells / total_cells,
-            }
+        total_cells = histogram.sum()
+        aoi_cells = self.count_cells(
+            histogram, [self.get_value_for_key(key) for key in self.area_of_interest]
         )
+
+        # float coverage weights can add up to slightly more than the total
+        self.add_value(shape, year, min(aoi_cells / total_cells, 1.0))
@@ -6,13 +6,11 @@ import subprocess
 from enum import Enum
 from pathlib import Path
 
-import numpy as np
-
 from datalayers.datasources.base_layer import LayerTimeResolution, LayerValueType
-from datalayers.datasources.tiff_layer import TiffLayer
+from datalayers.datasources.categorical_layer import CategoricalLayer
 
 
-class KoeppenLayer(TiffLayer):
+class KoeppenLayer(CategoricalLayer):
     """Extends TiffParameter class for Koeppen data consumption."""
 
     class ClimateTypes(Enum):
@@ -125,16 +123,13 @@ class KoeppenLayer(TiffLayer):
 
         return files
 
-    def consume(self, file, band, shape):
-        total_cells = np.count_nonzero(~np.isnan(band))
-        values, count = np.unique(band, return_counts=True)
-        stats = dict(zip(values, count, strict=True))
-
-        aoi_cells = 0
-        for climate_type in self.climate_types:
-            if climate_type.value in stats:
-                aoi_cells += stats[climate_type.value]
-        proportion = aoi_cells / total_cells
+    def consume_histogram(self, file, histogram, shape):
+        total_cells = histogram.sum()
+        aoi_cells = self.count_cells(
+            histogram, [climate_type.value for climate_type in self.climate_types]
+        )
+        # float coverage weights can add up to slightly more than the total
+        proportion = min(aoi_cells / total_cells, 1.0)
 
         year_start = int(file[0:4])
         year_end = int(file[5:9])
@@ -36,11 +36,6 @@ class MeteostatLayer(BaseLayer):
         self.meteo_mode = "daily"  # do we need daily or hourly data?
         self.col_of_interest = None
 
-        # Meteostat can't handle Path() object
-        Stations.cache_dir = self.get_data_path().as_posix()
-        Daily.cache_dir = self.get_data_path().as_posix()
-        Hourly.cache_dir = self.get_data_path().as_posix()
-
     def get_data_path(self) -> Path:
         """Overwrite parameter_id based input directory."""
         return Path("./data/datalayers/meteostat/")
@@ -54,7 +49,21 @@ class MeteostatLayer(BaseLayer):
     def end(self) -> dt.datetime:
         raise NotImplementedError
 
+    def set_cache_dir(self) -> None:
+        """
+        Let Meteostat cache into the data directory.
+
+        Sets a class attribute of the Meteostat library, so it's done right before
+        downloading and not when the Data Layer class is created.
+        """
+        # Meteostat can't handle Path() object
+        Stations.cache_dir = self.get_data_path().as_posix()
+        Daily.cache_dir = self.get_data_path().as_posix()
+        Hourly.cache_dir = self.get_data_path().as_posix()
+
     def download(self):
+        self.set_cache_dir()
+
         df = self.stations().fetch()
 
         # Meteostat ID is not always numerical. Safe the internal Meteostat ID
@@ -254,6 +263,11 @@ class MeteostatLayer(BaseLayer):
 
             dfn = self.consume(df, shape)
 
+            if self.incremental:
+                processed_until = self.get_processed_until(shape)
+                if processed_until is not None:
+                    dfn = dfn[dfn["date"] > processed_until]
+
             dfns.append(dfn)
 
         self.df = pd.concat(dfns)
@@ -0,0 +1,365 @@
+# SPDX-FileCopyrightText: 2026 Jonathan Ströbele <mail@jonathanstroebele.de>
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import hashlib
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import shapely
+from rasterio.errors import WindowError
+from rasterio.features import geometry_mask, geometry_window
+from rasterio.windows import Window, union
+
+# One row per shape in the index file of a cache segment, the pixel indices of the
+# shape are indices[start:stop] of the segment.
+_INDEX_DTYPE = np.dtype(
+    [
+        ("shape_id", "i8"),
+        ("updated_at", "i8"),
+        ("row_off", "i8"),
+        ("col_off", "i8"),
+        ("height", "i8"),
+        ("width", "i8"),
+        ("start", "i8"),
+        ("stop", "i8"),
+    ]
+)
+
+
+@dataclass
+class ShapePixels:
+    """
+    Pixels of a raster grid covered by a shape.
+
+    `window` is the window rasterio.mask.mask(crop=True) would read for the shape
+    and `indices` the flat indices of the covered pixels inside of it. The window is
+    None if the shape does not overlap the raster. `weights` holds the covered
+    fraction (0-1] of each pixel, if the pixels were computed by
+    rasterize_coverage().
+    """
+
+    window: Window | None
+    indices: np.ndarray
+    weights: np.ndarray | None = None
+
+    @property
+    def overlaps(self) -> bool:
+        return self.window is not None
+
+
+def grid_key(src) -> str:
+    """Identify the grid (CRS, transform and size) of an opened raster."""
+    crs = src.crs.to_wkt() if src.crs else ""
+    grid = f"{crs}|{tuple(src.transform)[:6]}|{src.width}x{src.height}"
+    return hashlib.sha256(grid.encode()).hexdigest()[:16]
+
+
+def rasterize(src, geometries: list) -> ShapePixels:
+    """Pixels of the shape, the same cells rasterio.mask.mask(crop=True) selects."""
+    try:
+        window = geometry_window(src, geometries)
+    except WindowError:
+        return ShapePixels(None, np.empty(0, dtype=np.int64))
+
+    mask = geometry_mask(
+        geometries,
+        transform=src.window_transform(window),
+        out_shape=(int(window.height), int(window.width)),
+        invert=True,
+    )
+    return ShapePixels(window, np.flatnonzero(mask))
+
+
+def rasterize_coverage(src, geometries: list) -> ShapePixels:
+    """
+    Pixels touched by the shape and the exact fraction of each pixel it covers.
+
+    Pixels completely inside the shape get the weight 1. The weights of the pixels
+    crossed by the boundary are the area of the intersection of the pixel and the
+    shape, computed vectorized for all of those pixels at once. Expects a north up
+    raster (no rotation).
+    """
+    try:
+        window = geometry_window(src, geometries)
+    except WindowError:
+        empty = np.empty(0, dtype=np.int64)
+        return ShapePixels(None, empty, np.empty(0, dtype=np.float32))
+
+    transform = src.window_transform(window)
+    out_shape = (int(window.height), int(window.width))
+    geometry = shapely.union_all([shapely.geometry.shape(g) for g in geometries])
+
+    touched = geometry_mask(
+        geometries,
+        transform=transform,
+        out_shape=out_shape,
+        all_touched=True,
+        invert=True,
+    )
+    boundary = geometry_mask(
+        [shapely.boundary(geometry)],
+        transform=transform,
+        out_shape=out_shape,
+        all_touched=True,
+        invert=True,
+    )
+
+    weights = touched.astype(np.float32)
+
+    rows, cols = np.nonzero(boundary)
+    x = transform.c + cols * transform.a
+    y = transform.f + rows * transform.e
+    cells = shapely.box(
+        np.minimum(x, x + transform.a),
+        np.minimum(y, y + transform.e),
+        np.maximum(x, x + transform.a),
+        np.maximum(y, y + transform.e),
+    )
+
+    shapely.prepare(geometry)
+    covered = shapely.area(shapely.intersection(cells, geometry))
+    weights[rows, cols] = covered / abs(transform.a * transform.e)
+
+    indices = np.flatnonzero(weights > 0)
+    return ShapePixels(window, indices, weights.flat[indices])
+
+
+def pixel_positions(
+    pixels: ShapePixels, data_window: Window
+) -> tuple[np.ndarray, np.ndarray]:
+    """Rows and columns of the pixels of a shape inside data read for a window."""
+    rows, cols = np.divmod(np.asarray(pixels.indices), int(pixels.window.width))
+    rows += int(pixels.window.row_off - data_window.row_off)
+    cols += int(pixels.window.col_off - data_window.col_off)
+    return rows, cols
+
+
+def gather_pixels(
+    data: np.ndarray, data_window: Window, pixels: ShapePixels, nodata
+) -> np.ndarray:
+    """
+    Cut the window of a shape out of data read for a (larger) window.
+
+    Cells outside of the shape are set to nodata.
+    """
+    height, width = int(pixels.window.height), int(pixels.window.width)
+
+    out = np.full((height, width), nodata, dtype=data.dtype)
+    out.flat[pixels.indices] = data[pixel_positions(pixels, data_window)]
+    return out
+
+
+def gather_weights(pixels: ShapePixels) -> np.ndarray:
+    """Coverage fractions of the window of a shape, 0 outside of the shape."""
+    height, width = int(pixels.window.height), int(pixels.window.width)
+
+    out = np.zeros((height, width), dtype=np.float32)
+    out.flat[pixels.indices] = pixels.weights
+    return out
+
+
+def read_pixels(src, pixels: ShapePixels, nodata, band: int = 1) -> np.ndarray:
+    """
+    Read the window of a shape, cells outside of the shape are set to nodata.
+
+    Same result as rasterio.mask.mask(src, ..., crop=True, nodata=nodata)[0][band-1]
+    but without rasterizing the geometry again.
+    """
+    data = src.read(band, window=pixels.window, masked=True).filled(nodata)
+    return gather_pixels(data, pixels.window, pixels, nodata)
+
+
+def align_window(window: Window, block_shape: tuple[int, int], raster_shape) -> Window:
+    """Expand a window to the internal blocks (tiles/strips) of a raster."""
+    block_height, block_width = block_shape
+    height, width = raster_shape
+
+    row_start = int(window.row_off) // block_height * block_height
+    col_start = int(window.col_off) // block_width * block_width
+    row_stop = -(-int(window.row_off + window.height) // block_height) * block_height
+    col_stop = -(-int(window.col_off + window.width) // block_width) * block_width
+
+    return Window.from_slices(
+        (row_start, min(row_stop, height)), (col_start, min(col_stop, width))
+    )
+
+
+def group_windows(
+    windows: list[Window],
+    block_shape: tuple[int, int],
+    raster_shape,
+    itemsize: int,
+    max_bytes: int,
+) -> list[tuple[Window, list[int]]]:
+    """
+    Group nearby windows into block aligned windows that are read at once.
+
+    A window joins the current group if the group's window grows by no more than
+    the window would read on its own and stays below max_bytes. So a group never
+    reads more blocks than its windows would read one by one. Returns the windows to
+    read with the positions of the windows they contain. Windows larger than
+    max_bytes on their own are read unaligned and alone.
+    """
+
+    def size(window: Window) -> int:
+        return int(window.width) * int(window.height)
+
+    aligned = [align_window(w, block_shape, raster_shape) for w in windows]
+    order = sorted(
+        range(len(windows)), key=lambda i: (aligned[i].row_off, aligned[i].col_off)
+    )
+
+    groups = []
+    current, members = None, []
+    for i in order:
+        if size(aligned[i]) * itemsize > max_bytes:
+            groups.append((windows[i], [i]))
+            continue
+
+        if current is not None:
+            joined = union(current, aligned[i])
+            if (
+                size(joined) * itemsize <= max_bytes
+                and size(joined) <= size(current) + size(aligned[i])
+            ):
+                current = joined
+                members.append(i)
+                continue
+
+            groups.append((current, members))
+
+        current, members = aligned[i], [i]
+
+    if current is not None:
+        groups.append((current, members))
+
+    return groups
+
+
+class PixelCache:
+    """
+    Pixels of shapes on a raster grid, stored on disk.
+
+    Entries are keyed by the shape id and its updated_at timestamp, so changed
+    shapes are rasterized again. New entries are written by save() into a new
+    segment (a pair of .npy files), so several processes can add entries for the
+    same grid at the same time. compact() merges the segments into one.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.entries: dict[int, tuple[int, ShapePixels]] = {}
+        self.new: dict[int, tuple[int, ShapePixels]] = {}
+        self.segments: list[Path] = []
+
+        self._load()
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+
+        # segment names start with a timestamp, later segments win
+        for index_file in sorted(self.path.glob("*.index.npy")):
+            segment = index_file.with_name(index_file.name.removesuffix(".index.npy"))
+            try:
+                index = np.load(index_file)
+                indices = np.load(f"{segment}.indices.npy", mmap_mode="r")
+                weights = None
+                if Path(f"{segment}.weights.npy").exists():
+                    weights = np.load(f"{segment}.weights.npy", mmap_mode="r")
+            except FileNotFoundError:
+                # removed by compact() of another process in the meantime
+                continue
+
+            for row in index:
+                window = None
+                if row["height"] > 0:
+                    window = Window(
+                        row["col_off"], row["row_off"], row["width"], row["height"]
+                    )
+                pixels = ShapePixels(
+                    window,
+                    indices[row["start"] : row["stop"]],
+                    None if weights is None else weights[row["start"] : row["stop"]],
+                )
+                self.entries[int(row["shape_id"])] = (int(row["updated_at"]), pixels)
+
+            self.segments.append(segment)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, shape_id: int, updated_at: int) -> ShapePixels | None:
+        entry = self.entries.get(shape_id)
+        if entry is None or entry[0] != updated_at:
+            return None
+        return entry[1]
+
+    def add(self, shape_id: int, updated_at: int, pixels: ShapePixels) -> None:
+        self.entries[shape_id] = (updated_at, pixels)
+        self.new[shape_id] = (updated_at, pixels)
+
+    def _write_segment(self, entries: dict[int, tuple[int, ShapePixels]]) -> Path:
+        self.path.mkdir(parents=True, exist_ok=True)
+        segment = self.path / f"{time.time_ns()}-{os.getpid()}"
+
+        index = np.zeros(len(entries), dtype=_INDEX_DTYPE)
+        start = 0
+        for i, (shape_id, (updated_at, pixels)) in enumerate(entries.items()):
+            stop = start + len(pixels.indices)
+            window = pixels.window or Window(0, 0, 0, 0)
+            index[i] = (
+                shape_id,
+                updated_at,
+                window.row_off,
+                window.col_off,
+                window.height,
+                window.width,
+                start,
+                stop,
+            )
+            start = stop
+
+        indices = np.concatenate(
+            [np.empty(0, dtype=np.int64)]
+            + [pixels.indices for _, pixels in entries.values()]
+        ).astype(np.int64, copy=False)
+
+        # the index file is written last, readers only pick up complete segments
+        np.save(f"{segment}.indices.npy", indices)
+        if all(pixels.weights is not None for _, pixels in entries.values()):
+            weights = np.concatenate(
+                [np.empty(0, dtype=np.float32)]
+                + [pixels.weights for _, pixels in entries.values()]
+            )
+            np.save(f"{segment}.weights.npy", weights.astype(np.float32, copy=False))
+        with Path(f"{segment}.tmp.npy").open("wb") as f:
+            np.save(f, index)
+        Path(f"{segment}.tmp.npy").replace(f"{segment}.index.npy")
+
+        return segment
+
+    def save(self) -> None:
+        """Write entries added since the last save into a new segment."""
+        if not self.new:
+            return
+
+        self.segments.append(self._write_segment(self.new))
+        self.new = {}
+
+    def compact(self) -> None:
+        """Merge all segments into one."""
+        self.save()
+        if len(self.segments) <= 1:
+            return
+
+        segment = self._write_segment(self.entries)
+        for old in self.segments:
+            for suffix in (".index.npy", ".indices.npy", ".weights.npy"):
+                Path(f"{old}{suffix}").unlink(missing_ok=True)
+
+        self.segments = [segment]
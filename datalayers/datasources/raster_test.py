@@ -0,0 +1,146 @@
+# SPDX-FileCopyrightText: 2026 Jonathan Ströbele <mail@jonathanstroebele.de>
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import datetime as dt
+
+import numpy as np
+import pytest
+import rasterio
+import rasterio.mask
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+from shapely.geometry import Polygon, box
+
+from .raster import (
+    PixelCache,
+    gather_pixels,
+    grid_key,
+    group_windows,
+    rasterize,
+    rasterize_coverage,
+    read_pixels,
+)
+
+
+@pytest.fixture
+def tiff(tmp_path):
+    path = tmp_path / "2000.tif"
+    data = np.random.default_rng(1).integers(0, 6, size=(100, 150)).astype("uint8")
+    with rasterio.open(
+        path,
+        "w",
+        driver="GTiff",
+        height=100,
+        width=150,
+        count=1,
+        dtype="uint8",
+        crs="EPSG:4326",
+        transform=from_origin(0, 10, 0.1, 0.1),
+        nodata=0,
+    ) as dst:
+        dst.write(data, 1)
+    return path
+
+
+def test_read_pixels_matches_mask(tiff):
+    geometries = [
+        Polygon([(1.05, 1.05), (4.3, 2.2), (2.1, 6.7)]),
+        box(14, 9, 20, 12),  # partially outside
+        box(0.51, 0.51, 0.52, 0.52),  # smaller than a cell
+    ]
+
+    with rasterio.open(tiff) as src:
+        for geometry in geometries:
+            expected, _ = rasterio.mask.mask(src, [geometry], crop=True, nodata=0)
+            band = read_pixels(src, rasterize(src, [geometry]), 0)
+            np.testing.assert_array_equal(band, expected[0])
+
+        assert not rasterize(src, [box(20, 20, 21, 21)]).overlaps
+
+
+def test_rasterize_coverage(tiff):
+    with rasterio.open(tiff) as src:
+        cell_area = 0.1 * 0.1
+
+        # the covered area is preserved exactly, also for cells crossed by the edges
+        for geometry in [
+            box(1, 1, 2, 2),
+            box(1.05, 1.05, 2.05, 2.05),
+            Polygon([(1.05, 1.05), (4.3, 2.2), (2.1, 6.7)]),
+        ]:
+            pixels = rasterize_coverage(src, [geometry])
+            assert pixels.weights.max() <= 1
+            assert pixels.weights.sum() == pytest.approx(geometry.area / cell_area)
+
+        # cell aligned box: only full cells
+        pixels = rasterize_coverage(src, [box(1, 1, 2, 2)])
+        assert len(pixels.indices) == 100
+        assert np.all(pixels.weights == 1)
+
+        # smaller than a cell, no cell center inside but a fraction of one cell
+        pixels = rasterize_coverage(src, [box(0.51, 0.51, 0.54, 0.54)])
+        assert len(rasterize(src, [box(0.51, 0.51, 0.54, 0.54)]).indices) == 0
+        assert len(pixels.indices) == 1
+        assert pixels.weights[0] == pytest.approx(0.09)
+
+
+def test_group_windows(tiff):
+    windows = [Window(0, 0, 10, 10), Window(12, 3, 10, 10), Window(500, 500, 5, 5)]
+    groups = group_windows(windows, (64, 64), (1000, 1000), 1, 64 * 64 * 4)
+
+    # the first two windows are inside the same block, the third is far away
+    assert groups == [
+        (Window(0, 0, 64, 64), [0, 1]),
+        (Window(448, 448, 64, 64), [2]),
+    ]
+
+    # too large for a single read, read unaligned on its own
+    assert group_windows(windows[:1], (64, 64), (1000, 1000), 1, 10) == [
+        (windows[0], [0])
+    ]
+
+    geometries = [box(1, 1, 2, 2), box(1.5, 2, 3, 3.5)]
+    with rasterio.open(tiff) as src:
+        pixels = [rasterize(src, [geometry]) for geometry in geometries]
+        ((window, members),) = group_windows(
+            [p.window for p in pixels], (16, 16), (src.height, src.width), 1, 10**6
+        )
+        data = src.read(1, window=window, masked=True).filled(0)
+
+        for member in members:
+            np.testing.assert_array_equal(
+                gather_pixels(data, window, pixels[member], 0),
+                read_pixels(src, pixels[member], 0),
+            )
+
+
+def test_pixel_cache(tiff, tmp_path):
+    updated_at = int(dt.datetime(2024, 1, 1).timestamp() * 1_000_000)
+
+    with rasterio.open(tiff) as src:
+        path = tmp_path / grid_key(src)
+        pixels = rasterize(src, [box(1, 1, 3, 2)])
+        outside = rasterize(src, [box(20, 20, 21, 21)])
+
+    cache = PixelCache(path)
+    cache.add(1, updated_at, pixels)
+    cache.save()
+
+    cache = PixelCache(path)
+    cache.add(2, updated_at, outside)
+    cache.save()
+
+    cache = PixelCache(path)
+    assert len(cache.segments) == 2
+    cache.compact()
+    assert len(cache.segments) == 1
+
+    cache = PixelCache(path)
+    assert cache.get(1, updated_at).weights is None
+    assert cache.get(1, updated_at).window == pixels.window
+    np.testing.assert_array_equal(cache.get(1, updated_at).indices, pixels.indices)
+    assert not cache.get(2, updated_at).overlaps
+
+    # shape was changed since
+    assert cache.get(1, updated_at + 1) is None
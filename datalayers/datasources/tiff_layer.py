@@ -2,19 +2,63 @@
 #
 # SPDX-License-Identifier: AGPL-3.0-only
 
+import multiprocessing
 import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from itertools import groupby
 from pathlib import Path
 
 import fiona
 import numpy as np
 import pandas as pd
 import rasterio
-import rasterio.mask
 from shapely import wkt
 
+from django.conf import settings
+from django.db import connections
+
 from shapes.models import Shape
 
 from .base_layer import BaseLayer
+from .raster import (
+    PixelCache,
+    ShapePixels,
+    gather_pixels,
+    gather_weights,
+    grid_key,
+    group_windows,
+    pixel_positions,
+    rasterize,
+    rasterize_coverage,
+    read_pixels,
+)
+
+# Layer instance and shapes of the running TiffLayer.process(), inherited by the
+# forked worker processes. So neither the Data Layer class nor the shapes need to be
+# pickled for every task.
+_worker_layer: "TiffLayer | None" = None
+_worker_shapes: list = []
+
+
+def _process_shapes_in_worker(param_dir: Path, files: list, start: int, stop: int):
+    layer = _worker_layer
+
+    # start with empty collections, only values of this chunk are sent back
+    layer.buffer = None
+    layer.rows = []
+    layer._value_index = None
+    # flushing into the shared staging table is left to the parent
+    layer.flush_max_rows = None
+    layer.flush_max_bytes = None
+    # reload the pixel caches, to pick up entries saved by other workers
+    layer._pixel_caches = {}
+
+    try:
+        layer._process_shapes(param_dir, files, _worker_shapes[start:stop])
+        return layer.buffer, layer.rows
+    finally:
+        connections.close_all()
 
 
 class TiffLayer(BaseLayer):
@@ -24,10 +68,60 @@ class TiffLayer(BaseLayer):
         super().__init__()
         self.manual_nodata = None
 
+        # Number of worker processes the shapes are split across in process(). Each
+        # worker opens the files itself and calls consume() for its shapes, the
+        # collected values are merged afterwards. None/1 processes serially.
+        self.workers: int | None = None
+
+        # Cache the pixels covered by a shape per raster grid on disk, so the
+        # geometry is only rasterized once for all files on the same grid (and
+        # across runs). Only used for Shape models, dict shapes are always masked.
+        # Opt-in, the cache under DATAHUB_DATA_DIR/cache has no size limit and isn't
+        # cleaned up, it can be deleted any time to free the space.
+        self.pixel_cache = False
+        self._pixel_caches: dict[str, PixelCache] = {}
+
+        # If set, nearby shapes are grouped into windows aligned to the internal
+        # blocks of the GeoTIFF and every window is read once for all of its shapes,
+        # instead of one read per shape. Windows are kept below this many bytes.
+        self.window_max_bytes: int | None = None
+
+        # Exact coverage mode: instead of only the cells whose center is inside a
+        # shape, all cells touched by the shape are used, each with the fraction of
+        # the cell covered by the shape. Derived Data Layers implement
+        # consume_weighted() instead of consume(). Small shapes, that don't contain
+        # a single cell center, get values this way.
+        self.coverage_weights = False
+
+        # Batch mode: read up to this many bands/files (on the same grid) at once
+        # for a shape and pass them as one 3-D array (bands x rows x cols) to
+        # consume_stack(). For daily products as single files or multi-band stacks.
+        self.stack_size: int | None = None
+
     def consume(self, file, band, shape):
         """Implement this method in the Derived Data Layer."""
         raise NotImplementedError
 
+    def consume_weighted(self, file, band, weights, shape):
+        """
+        Implement this method in the Derived Data Layer for coverage_weights.
+
+        weights has the same shape as band and contains the covered fraction of
+        each cell (0 for cells outside of the shape), i.e., the mean of the shape is
+        np.nansum(band * weights) / np.sum(weights[~np.isnan(band)]).
+        """
+        raise NotImplementedError
+
+    def consume_stack(self, slices, stack, shape, weights=None):
+        """
+        Implement this method in the Derived Data Layer for stack_size.
+
+        slices is a list of (file, band) tuples and stack[i] the band of slices[i]
+        for the shape. Per default every band is passed to consume() on its own.
+        """
+        for (file, _), band in zip(slices, stack, strict=True):
+            self.consume_band(file, band, shape, weights)
+
     def get_tiff_files(self, param_dir):
         return sorted(
             [
@@ -37,9 +131,154 @@ class TiffLayer(BaseLayer):
             ]
         )
 
+    def get_mask(self, shape) -> list:
+        """Geometries of a shape, as used by rasterio.mask.mask()."""
+        if isinstance(shape, Shape):
+            # Shape uses the GeoDjango Model and so has not a shapely geometry
+            # so convert it. amazing right?
+            return [wkt.loads(shape.geometry.wkt)]
+        if "geometry" in shape:
+            return [shape["geometry"]]
+        if "file" in shape:
+            with fiona.open(shape["file"], "r") as shapefile:
+                return [feature["geometry"] for feature in shapefile]
+
+        raise ValueError("No geometry found for given shape.")
+
+    def get_nodata(self, src, file):
+        nodata = src.nodata
+        # self.logger.debug("No data is: %s", nodata)
+
+        # GeoTiff has NO NoData meta data set, try to use custom
+        # set NoData value
+        if nodata is None:
+            nodata = self.manual_nodata
+
+        # make sure manual_nodata is set
+        if nodata is None:
+            raise ValueError(f"No NoData value for GeoTiff {file}")
+
+        return nodata
+
+    def prepare_band(self, src, band, nodata, index: int = 1):
+        """Apply scale/offset and replace NoData cells with np.nan."""
+        # Get scale and offset from the metadata
+        if src.scales and src.offsets:
+            scale = src.scales[index - 1]
+            offset = src.offsets[index - 1]
+            band = band.astype(float) * scale + offset
+            band[band == (nodata * scale + offset)] = np.nan
+
+        # To mask NoData cells we use np.nan so we can use np.nan*-methods.
+        # But np.nan is only available inside float arrays, not with
+        # int arrays!
+        # So in case we have a int array GeoTiff, we need to check
+        # and convert it to a float array.
+        if np.issubdtype(band.dtype, np.integer):
+            band = band.astype(np.float32)
+
+        band[band == nodata] = np.nan
+
+        return band
+
+    def warn_no_cells(self, file, shape) -> None:
+        self.layer.warning(
+            "For shape %s (id=%s) no cells could be identified inside the mask for file %s",
+            {
+                "shape": shape.name,
+                "shape_id": shape.id,
+                "file": file,
+            },
+        )
+
+    def consume_band(self, file, band, shape, weights=None) -> None:
+        """Pass the cells of a shape to consume(), if any could be identified."""
+        # Check if the mask has identified any cells
+        if np.count_nonzero(~np.isnan(band)) == 0:
+            self.warn_no_cells(file, shape)
+            return
+
+        if weights is not None:
+            self.consume_weighted(file, band, weights, shape)
+        else:
+            self.consume(file, band, shape)
+
+    def consume_pixels(self, file, src, nodata, band, pixels: ShapePixels, shape):
+        """Prepare the band read for the pixels of a shape and consume it."""
+        band = self.prepare_band(src, band, nodata)
+
+        weights = None
+        if pixels.weights is not None:
+            weights = gather_weights(pixels)
+
+        self.consume_band(file, band, shape, weights)
+
+    def get_pixel_cache_path(self) -> Path:
+        if self.coverage_weights:
+            return settings.DATAHUB_DATA_DIR / "cache" / "coverage"
+        return settings.DATAHUB_DATA_DIR / "cache" / "pixels"
+
+    def rasterize(self, src, shape) -> ShapePixels:
+        if self.coverage_weights:
+            return rasterize_coverage(src, self.get_mask(shape))
+        return rasterize(src, self.get_mask(shape))
+
+    def get_pixel_cache(self, src) -> PixelCache | None:
+        """Cache of the grid of the opened raster, shared by all Data Layers."""
+        if not self.pixel_cache:
+            return None
+
+        key = grid_key(src)
+        if key not in self._pixel_caches:
+            self._pixel_caches[key] = PixelCache(self.get_pixel_cache_path() / key)
+        return self._pixel_caches[key]
+
+    def get_shape_version(self, shape) -> int:
+        """Version of a shape for cached data, its updated_at in microseconds."""
+        return int(shape.updated_at.timestamp() * 1_000_000)
+
+    def get_shape_pixels(self, src, shape, cache: PixelCache | None) -> ShapePixels:
+        if cache is None or not isinstance(shape, Shape):
+            return self.rasterize(src, shape)
+
+        updated_at = self.get_shape_version(shape)
+        pixels = cache.get(shape.id, updated_at)
+        if pixels is None:
+            pixels = self.rasterize(src, shape)
+            cache.add(shape.id, updated_at, pixels)
+        return pixels
+
     def process(self, shapes):
         param_dir = self.get_data_path()
         files = self.get_tiff_files(param_dir)
+
+        if self.incremental:
+            files = [
+                file
+                for file in files
+                if not self.is_source_processed(param_dir / file, shapes)
+            ]
+
+        self.process_files(param_dir, files, shapes)
+
+        for file in files:
+            self.mark_source_processed(param_dir / file, shapes)
+
+        for cache in self._pixel_caches.values():
+            cache.compact()
+        self._pixel_caches = {}
+
+    def process_files(self, param_dir, files, shapes):
+        if self.workers is not None and self.workers > 1 and len(shapes) > 1:
+            self._process_parallel(param_dir, files, list(shapes))
+        else:
+            self._process_shapes(param_dir, files, shapes)
+
+    def _process_shapes(self, param_dir, files, shapes):
+        if self.stack_size is not None:
+            self._process_stacks(param_dir, files, shapes)
+            return
+
         file_count = len(files)
         i = 1
 
@@ -48,74 +287,191 @@ class TiffLayer(BaseLayer):
             i += 1
 
             with rasterio.open(param_dir / file) as src:
-                nodata = src.nodata
-                # self.logger.debug("No data is: %s", nodata)
-
-                # GeoTiff has NO NoData meta data set, try to use custom
-                # set NoData value
-                if nodata is None:
-                    nodata = self.manual_nodata
-
-                # make sure manual_nodata is set
-                if nodata is None:
-                    raise ValueError(f"No NoData value for GeoTiff {file}")
-
-                for shape in shapes:
-                    # self.logger.debug("loading shape: %s", shape['name'])
-                    if isinstance(shape, Shape):
-                        # Shape uses the GeoDjango Model and so has not a shapely geometry
-                        # so convert it. amazing right?
-
-                        mask = [wkt.loads(shape.geometry.wkt)]
-                    elif "geometry" in shape:
-                        mask = [shape["geometry"]]
-                    elif "file" in shape:
-                        with fiona.open(shape["file"], "r") as shapefile:
-                            mask = [feature["geometry"] for feature in shapefile]
-                    else:
-                        raise ValueError("No geometry found for given shape.")
-
-                    try:
-                        out_image, _ = rasterio.mask.mask(
-                            src, mask, crop=True, nodata=nodata
-                        )
-                        band1 = out_image[0]
-                    except ValueError as e:
+                nodata = self.get_nodata(src, file)
+                cache = self.get_pixel_cache(src)
+
+                if self.window_max_bytes is not None:
+                    self._process_windows(file, src, nodata, shapes, cache)
+                else:
+                    for shape in shapes:
+                        # self.logger.debug("loading shape: %s", shape['name'])
+                        pixels = self.get_shape_pixels(src, shape, cache)
+
                         # in case the GeoTiff is not overlapping with the current shape
-                        if str(e) == "Input shapes do not overlap raster.":
-                            # print(f"{shape} is not covered by raster: {file}")
+                        if not pixels.overlaps:
                             continue
 
-                        # different error, rethrow
-                        raise
-
-                    # Get scale and offset from the metadata
-                    if src.scales and src.offsets:
-                        scale = src.scales[0]
-                        offset = src.offsets[0]
-                        band1 = band1.astype(float) * scale + offset
-                        band1[band1 == (nodata * scale + offset)] = np.nan
-
-                    # To mask NoData cells we use np.nan so we can use np.nan*-methods.
-                    # But np.nan is only available inside float arrays, not with
-                    # int arrays!
-                    # So in case we have a int array GeoTiff, we need to check
-                    # and convert it to a float array.
-                    if np.issubdtype(band1.dtype, np.integer):
-                        band1 = band1.astype(np.float32)
-
-                    band1[band1 == nodata] = np.nan
-
-                    # Check if the mask has identified any cells
-                    if np.count_nonzero(~np.isnan(band1)) == 0:
-                        self.layer.warning(
-                            "For shape %s (id=%s) no cells could be identified inside the mask for file %s",
-                            {
-                                "shape": shape.name,
-                                "shape_id": shape.id,
-                                "file": file,
-                            },
+                        band1 = read_pixels(src, pixels, nodata)
+                        self.consume_pixels(file, src, nodata, band1, pixels, shape)
+
+                if cache is not None:
+                    cache.save()
+
+    def _process_windows(self, file, src, nodata, shapes, cache):
+        shapes = list(shapes)
+        pixels = [self.get_shape_pixels(src, shape, cache) for shape in shapes]
+        overlapping = [i for i, p in enumerate(pixels) if p.overlaps]
+
+        groups = group_windows(
+            [pixels[i].window for i in overlapping],
+            src.block_shapes[0],
+            (src.height, src.width),
+            np.dtype(src.dtypes[0]).itemsize,
+            self.window_max_bytes,
+        )
+
+        for window, members in groups:
+            data = src.read(1, window=window, masked=True).filled(nodata)
+
+            for member in members:
+                i = overlapping[member]
+                band1 = gather_pixels(data, window, pixels[i], nodata)
+                self.consume_pixels(file, src, nodata, band1, pixels[i], shapes[i])
+
+    def get_stack_bands(self, src) -> list[int]:
+        """Bands of a file used with stack_size, every band is a time step."""
+        return list(range(1, src.count + 1))
+
+    def get_stack_batches(self, param_dir, files) -> list[list[tuple[str, int]]]:
+        """Split the bands of all files into batches of stack_size on the same grid."""
+        batches = []
+        batch = []
+        grid = None
+
+        for file in files:
+            with rasterio.open(param_dir / file) as src:
+                key = grid_key(src)
+                bands = self.get_stack_bands(src)
+
+            for band in bands:
+                if batch and (len(batch) >= self.stack_size or key != grid):
+                    batches.append(batch)
+                    batch = []
+                batch.append((file, band))
+                grid = key
+
+        if batch:
+            batches.append(batch)
+
+        return batches
+
+    def _read_stack(self, sources, nodata, batch, window) -> np.ndarray:
+        # bands of the same file are read together
+        parts = [
+            sources[file]
+            .read(
+                indexes=[band for _, band in slices],
+                window=window,
+                masked=True,
+            )
+            .filled(nodata[file])
+            for file, slices in groupby(batch, key=lambda s: s[0])
+        ]
+        return np.concatenate(parts)
+
+    def _gather_stack(self, sources, nodata, batch, data, window, pixels):
+        values = data[(slice(None), *pixel_positions(pixels, window))]
+
+        prepared = [
+            self.prepare_band(sources[file], values[i], nodata[file], band)
+            for i, (file, band) in enumerate(batch)
+        ]
+
+        height, width = int(pixels.window.height), int(pixels.window.width)
+        stack = np.full(
+            (len(batch), height * width), np.nan, dtype=np.result_type(*prepared)
+        )
+        stack[:, pixels.indices] = np.stack(prepared)
+        return stack.reshape(len(batch), height, width)
+
+    def _process_stacks(self, param_dir, files, shapes):
+        shapes = list(shapes)
+
+        for batch in self.get_stack_batches(param_dir, files):
+            with ExitStack() as opened:
+                sources = {
+                    file: opened.enter_context(rasterio.open(param_dir / file))
+                    for file, _ in batch
+                }
+                nodata = {
+                    file: self.get_nodata(src, file) for file, src in sources.items()
+                }
+
+                # all files of a batch are on the same grid
+                src = sources[batch[0][0]]
+                cache = self.get_pixel_cache(src)
+
+                pixels = [self.get_shape_pixels(src, shape, cache) for shape in shapes]
+                overlapping = [i for i, p in enumerate(pixels) if p.overlaps]
+
+                if self.window_max_bytes is not None:
+                    groups = group_windows(
+                        [pixels[i].window for i in overlapping],
+                        src.block_shapes[0],
+                        (src.height, src.width),
+                        np.dtype(src.dtypes[0]).itemsize * len(batch),
+                        self.window_max_bytes,
+                    )
+                else:
+                    groups = [
+                        (pixels[i].window, [member])
+                        for member, i in enumerate(overlapping)
+                    ]
+
+                for window, members in groups:
+                    data = self._read_stack(sources, nodata, batch, window)
+
+                    for member in members:
+                        i = overlapping[member]
+                        stack = self._gather_stack(
+                            sources, nodata, batch, data, window, pixels[i]
                         )
-                        continue
 
-                    self.consume(file, band1, shape)
+                        weights = None
+                        if pixels[i].weights is not None:
+                            weights = gather_weights(pixels[i])
+
+                        self.consume_stack(batch, stack, shapes[i], weights)
+
+                if cache is not None:
+                    cache.save()
+
+    def _process_parallel(self, param_dir, files, shapes):
+        global _worker_layer, _worker_shapes  # noqa: PLW0603
+
+        # smaller chunks than workers, so a chunk of large shapes doesn't leave the
+        # other workers idle at the end
+        chunk_size = max(1, len(shapes) // (self.workers * 4))
+        chunks = [
+            (start, min(start + chunk_size, len(shapes)))
+            for start in range(0, len(shapes), chunk_size)
+        ]
+
+        # the workers must not share the connection of this process
+        connections.close_all()
+
+        _worker_layer = self
+        _worker_shapes = shapes
+        try:
+            with ProcessPoolExecutor(
+                max_workers=min(self.workers, len(chunks)),
+                # fork, so the workers inherit the layer instance, see _worker_layer
+                mp_context=multiprocessing.get_context("fork"),
+            ) as executor:
+                futures = [
+                    executor.submit(
+                        _process_shapes_in_worker, param_dir, files, start, stop
+                    )
+                    for start, stop in chunks
+                ]
+                for future in futures:
+                    buffer, rows = future.result()
+                    self.merge_values(buffer, rows)
+        finally:
+            _worker_layer = None
+            _worker_shapes = []
+
+        # load the segments saved by the workers, so process() compacts them
+        for file in files:
+            with rasterio.open(param_dir / file) as src:
+                self.get_pixel_cache(src)
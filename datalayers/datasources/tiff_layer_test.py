@@ -0,0 +1,73 @@
+# SPDX-FileCopyrightText: 2026 Jonathan Ströbele <mail@jonathanstroebele.de>
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+
+from datalayers.models import Datalayer
+from shapes.models import Shape, Type
+
+from .base_layer import LayerTimeResolution, LayerValueType
+from .tiff_layer import TiffLayer
+
+
+class MeanLayer(TiffLayer):
+    def __init__(self, path) -> None:
+        super().__init__()
+        self.path = path
+        self.time_col = LayerTimeResolution.YEAR
+        self.value_type = LayerValueType.FLOAT
+
+    def get_data_path(self):
+        return self.path
+
+    def consume(self, file, band, shape):
+        self.add_value(shape, 2000, float(np.nanmean(band)))
+
+
+def test_incremental_shape_subset(tmp_path, shape_country):
+    with rasterio.open(
+        tmp_path / "2000.tif",
+        "w",
+        driver="GTiff",
+        height=20,
+        width=20,
+        count=1,
+        dtype="float32",
+        crs="EPSG:4326",
+        transform=from_origin(10, 51, 0.05, 0.05),
+    ) as dst:
+        dst.write(np.ones((1, 20, 20), dtype="float32"))
+
+    type_region = Type.objects.create(name="Region", key="region")
+    Shape.objects.create(
+        name="Test Region",
+        key="TEST01-01",
+        geometry=shape_country.geometry,
+        type=type_region,
+        parent=shape_country,
+    )
+    dl = Datalayer.objects.create(key="test_tiff", name="Tiff")
+
+    layer = MeanLayer(tmp_path)
+    layer.layer = dl
+    layer.process(Shape.objects.filter(type=shape_country.type))
+    layer.save()
+    assert dl.count_values() == 1
+
+    # the file was only processed for the countries so far
+    layer = MeanLayer(tmp_path)
+    layer.layer = dl
+    layer.incremental = True
+    layer.process(Shape.objects.all())
+    layer.save()
+    assert Datalayer.objects.get(pk=dl.pk).count_values() == 2
+
+    # now it's processed for all shapes and skipped
+    layer = MeanLayer(tmp_path)
+    layer.layer = dl
+    layer.incremental = True
+    layer.process(Shape.objects.all())
+    assert layer.len_values() == 0
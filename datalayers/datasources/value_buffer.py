@@ -0,0 +1,309 @@
+# SPDX-FileCopyrightText: 2026 Jonathan Ströbele <mail@jonathanstroebele.de>
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import datetime as dt
+import sys
+from array import array
+
+import numpy as np
+import pandas as pd
+
+# Dates are stored as days since the UNIX epoch, so the int64 buffer can be viewed as
+# datetime64[D] without converting every value.
+_EPOCH_ORDINAL = dt.date(1970, 1, 1).toordinal()
+
+
+def date_to_days(value: dt.date) -> int:
+    return value.toordinal() - _EPOCH_ORDINAL
+
+
+def days_to_date(value: int) -> dt.date:
+    return dt.date.fromordinal(value + _EPOCH_ORDINAL)
+
+
+class ValueColumn:
+    """
+    Append-only column that picks the most compact storage for its values.
+
+    The kind of the column is derived from the first non-null value and follows the
+    same inference pandas applies to a list of dicts:
+
+    - ``q``: integers, stored in an ``array("q")``
+    - ``d``: floats, stored in an ``array("d")``, None becomes NaN
+    - ``b``: booleans, stored in an ``array("b")``
+    - ``O``: everything else, stored in a plain list
+
+    Mixing kinds widens the column (int -> float -> object), so the resulting dtype is
+    the same as the one of ``pd.DataFrame(rows)``.
+    """
+
+    KINDS = {"int64": "q", "float64": "d", "bool": "b", "object": "O"}
+
+    def __init__(self, dtype: str | None = None) -> None:
+        self.kind: str | None = None
+        self.data: array | list | None = None
+
+        # nulls seen before the first actual value, the kind is not known yet
+        self.leading_nulls = 0
+
+        # set once numpy views of the data are handed out, see _writable()
+        self.exported = False
+
+        if dtype is not None:
+            if dtype not in self.KINDS:
+                raise ValueError(f"Unsupported column dtype {dtype}.")
+            self._set_kind(self.KINDS[dtype])
+
+    def __len__(self) -> int:
+        if self.data is None:
+            return self.leading_nulls
+        return len(self.data)
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory used by the column."""
+        if self.data is None:
+            return 0
+        if isinstance(self.data, list):
+            # only the pointers, the objects might be shared (i.e., categories)
+            return sys.getsizeof(self.data)
+        return self.data.buffer_info()[1] * self.data.itemsize
+
+    @staticmethod
+    def _infer_kind(value) -> str:
+        if isinstance(value, (bool, np.bool_)):
+            return "b"
+        if isinstance(value, (int, np.integer)):
+            return "q"
+        if isinstance(value, (float, np.floating)):
+            return "d"
+        return "O"
+
+    def _set_kind(self, kind: str) -> None:
+        # like pandas: ints with missing values become floats, bools objects
+        if self.leading_nulls > 0 and kind in ("q", "b"):
+            kind = "d" if kind == "q" else "O"
+
+        self.kind = kind
+
+        if kind == "O":
+            self.data = [None] * self.leading_nulls
+        else:
+            self.data = array(kind, [np.nan] * self.leading_nulls)
+
+        self.leading_nulls = 0
+
+    def _widen(self, kind: str) -> None:
+        """Convert existing data into a wider kind (q -> d, anything -> O)."""
+        if kind == "O":
+            if self.kind == "b":
+                data = [bool(x) for x in self.data]
+            else:
+                data = self.data.tolist()
+        else:
+            data = array(kind, self.data.tolist())
+
+        self.kind = kind
+        self.data = data
+        self.exported = False
+
+    def _null(self):
+        return np.nan if self.kind == "d" else None
+
+    def _writable(self) -> None:
+        # An array.array can't be resized while a numpy view on it exists. Values
+        # added after a DataFrame has been created go into a fresh copy instead.
+        if self.exported:
+            self.data = self.data[:]
+            self.exported = False
+
+    def append(self, value) -> None:
+        if value is None or (isinstance(value, float) and np.isnan(value)):
+            if self.kind is None:
+                self.leading_nulls += 1
+                return
+            if self.kind in ("q", "b"):
+                self._widen("d" if self.kind == "q" else "O")
+            self._writable()
+            self.data.append(self._null())
+            return
+
+        value_kind = self._infer_kind(value)
+
+        if self.kind is None:
+            self._set_kind(value_kind)
+        elif self.kind != value_kind and self.kind != "O":
+            if self.kind == "q" and value_kind == "d":
+                self._widen("d")
+            elif not (self.kind == "d" and value_kind == "q"):
+                self._widen("O")
+
+        self._writable()
+        self.data.append(value)
+
+    def extend_nulls(self, count: int) -> None:
+        for _ in range(count):
+            self.append(None)
+
+    def extend(self, other: "ValueColumn") -> None:
+        """Append all values of another column."""
+        if other.data is None:
+            self.extend_nulls(other.leading_nulls)
+            return
+
+        if self.kind == other.kind and self.kind != "O":
+            self._writable()
+            self.data.extend(other.data)
+            return
+
+        values = other.data
+        if other.kind == "b":
+            values = [bool(x) for x in values]
+        for value in values:
+            self.append(value)
+
+    def to_numpy(self) -> np.ndarray:
+        """Return the column as numpy array, a view for the typed kinds."""
+        if self.data is None:
+            return np.full(self.leading_nulls, None, dtype=object)
+
+        match self.kind:
+            case "q":
+                values = np.frombuffer(self.data, dtype=np.int64)
+            case "d":
+                values = np.frombuffer(self.data, dtype=np.float64)
+            case "b":
+                values = np.frombuffer(self.data, dtype=np.int8).view(np.bool_)
+            case _:
+                return np.array(self.data, dtype=object)
+
+        self.exported = True
+        return values
+
+
+class ValueBuffer:
+    """
+    Columnar storage of the values collected by BaseLayer.add_value().
+
+    Instead of a dict per value, every column (temporal, shape_id, value and all
+    properties) is a typed array. For a daily layer with thousands of shapes this
+    is a fraction of the memory and the DataFrame/Arrow table can be created from
+    views of the arrays instead of converting millions of dicts.
+    """
+
+    def __init__(
+        self,
+        temporal_column: str,
+        *,
+        temporal_is_date: bool,
+        property_dtypes: dict[str, str] | None = None,
+    ) -> None:
+        self.temporal_column = temporal_column
+        self.temporal_is_date = temporal_is_date
+        self.property_dtypes = property_dtypes or {}
+
+        self.clear()
+
+    def clear(self) -> None:
+        # new objects instead of deleting in place, DataFrames created by
+        # to_dataframe() still reference the old buffers
+        self.temporal = array("q")
+        self.shape_id = array("q")
+        self.value = ValueColumn()
+        self.properties: dict[str, ValueColumn] = {
+            name: ValueColumn(dtype) for name, dtype in self.property_dtypes.items()
+        }
+        self.exported = False
+
+    def __len__(self) -> int:
+        return len(self.shape_id)
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory used by the buffer."""
+        size = (len(self.temporal) + len(self.shape_id)) * 8 + self.value.nbytes
+        for column in self.properties.values():
+            size += column.nbytes
+        return size
+
+    def temporal_to_int(self, temporal) -> int:
+        if self.temporal_is_date:
+            return date_to_days(temporal)
+        return int(temporal)
+
+    def append(self, temporal, shape_id: int, value, properties: dict | None = None):
+        if self.exported:
+            self.temporal = self.temporal[:]
+            self.shape_id = self.shape_id[:]
+            self.exported = False
+
+        length = len(self)
+
+        self.temporal.append(self.temporal_to_int(temporal))
+        self.shape_id.append(shape_id)
+        self.value.append(value)
+
+        if properties:
+            for name, prop in properties.items():
+                if name not in self.properties:
+                    self.properties[name] = ValueColumn()
+                    self.properties[name].extend_nulls(length)
+                self.properties[name].append(prop)
+
+        # properties not given for this value
+        for column in self.properties.values():
+            if len(column) == length:
+                column.append(None)
+
+    def extend(self, other: "ValueBuffer") -> None:
+        """Append all values of another buffer, i.e., collected by a worker process."""
+        if self.exported:
+            self.temporal = self.temporal[:]
+            self.shape_id = self.shape_id[:]
+            self.exported = False
+
+        length = len(self)
+
+        self.temporal.extend(other.temporal)
+        self.shape_id.extend(other.shape_id)
+        self.value.extend(other.value)
+
+        for name, column in other.properties.items():
+            if name not in self.properties:
+                self.properties[name] = ValueColumn()
+                self.properties[name].extend_nulls(length)
+            self.properties[name].extend(column)
+
+        # properties the other buffer has no values for
+        for column in self.properties.values():
+            column.extend_nulls(len(self) - len(column))
+
+    def columns(self) -> dict[str, np.ndarray]:
+        """All columns as numpy arrays (views of the buffers where possible)."""
+        temporal = np.frombuffer(self.temporal, dtype=np.int64)
+        if self.temporal_is_date:
+            temporal = temporal.view("datetime64[D]")
+
+        self.exported = True
+
+        columns = {
+            self.temporal_column: temporal,
+            "shape_id": np.frombuffer(self.shape_id, dtype=np.int64),
+            "value": self.value.to_numpy(),
+        }
+        for name, column in self.properties.items():
+            columns[name] = column.to_numpy()
+
+        return columns
+
+    def to_dataframe(self) -> pd.DataFrame:
+        return pd.DataFrame(self.columns(), copy=False)
+
+    def to_arrow(self):
+        """Return the values as pyarrow.Table (requires pyarrow to be installed)."""
+        import pyarrow as pa
+
+        return pa.table(
+            {name: pa.array(values) for name, values in self.columns().items()}
+        )
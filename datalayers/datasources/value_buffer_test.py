@@ -0,0 +1,82 @@
+# SPDX-FileCopyrightText: 2026 Jonathan Ströbele <mail@jonathanstroebele.de>
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import datetime as dt
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from .value_buffer import ValueBuffer, ValueColumn
+
+
+def test_value_column_kinds():
+    column = ValueColumn()
+    for v in [1, 2, 3]:
+        column.append(v)
+    assert column.to_numpy().dtype == np.int64
+
+    # ints with a missing value become floats, like in pandas
+    column = ValueColumn()
+    for v in [1, None, 3]:
+        column.append(v)
+    assert column.to_numpy().dtype == np.float64
+    assert np.isnan(column.to_numpy()[1])
+
+    column = ValueColumn()
+    for v in [None, True, False]:
+        column.append(v)
+    assert column.to_numpy().dtype == object
+    assert column.to_numpy().tolist() == [None, True, False]
+
+    column = ValueColumn()
+    for v in [1.5, 2, "foo"]:
+        column.append(v)
+    assert column.to_numpy().tolist() == [1.5, 2.0, "foo"]
+
+
+def test_value_buffer_matches_dict_rows():
+    buffer = ValueBuffer("date", temporal_is_date=True)
+    rows = []
+    for i in range(1, 5):
+        date = dt.date(2000, 1, i)
+        properties = {"count": i} if i > 1 else None
+
+        buffer.append(date, i, i / 10, properties)
+        rows.append({"date": date, "shape_id": i, "value": i / 10} | (properties or {}))
+
+    df = buffer.to_dataframe()
+    expected = pd.DataFrame(rows)
+    expected["date"] = pd.to_datetime(expected["date"])
+
+    pd.testing.assert_frame_equal(df, expected, check_dtype=False)
+    assert df["shape_id"].dtype == np.int64
+
+
+def test_value_buffer_append_after_export():
+    buffer = ValueBuffer("year", temporal_is_date=False)
+    buffer.append(2000, 1, 1.0)
+
+    df = buffer.to_dataframe()
+    buffer.append(2001, 1, 2.0)
+
+    # the first DataFrame is not affected by the new value
+    assert len(df) == 1
+    assert len(buffer.to_dataframe()) == 2
+
+
+def test_value_buffer_extend():
+    buffer = ValueBuffer("year", temporal_is_date=False)
+    buffer.append(2000, 1, 1)
+
+    # i.e., collected by a worker process and sent back pickled
+    other = ValueBuffer("year", temporal_is_date=False)
+    other.append(2000, 2, 2.5, {"count": 3})
+    other.append(2000, 3, True)
+    buffer.extend(pickle.loads(pickle.dumps(other)))
+
+    df = buffer.to_dataframe()
+    assert df["shape_id"].tolist() == [1, 2, 3]
+    assert df["value"].tolist() == [1, 2.5, True]
+    assert df["count"].isna().tolist() == [True, False, True]
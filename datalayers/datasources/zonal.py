@@ -0,0 +1,175 @@
+# SPDX-FileCopyrightText: 2026 Jonathan Ströbele <mail@jonathanstroebele.de>
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+from .raster import ShapePixels, group_windows, pixel_positions
+
+
+def band_histogram(band: np.ndarray, weights: np.ndarray | None = None) -> np.ndarray:
+    """
+    Class histogram of a masked band, NoData cells are np.nan.
+
+    With coverage weights the histogram contains the covered cell area per class.
+    """
+    valid = ~np.isnan(band)
+    values = band[valid].astype(np.int64)
+    if weights is None:
+        return np.bincount(values)
+    return np.bincount(values, weights=weights[valid])
+
+
+def class_histograms(
+    src, pixels: list[ShapePixels], nodata, max_bytes: int
+) -> np.ndarray:
+    """
+    Count the cells per class value of all shapes in one pass over the raster.
+
+    Returns a matrix with a row per shape and a column per class value, i.e.,
+    counts[i, 40] is the number of cells with the value 40 inside of shape i. Shapes
+    that are close to each other share a window read, see group_windows(). The
+    class values must be non-negative integers. If the pixels have coverage weights
+    (see rasterize_coverage()), the counts are the covered cell area per class.
+    """
+    weighted = any(p.weights is not None for p in pixels)
+    counts = np.zeros((len(pixels), 0), dtype=np.float64 if weighted else np.int64)
+
+    overlapping = [i for i, p in enumerate(pixels) if p.overlaps]
+    groups = group_windows(
+        [pixels[i].window for i in overlapping],
+        src.block_shapes[0],
+        (src.height, src.width),
+        np.dtype(src.dtypes[0]).itemsize,
+        max_bytes,
+    )
+
+    for window, members in groups:
+        data = src.read(1, window=window, masked=True).filled(nodata)
+
+        values = []
+        labels = []
+        weights = []
+        for label, member in enumerate(members):
+            shape_pixels = pixels[overlapping[member]]
+            cells = data[pixel_positions(shape_pixels, window)]
+
+            valid = cells != nodata
+            if np.issubdtype(cells.dtype, np.floating):
+                valid &= ~np.isnan(cells)
+
+            values.append(cells[valid])
+            labels.append(np.full(np.count_nonzero(valid), label, dtype=np.int64))
+            if weighted:
+                weights.append(np.asarray(shape_pixels.weights)[valid])
+
+        values = np.concatenate(values).astype(np.int64)
+        if len(values) == 0:
+            continue
+
+        if values.min() < 0:
+            raise ValueError("Class values of categorical rasters can't be negative.")
+
+        classes = max(counts.shape[1], int(values.max()) + 1)
+        if classes > counts.shape[1]:
+            counts = np.pad(counts, ((0, 0), (0, classes - counts.shape[1])))
+
+        # a single bincount for all shapes of the window, every shape gets its own
+        # range of classes
+        group_counts = np.bincount(
+            np.concatenate(labels) * classes + values,
+            weights=np.concatenate(weights) if weighted else None,
+            minlength=len(members) * classes,
+        ).reshape(len(members), classes)
+
+        counts[[overlapping[m] for m in members]] += group_counts
+
+    return counts
+
+
+class HistogramStore:
+    """
+    Class histograms of shapes for a raster file, stored on disk.
+
+    Shared by all Data Layers derived from the same raster (i.e., forest and
+    cropland from the Copernicus land cover), so the raster is only read once.
+    Entries are keyed by the shape id and its version (updated_at). All entries are
+    discarded if the size or modification time of the raster changes.
+    """
+
+    def __init__(self, path: Path, source: Path) -> None:
+        self.path = path
+
+        stat = source.stat()
+        self.source = np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+        # shape_id -> (version, overlaps, counts)
+        self.entries: dict[int, tuple[int, bool, np.ndarray]] = {}
+        self.changed = False
+
+        self._load()
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+
+        with np.load(self.path) as data:
+            if not np.array_equal(data["source"], self.source):
+                return
+
+            for shape_id, version, overlaps, counts in zip(
+                data["shape_id"],
+                data["version"],
+                data["overlaps"],
+                data["counts"],
+                strict=True,
+            ):
+                self.entries[int(shape_id)] = (int(version), bool(overlaps), counts)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, shape_id: int, version: int) -> tuple[bool, np.ndarray] | None:
+        """Return if the shape overlaps the raster and its histogram."""
+        entry = self.entries.get(shape_id)
+        if entry is None or entry[0] != version:
+            return None
+        return entry[1], entry[2]
+
+    def add(self, shape_id: int, version: int, overlaps: bool, counts) -> None:
+        self.entries[shape_id] = (version, overlaps, counts)
+        self.changed = True
+
+    def save(self) -> None:
+        if not self.changed:
+            return
+
+        classes = max((len(e[2]) for e in self.entries.values()), default=0)
+        weighted = any(e[2].dtype.kind == "f" for e in self.entries.values())
+        counts = np.zeros(
+            (len(self.entries), classes), dtype=np.float64 if weighted else np.int64
+        )
+        for i, (_, _, histogram) in enumerate(self.entries.values()):
+            counts[i, : len(histogram)] = histogram
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Data Layers sharing a raster can save the same store in parallel
+        tmp = self.path.with_name(
+            f"{self.path.name}.{time.time_ns()}-{os.getpid()}.tmp"
+        )
+        with tmp.open("wb") as f:
+            np.savez(
+                f,
+                source=self.source,
+                shape_id=np.fromiter(self.entries.keys(), dtype=np.int64),
+                version=np.array([e[0] for e in self.entries.values()], np.int64),
+                overlaps=np.array([e[1] for e in self.entries.values()], bool),
+                counts=counts,
+            )
+        tmp.replace(self.path)
+
+        self.changed = False
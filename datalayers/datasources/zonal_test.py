@@ -0,0 +1,83 @@
+# SPDX-FileCopyrightText: 2026 Jonathan Ströbele <mail@jonathanstroebele.de>
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import os
+
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+from shapely.geometry import Polygon, box
+
+from .raster import rasterize, read_pixels
+from .zonal import HistogramStore, band_histogram, class_histograms
+
+
+def _write_tiff(path):
+    data = np.random.default_rng(2).integers(0, 31, size=(100, 150)).astype("uint8")
+    with rasterio.open(
+        path,
+        "w",
+        driver="GTiff",
+        height=100,
+        width=150,
+        count=1,
+        dtype="uint8",
+        crs="EPSG:4326",
+        transform=from_origin(0, 10, 0.1, 0.1),
+        nodata=0,
+        tiled=True,
+        blockxsize=16,
+        blockysize=16,
+    ) as dst:
+        dst.write(data, 1)
+
+
+def test_class_histograms(tmp_path):
+    path = tmp_path / "koeppen.tif"
+    _write_tiff(path)
+
+    geometries = [
+        Polygon([(1.05, 1.05), (4.3, 2.2), (2.1, 6.7)]),
+        box(2, 2, 3, 3),
+        box(14, 9, 20, 12),
+        box(20, 20, 21, 21),  # outside
+    ]
+
+    with rasterio.open(path) as src:
+        pixels = [rasterize(src, [geometry]) for geometry in geometries]
+        counts = class_histograms(src, pixels, 0, 10**6)
+
+        assert counts.shape[0] == len(geometries)
+        assert counts[3].sum() == 0
+
+        for i, p in enumerate(pixels[:3]):
+            band = read_pixels(src, p, 0).astype(np.float32)
+            band[band == 0] = np.nan
+
+            expected = band_histogram(band)
+            np.testing.assert_array_equal(counts[i, : len(expected)], expected)
+            assert counts[i, len(expected) :].sum() == 0
+
+
+def test_histogram_store(tmp_path):
+    source = tmp_path / "koeppen.tif"
+    source.write_bytes(b"raster")
+    path = tmp_path / "koeppen.tif.histograms.npz"
+
+    store = HistogramStore(path, source)
+    store.add(1, 100, True, np.array([0, 5, 2]))
+    store.add(2, 100, False, np.array([], dtype=np.int64))
+    store.save()
+
+    store = HistogramStore(path, source)
+    overlaps, histogram = store.get(1, 100)
+    assert overlaps
+    assert histogram.tolist() == [0, 5, 2]
+    assert not store.get(2, 100)[0]
+    assert store.get(1, 101) is None
+
+    # a changed raster file invalidates all histograms
+    stat = source.stat()
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert len(HistogramStore(path, source)) == 0
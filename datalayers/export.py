@@ -0,0 +1,343 @@
+# SPDX-FileCopyrightText: 2026 Jonathan Ströbele <mail@jonathanstroebele.de>
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import datetime as dt
+from collections.abc import Iterator
+
+from psycopg import sql
+
+from django.db import connection
+
+from datalayers.datasources.base_layer import LayerTimeResolution, LayerValueType
+from datalayers.loader import has_unique_index
+from datalayers.models import AGGREGATES, DATA_CHUNK_SIZE, Datalayer
+from datalayers.utils import iter_chunks
+from shapes.models import Shape, Type
+
+# Temporal resolutions from the finest to the coarsest
+RESOLUTIONS = [
+    LayerTimeResolution.DAY,
+    LayerTimeResolution.WEEK,
+    LayerTimeResolution.MONTH,
+    LayerTimeResolution.YEAR,
+]
+
+# date_trunc() fields of the resolutions stored in DATE columns
+TRUNC_FIELDS = {
+    LayerTimeResolution.DAY: "day",
+    LayerTimeResolution.WEEK: "week",
+    LayerTimeResolution.MONTH: "month",
+}
+
+# Aggregates of the Data Layers with non-numeric values, booleans are ordered false <
+# true and categories can only be counted
+BINARY_AGGREGATES = {
+    "min": "BOOL_AND(value)",
+    "max": "BOOL_OR(value)",
+    "count": "COUNT(value)",
+}
+CATEGORICAL_AGGREGATES = {
+    "count": "COUNT(value)",
+}
+
+# Columns of the export next to the values
+EXPORT_COLUMNS = ["dh_shape_id", "shape_key", "type_key", "shape_name", "datalayer"]
+
+
+def is_finer(resolution: LayerTimeResolution, other: LayerTimeResolution) -> bool:
+    return RESOLUTIONS.index(resolution) < RESOLUTIONS.index(other)
+
+
+def value_kind(dl: Datalayer) -> str | None:
+    """Kind of the values of the Data Layer, numeric, boolean or text (None if unknown)."""
+    match dl.value_type:
+        case LayerValueType.BINARY:
+            return "boolean"
+        case LayerValueType.NOMINAL | LayerValueType.ORDINAL:
+            return "text"
+        case None:
+            return None
+        case _:
+            return "numeric"
+
+
+def value_aggregate(dl: Datalayer, aggregate: str) -> tuple[str, str | None]:
+    """
+    SQL of the aggregate of the values of the Data Layer and the kind of the result.
+
+    Raises ValueError if the values of the Data Layer can't be aggregated like that.
+    """
+    kind = value_kind(dl)
+    aggregates = {
+        "boolean": BINARY_AGGREGATES,
+        "text": CATEGORICAL_AGGREGATES,
+    }.get(kind, AGGREGATES)
+
+    if aggregate not in aggregates:
+        raise ValueError(
+            f"Values of {dl.key} can not be aggregated with {aggregate}, supported are {', '.join(aggregates)}"
+        )
+
+    return aggregates[aggregate], "numeric" if aggregate == "count" else kind
+
+
+def bucket_column(
+    column: sql.Composable,
+    resolution: LayerTimeResolution,
+    target: LayerTimeResolution,
+) -> sql.Composable:
+    """
+    SQL expression of the period of the target resolution of a temporal column.
+
+    The target can't be finer than the resolution of the column. Periods are
+    identified like the temporal columns of the Data Layers, the year as integer and
+    the first day of the month/week/day. Weeks belong to the month (and year) of
+    their Monday. The column has to be a DATE (an integer for years).
+    """
+    if is_finer(target, resolution):
+        raise ValueError(f"Can not convert {resolution} to finer {target}")
+
+    if target == resolution:
+        return column
+
+    if target == LayerTimeResolution.YEAR:
+        return sql.SQL("EXTRACT(YEAR FROM {})::int").format(column)
+
+    return sql.SQL("DATE_TRUNC({field}, {column})::date").format(
+        field=sql.Literal(TRUNC_FIELDS[target]), column=column
+    )
+
+
+def next_period(start: dt.date, resolution: LayerTimeResolution) -> dt.date:
+    """First day of the period after the one starting at start."""
+    match resolution:
+        case LayerTimeResolution.YEAR:
+            return dt.date(start.year + 1, 1, 1)
+        case LayerTimeResolution.MONTH:
+            if start.month == 12:
+                return dt.date(start.year + 1, 1, 1)
+            return dt.date(start.year, start.month + 1, 1)
+        case LayerTimeResolution.WEEK:
+            return start + dt.timedelta(days=7)
+        case _:
+            return start + dt.timedelta(days=1)
+
+
+def export_query(
+    layers: list[Datalayer],
+    resolution: LayerTimeResolution | None = None,
+    layout: str = "wide",
+    aggregate: str = "mean",
+    shape: Shape | None = None,
+    shape_type: Type | None = None,
+    start_date: dt.date | None = None,
+    end_date: dt.date | None = None,
+) -> tuple[sql.Composed, dict]:
+    """
+    Query of the values of multiple Data Layers joined by shape and period.
+
+    The periods have the given resolution, by default the coarsest one of the Data
+    Layers. Values of finer Data Layers are aggregated per period (mean by default),
+    values of coarser ones are repeated for each period they contain, i.e., a yearly
+    value for every month of the year. There is a row for each shape and period with
+    a value of at least one Data Layer that isn't coarser than the resolution.
+
+    Only the values of finer Data Layers and of ones with multiple values per shape
+    and time (property columns) are aggregated, the others are exported as they are.
+    Boolean values only support min, max and count, categorical ones only count.
+
+    wide has a column per Data Layer, named by its key. long has a row per value,
+    with the key in the datalayer column, as text if the Data Layers have different
+    kinds of values.
+
+    start_date and end_date are the first days of the first and last period.
+    """
+    if not layers:
+        raise ValueError("No Data Layers to export")
+
+    keys = [dl.key for dl in layers]
+    if len(set(keys)) != len(keys):
+        raise ValueError("Data Layers can only be exported once")
+
+    if resolution is None:
+        resolution = max(
+            (dl.temporal_resolution for dl in layers), key=RESOLUTIONS.index
+        )
+
+    if layout == "wide" and any(
+        key in [*EXPORT_COLUMNS, str(resolution)] for key in keys
+    ):
+        raise ValueError("Data Layer keys clash with the columns of the export")
+
+    if aggregate not in AGGREGATES:
+        raise ValueError(
+            f"Unsupported aggregate {aggregate}, supported are {', '.join(AGGREGATES)}"
+        )
+
+    # Data Layers that define the periods of the rows
+    periodic = [dl for dl in layers if not is_finer(resolution, dl.temporal_resolution)]
+    if not periodic:
+        raise ValueError(
+            f"At least one Data Layer needs a temporal resolution of {resolution} or finer"
+        )
+
+    params = {}
+
+    # filters of each Data Layer table, to only aggregate the needed values
+    shape_filters = []
+    if shape:
+        shape_filters.append(sql.SQL("shape_id = %(shape_id)s"))
+        params["shape_id"] = shape.id
+
+    if shape_type:
+        shape_filters.append(
+            sql.SQL(
+                "shape_id IN (SELECT id FROM shapes_shape WHERE type_id = %(type)s)"
+            )
+        )
+        params["type"] = shape_type.id
+
+    if start_date:
+        params["start_date"] = start_date
+        params["start_year"] = start_date.year
+
+    if end_date:
+        end = next_period(end_date, resolution)
+        params["end_date"] = end
+        params["end_year"] = end.year
+
+    ctes = []
+    joins = []
+    kinds = []
+    for i, dl in enumerate(layers):
+        name = sql.Identifier(f"l{i}")
+        column = sql.Identifier(str(dl.temporal_resolution))
+        if dl.temporal_resolution != LayerTimeResolution.YEAR:
+            # month/week columns of restored dumps can be TEXT
+            column = sql.SQL("{}::date").format(column)
+
+        filters = list(shape_filters)
+        bucket = column
+        if dl in periodic:
+            bucket = bucket_column(column, dl.temporal_resolution, resolution)
+
+            # compare with the bounds of the periods in the type of the column
+            suffix = (
+                "year" if dl.temporal_resolution == LayerTimeResolution.YEAR else "date"
+            )
+            if start_date:
+                filters.append(
+                    sql.SQL("{column} >= {start}").format(
+                        column=column, start=sql.Placeholder(f"start_{suffix}")
+                    )
+                )
+            if end_date:
+                filters.append(
+                    sql.SQL("{column} < {end}").format(
+                        column=column, end=sql.Placeholder(f"end_{suffix}")
+                    )
+                )
+
+        # values of finer Data Layers are aggregated per period, Data Layers with
+        # properties can have multiple values per shape and time
+        if is_finer(dl.temporal_resolution, resolution) or not has_unique_index(
+            dl.key, ["shape_id", str(dl.temporal_resolution)]
+        ):
+            value, kind = value_aggregate(dl, aggregate)
+            group = sql.SQL(" GROUP BY 1, 2")
+        else:
+            value, kind = "value", value_kind(dl)
+            group = sql.SQL("")
+        kinds.append(kind)
+
+        ctes.append(
+            sql.SQL(
+                "{name} AS (SELECT shape_id, {bucket} AS bucket, {value} AS value "
+                "FROM {table} WHERE {filters}{group})"
+            ).format(
+                name=name,
+                bucket=bucket,
+                value=sql.SQL(value),
+                table=sql.Identifier(dl.key),
+                filters=sql.SQL(" AND ").join(filters or [sql.SQL("TRUE")]),
+                group=group,
+            )
+        )
+
+        period = sql.SQL("k.bucket")
+        if dl not in periodic:
+            period = bucket_column(period, resolution, dl.temporal_resolution)
+        joins.append(
+            sql.SQL(
+                "LEFT JOIN {name} ON {name}.shape_id = k.shape_id AND {name}.bucket = {period}"
+            ).format(name=name, period=period)
+        )
+
+    ctes.append(
+        sql.SQL("keys AS ({})").format(
+            sql.SQL(" UNION ").join(
+                sql.SQL("SELECT shape_id, bucket FROM {}").format(
+                    sql.Identifier(f"l{layers.index(dl)}")
+                )
+                for dl in periodic
+            )
+        )
+    )
+
+    if layout == "wide":
+        values = sql.SQL(", ").join(
+            sql.SQL("{}.value AS {}").format(
+                sql.Identifier(f"l{i}"), sql.Identifier(dl.key)
+            )
+            for i, dl in enumerate(layers)
+        )
+        unpivot = sql.SQL("")
+        order = sql.SQL("")
+    elif layout == "long":
+        # the values of all Data Layers are in one column, so they need a common type
+        cast = sql.SQL("::text") if len(set(kinds)) > 1 else sql.SQL("")
+        values = sql.SQL("v.datalayer, v.value")
+        unpivot = sql.SQL(
+            "CROSS JOIN LATERAL (VALUES {}) AS v(position, datalayer, value) "
+            "WHERE v.value IS NOT NULL "
+        ).format(
+            sql.SQL(", ").join(
+                sql.SQL("({}, {}, {}.value{})").format(
+                    sql.Literal(i), sql.Literal(dl.key), sql.Identifier(f"l{i}"), cast
+                )
+                for i, dl in enumerate(layers)
+            )
+        )
+        order = sql.SQL(", v.position")
+    else:
+        raise ValueError(f"Unsupported layout {layout}, supported are wide and long")
+
+    query = sql.SQL(
+        "WITH {ctes} "
+        "SELECT k.shape_id AS dh_shape_id, s.key AS shape_key, st.key AS type_key, "
+        "s.name AS shape_name, k.bucket AS {temporal_column}, {values} "
+        "FROM keys AS k "
+        "JOIN shapes_shape AS s ON s.id = k.shape_id "
+        "JOIN shapes_type AS st ON st.id = s.type_id "
+        "{joins} "
+        "{unpivot}"
+        "ORDER BY k.bucket, st.position, k.shape_id{order}"
+    ).format(
+        ctes=sql.SQL(", ").join(ctes),
+        temporal_column=sql.Identifier(str(resolution)),
+        values=values,
+        joins=sql.SQL(" ").join(joins),
+        unpivot=unpivot,
+        order=order,
+    )
+
+    return query, params
+
+
+def iter_export(
+    layers: list[Datalayer], chunk_size: int = DATA_CHUNK_SIZE, **kwargs
+) -> Iterator[tuple[list, list[tuple]]]:
+    """Rows of export_query() in chunks, see utils.iter_chunks()."""
+    query, params = export_query(layers, **kwargs)
+    return iter_chunks(query.as_string(connection), params, chunk_size)
@@ -0,0 +1,293 @@
+# SPDX-FileCopyrightText: 2026 Jonathan Ströbele <mail@jonathanstroebele.de>
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+from io import StringIO
+
+import numpy as np
+import pandas as pd
+import shapely
+from geopandas.array import GeometryDtype
+from psycopg import sql
+from sqlalchemy.dialects import postgresql
+
+from django.db import IntegrityError, connection, transaction
+
+# Marker for NULL values inside the CSV stream. With an explicit NULL string, empty
+# unquoted fields are loaded as empty strings and not as NULL.
+CSV_NULL = "\\N"
+
+
+def sql_type(series: pd.Series, dtype=None) -> str:
+    """
+    PostgreSQL column type for a pandas Series.
+
+    Follows the type mapping of pandas to_sql(), so tables created by the loader
+    look the same as before. `dtype` can be a SQLAlchemy type (like the values of
+    BaseLayer.pandas_to_sql_dtype) or a plain SQL type string.
+    """
+    if dtype is not None:
+        if isinstance(dtype, str):
+            return dtype
+        if isinstance(dtype, type):
+            dtype = dtype()
+        return dtype.compile(dialect=postgresql.dialect())
+
+    if isinstance(series.dtype, GeometryDtype):
+        srid = series.crs.to_epsg() if series.crs else 0
+        return f"geometry(Geometry, {srid})"
+
+    inferred = pd.api.types.infer_dtype(series, skipna=True)
+
+    match inferred:
+        case "datetime64" | "datetime":
+            if isinstance(series.dtype, pd.DatetimeTZDtype):
+                return "TIMESTAMP WITH TIME ZONE"
+            return "TIMESTAMP WITHOUT TIME ZONE"
+        case "timedelta64":
+            return "BIGINT"
+        case "floating":
+            if series.dtype == "float32":
+                return "REAL"
+            return "DOUBLE PRECISION"
+        case "integer":
+            name = series.dtype.name.lower()
+            if name in ("int8", "uint8", "int16"):
+                return "SMALLINT"
+            if name in ("uint16", "int32"):
+                return "INTEGER"
+            return "BIGINT"
+        case "boolean":
+            return "BOOLEAN"
+        case "date":
+            return "DATE"
+        case "time":
+            return "TIME"
+        case "complex":
+            raise ValueError("Complex datatypes not supported")
+        case _:
+            return "TEXT"
+
+
+def _prepare_for_csv(df: pd.DataFrame) -> pd.DataFrame:
+    """Convert columns that CSV can't represent as PostgreSQL input."""
+    geometry_columns = [c for c in df.columns if isinstance(df[c].dtype, GeometryDtype)]
+
+    if not geometry_columns:
+        return df
+
+    data = pd.DataFrame(df)  # plain DataFrame, the geometry is replaced by strings
+    for column in geometry_columns:
+        geometries = np.asarray(df[column])
+        if df[column].crs:
+            geometries = shapely.set_srid(geometries, df[column].crs.to_epsg())
+        data[column] = shapely.to_wkb(geometries, hex=True, include_srid=True)
+
+    return data
+
+
+def copy_dataframe(
+    df: pd.DataFrame,
+    table: str,
+    *,
+    if_exists: str = "fail",
+    dtype: dict | None = None,
+    chunk_size: int = 100_000,
+) -> int:
+    """
+    Bulk load a DataFrame into a table with COPY FROM STDIN.
+
+    Drop in replacement for df.to_sql(table, engine, index=False, ...) with the same
+    `if_exists` (fail, replace, append) and `dtype` semantics. The rows are streamed
+    as CSV in chunks of `chunk_size` rows over Djangos database connection. Creating
+    and filling the table happens in one transaction. Returns the number of rows.
+    """
+    if if_exists not in ("fail", "replace", "append"):
+        raise ValueError(f"'{if_exists}' is not valid for if_exists")
+
+    dtype = dtype or {}
+    identifier = sql.Identifier(table)
+    columns = sql.SQL(", ").join(sql.Identifier(str(c)) for c in df.columns)
+
+    with transaction.atomic(), connection.cursor() as c:
+        exists = table in connection.introspection.table_names(c)
+
+        if exists and if_exists == "fail":
+            raise ValueError(f"Table '{table}' already exists.")
+
+        if exists and if_exists == "replace":
+            c.execute(sql.SQL("DROP TABLE {table}").format(table=identifier))
+
+        if not exists or if_exists == "replace":
+            definitions = sql.SQL(", ").join(
+                sql.SQL("{name} {type}").format(
+                    name=sql.Identifier(str(column)),
+                    type=sql.SQL(sql_type(df[column], dtype.get(column))),
+                )
+                for column in df.columns
+            )
+            c.execute(
+                sql.SQL("CREATE TABLE {table} ({definitions})").format(
+                    table=identifier, definitions=definitions
+                )
+            )
+
+        if len(df) == 0:
+            return 0
+
+        query = sql.SQL(
+            "COPY {table} ({columns}) FROM STDIN (FORMAT csv, NULL {null})"
+        ).format(table=identifier, columns=columns, null=sql.Literal(CSV_NULL))
+
+        data = _prepare_for_csv(df)
+        with c.copy(query) as copy:
+            for start in range(0, len(data), chunk_size):
+                buffer = StringIO()
+                data.iloc[start : start + chunk_size].to_csv(
+                    buffer, header=False, index=False, na_rep=CSV_NULL
+                )
+                copy.write(buffer.getvalue())
+
+    return len(df)
+
+
+# Suffixes of the names of the indexes created by create_indexes(), temporal_idx is
+# the (temporal) index of tables created before the (temporal, shape_id) one
+INDEX_SUFFIXES = ["shape_temporal_idx", "temporal_shape_idx", "temporal_idx"]
+
+
+def _index_name(table: str, suffix: str) -> str:
+    # PostgreSQL truncates identifiers to 63 characters, which could make the names
+    # of both indexes identical for long keys. So only the table part is shortened.
+    return f"{table[: 63 - len(suffix) - 1]}_{suffix}"
+
+
+def rename_indexes(table: str, new_table: str) -> None:
+    """
+    Rename the indexes of create_indexes() along with their table.
+
+    Their names are derived from the table name, so they'd clash with the indexes of
+    a new table with the old name.
+    """
+    with connection.cursor() as c:
+        for suffix in INDEX_SUFFIXES:
+            c.execute(
+                sql.SQL("ALTER INDEX IF EXISTS {name} RENAME TO {new_name}").format(
+                    name=sql.Identifier(_index_name(table, suffix)),
+                    new_name=sql.Identifier(_index_name(new_table, suffix)),
+                )
+            )
+
+
+def create_indexes(table: str, temporal_column: str) -> None:
+    """
+    Create the indexes of a Data Layer table and update its planner statistics.
+
+    - (shape_id, temporal): unique if the table has no duplicate values, used by
+      lookups of a shape at a point in time and as conflict target for upserts
+    - (temporal, shape_id): sorting, first/last time and keyset pagination of the
+      data API, replaces the (temporal) index created here for tables before
+
+    Indexes that already exist on the same columns (even with a different name,
+    i.e., after a rename of the Data Layer) are not created again.
+    """
+    with transaction.atomic(), connection.cursor() as c:
+        columns = [
+            column.name
+            for column in connection.introspection.get_table_description(c, table)
+        ]
+        if "shape_id" not in columns or temporal_column not in columns:
+            return
+
+        constraints = connection.introspection.get_constraints(c, table)
+        existing = [
+            constraint["columns"]
+            for constraint in constraints.values()
+            if constraint["index"] or constraint["unique"]
+        ]
+
+        identifier = sql.Identifier(table)
+        temporal = sql.Identifier(temporal_column)
+
+        if ["shape_id", temporal_column] not in existing:
+            name = sql.Identifier(_index_name(table, "shape_temporal_idx"))
+            try:
+                with transaction.atomic():
+                    c.execute(
+                        sql.SQL(
+                            "CREATE UNIQUE INDEX {name} ON {table} (shape_id, {temporal})"
+                        ).format(name=name, table=identifier, temporal=temporal)
+                    )
+            except IntegrityError:
+                # duplicates are allowed for Data Layers with property columns
+                c.execute(
+                    sql.SQL(
+                        "CREATE INDEX {name} ON {table} (shape_id, {temporal})"
+                    ).format(name=name, table=identifier, temporal=temporal)
+                )
+
+        if [temporal_column, "shape_id"] not in existing:
+            c.execute(
+                sql.SQL("CREATE INDEX {name} ON {table} ({temporal}, shape_id)").format(
+                    name=sql.Identifier(_index_name(table, "temporal_shape_idx")),
+                    table=identifier,
+                    temporal=temporal,
+                )
+            )
+
+            # only the index created here before, others might be wanted
+            name = _index_name(table, "temporal_idx")
+            if constraints.get(name, {}).get("columns") == [temporal_column]:
+                c.execute(
+                    sql.SQL("DROP INDEX {name}").format(name=sql.Identifier(name))
+                )
+
+        c.execute(sql.SQL("ANALYZE {table}").format(table=identifier))
+
+
+def has_unique_index(table: str, columns: list[str]) -> bool:
+    """Check if the table has a unique index/constraint on exactly these columns."""
+    with connection.cursor() as c:
+        return any(
+            constraint["unique"] and constraint["columns"] == columns
+            for constraint in connection.introspection.get_constraints(
+                c, table
+            ).values()
+        )
+
+
+def upsert_query(
+    table: str, source: str, columns: list[str], key: list[str]
+) -> sql.Composed:
+    """
+    Merge all rows of the source table into the table.
+
+    Rows with the same key (needs a unique index on the key columns) are updated,
+    all others are inserted. One set based statement, so it's as fast as the COPY
+    into the source (staging) table.
+    """
+    identifiers = sql.SQL(", ").join(sql.Identifier(column) for column in columns)
+    updates = [column for column in columns if column not in key]
+
+    if updates:
+        action = sql.SQL("DO UPDATE SET {updates}").format(
+            updates=sql.SQL(", ").join(
+                sql.SQL("{column} = EXCLUDED.{column}").format(
+                    column=sql.Identifier(column)
+                )
+                for column in updates
+            )
+        )
+    else:
+        action = sql.SQL("DO NOTHING")
+
+    return sql.SQL(
+        "INSERT INTO {table} ({columns}) SELECT {columns} FROM {source} "
+        "ON CONFLICT ({key}) {action}"
+    ).format(
+        table=sql.Identifier(table),
+        columns=identifiers,
+        source=sql.Identifier(source),
+        key=sql.SQL(", ").join(sql.Identifier(column) for column in key),
+        action=action,
+    )
@@ -0,0 +1,70 @@
+# SPDX-FileCopyrightText: 2026 Jonathan Ströbele <mail@jonathanstroebele.de>
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import datetime as dt
+
+import geopandas
+import numpy as np
+import pandas as pd
+from shapely.geometry import Point
+from sqlalchemy.types import Date, Text
+
+from .loader import _index_name, _prepare_for_csv, sql_type, upsert_query
+
+
+def test_sql_type():
+    assert sql_type(pd.Series([1, 2])) == "BIGINT"
+    assert sql_type(pd.Series([1, 2], dtype="int16")) == "SMALLINT"
+    assert sql_type(pd.Series([1.0, np.nan])) == "DOUBLE PRECISION"
+    assert sql_type(pd.Series([True, False])) == "BOOLEAN"
+    assert sql_type(pd.Series(["a", None])) == "TEXT"
+    assert sql_type(pd.Series([dt.date(2000, 1, 1)])) == "DATE"
+    assert sql_type(pd.Series(pd.to_datetime(["2000-01-01"]))) == (
+        "TIMESTAMP WITHOUT TIME ZONE"
+    )
+
+    # explicit types, like BaseLayer.pandas_to_sql_dtype
+    series = pd.Series(pd.to_datetime(["2000-01-01"]))
+    assert sql_type(series, Date()) == "DATE"
+    assert sql_type(series, Text) == "TEXT"
+    assert sql_type(series, "DATE") == "DATE"
+
+
+def test_prepare_geometry_for_csv():
+    gdf = geopandas.GeoDataFrame(
+        {"id": [1]}, geometry=[Point(10, 50)], crs="EPSG:4326"
+    )
+
+    assert sql_type(gdf["geometry"]) == "geometry(Geometry, 4326)"
+
+    df = _prepare_for_csv(gdf)
+    # hex EWKB including the SRID
+    assert df.at[0, "geometry"].startswith("0101000020E6100000")
+    assert isinstance(gdf.at[0, "geometry"], Point)
+
+
+def test_index_name():
+    assert _index_name("temperature", "temporal_idx") == "temperature_temporal_idx"
+
+    key = "x" * 80
+    assert len(_index_name(key, "shape_temporal_idx")) == 63
+    assert _index_name(key, "temporal_shape_idx") != _index_name(
+        key, "shape_temporal_idx"
+    )
+
+
+def test_upsert_query():
+    query = upsert_query(
+        "dl", "_dl_staging", ["shape_id", "year", "value"], ["shape_id", "year"]
+    )
+    assert query.as_string() == (
+        'INSERT INTO "dl" ("shape_id", "year", "value") '
+        'SELECT "shape_id", "year", "value" FROM "_dl_staging" '
+        'ON CONFLICT ("shape_id", "year") DO UPDATE SET "value" = EXCLUDED."value"'
+    )
+
+    query = upsert_query(
+        "dl", "_dl_staging", ["shape_id", "year"], ["shape_id", "year"]
+    )
+    assert query.as_string().endswith('ON CONFLICT ("shape_id", "year") DO NOTHING')
@@ -0,0 +1,88 @@
+# SPDX-FileCopyrightText: 2026 Jonathan Ströbele <mail@jonathanstroebele.de>
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+from timeit import default_timer as timer
+
+import numpy as np
+import pandas as pd
+from psycopg import sql
+from sqlalchemy.types import Date
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from datalayers.loader import copy_dataframe
+from datalayers.utils import get_engine
+
+
+class Command(BaseCommand):
+    help = "Benchmark saving Data Layer values with COPY against pandas to_sql()"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rows",
+            type=int,
+            default=1_000_000,
+            help="Number of synthetic values to write.",
+        )
+
+        parser.add_argument(
+            "--shapes",
+            type=int,
+            default=1000,
+            help="Number of distinct shapes in the synthetic values.",
+        )
+
+    def handle(self, *args, **options):
+        rows = options["rows"]
+        shapes = options["shapes"]
+
+        # shaped like a daily Data Layer
+        rng = np.random.default_rng(42)
+        df = pd.DataFrame(
+            {
+                "date": pd.Timestamp("1990-01-01")
+                + pd.to_timedelta(np.arange(rows) // shapes, unit="D"),
+                "shape_id": np.arange(rows) % shapes + 1,
+                "value": rng.random(rows),
+            }
+        )
+        dtype = {"date": Date()}
+
+        self.stdout.write(f"Writing {rows} rows...")
+
+        results = {}
+
+        start = timer()
+        df.to_sql(
+            "_benchmark_to_sql",
+            get_engine(),
+            index=False,
+            if_exists="replace",
+            dtype=dtype,
+        )
+        results["to_sql"] = timer() - start
+
+        start = timer()
+        copy_dataframe(df, "_benchmark_copy", if_exists="replace", dtype=dtype)
+        results["copy"] = timer() - start
+
+        with connection.cursor() as c:
+            for table in ("_benchmark_to_sql", "_benchmark_copy"):
+                c.execute(
+                    sql.SQL("DROP TABLE IF EXISTS {table}").format(
+                        table=sql.Identifier(table)
+                    )
+                )
+
+        for name, duration in results.items():
+            self.stdout.write(
+                f"{name:>8}: {duration:8.2f} s ({rows / duration:,.0f} rows/s)"
+            )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"COPY is {results['to_sql'] / results['copy']:.1f}x faster than to_sql()."
+            )
+        )
@@ -8,7 +8,8 @@ from pathlib import Path
 from django.db import connection
 from django.core.management.base import BaseCommand, CommandError
 
-from datalayers.models import Datalayer, camel
+from datalayers.models import Datalayer
+from datalayers.registry import camel
 
 
 class Command(BaseCommand):
@@ -39,8 +39,8 @@ class Command(BaseCommand):
             "--save-db-if-exists",
             type=str,
             default="replace",
-            choices=["replace", "append"],
-            help="If database table already exists set to append.",
+            choices=["replace", "append", "upsert"],
+            help="If database table already exists set to append, or upsert to update existing values.",
         )
 
     def handle(self, *args, **options):
@@ -7,6 +7,7 @@ from psycopg import sql
 from django.core.management.base import BaseCommand, CommandError
 from django.db import connection
 
+from datalayers.catalog import catalog
 from datalayers.models import Datalayer
 
 
@@ -36,6 +37,7 @@ class Command(BaseCommand):
             query = sql.SQL("DROP TABLE {table}").format(table=sql.Identifier(dl.key))
             with connection.cursor() as c:
                 c.execute(query)
+            catalog.invalidate()
 
             self.stdout.write(
                 self.style.SUCCESS(f"Deleted table of Data Layer {dl.key}.")
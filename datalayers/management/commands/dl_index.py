@@ -0,0 +1,47 @@
+# SPDX-FileCopyrightText: 2026 Jonathan Ströbele <mail@jonathanstroebele.de>
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+from django.core.management.base import BaseCommand
+
+from datalayers.loader import create_indexes
+from datalayers.models import Datalayer
+
+
+class Command(BaseCommand):
+    help = "Create missing indexes and the summary of the values of already loaded Data Layers"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "keys",
+            type=str,
+            nargs="?",
+            default=".*",
+            help="Comma separated list of datalayer keys, you can use * as wildcard. Defaults to all Data Layers.",
+        )
+
+    def handle(self, *args, **options):
+        keys = [s.strip() for s in options["keys"].split(",")]
+
+        for key in keys:
+            dls = Datalayer.objects.filter_by_key(key)
+
+            if dls.count() == 0:
+                self.stdout.write(
+                    self.style.WARNING(f'No Data Layer were found for "{key}".')
+                )
+                return
+
+            for dl in dls:
+                if not dl.is_loaded() or not dl.has_class():
+                    self.stdout.write(
+                        self.style.WARNING(
+                            f"The Data Layer {dl.key} can't be indexed, since it's not loaded."
+                        )
+                    )
+                    continue
+
+                create_indexes(dl.key, str(dl.temporal_resolution))
+                dl.update_stats()
+
+                self.stdout.write(self.style.SUCCESS(f"Indexed {dl.key}."))
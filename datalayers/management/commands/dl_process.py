@@ -2,14 +2,77 @@
 #
 # SPDX-License-Identifier: AGPL-3.0-only
 
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError, OutputWrapper
+from django.db import connections
 
 from datalayers.models import Datalayer
+from datalayers.workers import init_worker, process_layer_job
 from shapes.models import Shape
 
 
+def get_shapes(shape_type: str | None):
+    if shape_type:
+        return Shape.objects.filter(type__key=shape_type)
+    return Shape.objects.all()
+
+
+def process_layer(dl: Datalayer, shapes, options, stdout: OutputWrapper, style):
+    try:
+        stdout.write(f'Starting processing Data Layer "{dl.key}"...')
+
+        cls = dl.get_class()
+        if options["output"] != "db":
+            cls.output = "fs"
+        if options["flush_rows"]:
+            cls.flush_max_rows = options["flush_rows"]
+        if options["flush_mb"]:
+            cls.flush_max_bytes = options["flush_mb"] * 1024 * 1024
+        if options["incremental"]:
+            cls.incremental = True
+
+        dl.process(shapes)
+
+        stdout.write(
+            style.SUCCESS(
+                f'Data Layer "{dl.key}" has been processed ({dl.get_class().len_values()} values).'
+            )
+        )
+
+        if not options["dry_run"]:
+            stdout.write(f'Saving processed data for "{dl.key}"...')
+
+            if options["output"] == "db":
+                dl.get_class().save(db_if_exists=options["save_db_if_exists"])
+
+                stdout.write(
+                    style.SUCCESS(f'Data Layer "{dl.key}" has been saved to database.')
+                )
+            else:
+                dl.get_class().save(fs_path=Path(options["output"]))
+
+                stdout.write(
+                    style.SUCCESS(
+                        f'Data Layer "{dl.key}" has been saved to filesystem.'
+                    )
+                )
+
+        else:
+            dl.get_class().discard()
+            stdout.write(
+                style.WARNING('The "--dry-run" option was set, nothing was saved!')
+            )
+
+    except NotImplementedError:
+        stdout.write(
+            style.ERROR(f'Data Layer "{dl.key}" has no defined process() method.')
+        )
+
+
 class Command(BaseCommand):
     help = "Process given Data Layers"
 
@@ -37,8 +100,35 @@ class Command(BaseCommand):
             "--save-db-if-exists",
             type=str,
             default="replace",
-            choices=["replace", "append"],
-            help="If database table already exists set to append.",
+            choices=["replace", "append", "upsert"],
+            help="If database table already exists set to append, or upsert to replace only the values of the processed shapes/times.",
+        )
+
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="Only process source files/time ranges that are new since the last run and append them.",
+        )
+
+        parser.add_argument(
+            "--flush-rows",
+            type=int,
+            required=False,
+            help="Write processed values in chunks of this many rows to the database while processing.",
+        )
+
+        parser.add_argument(
+            "--flush-mb",
+            type=int,
+            required=False,
+            help="Write processed values in chunks of this many megabytes to the database while processing.",
+        )
+
+        parser.add_argument(
+            "--jobs",
+            type=int,
+            default=1,
+            help="Number of Data Layers processed in parallel, each in its own process.",
         )
 
         parser.add_argument(
@@ -51,10 +141,7 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         keys = [s.strip() for s in options["keys"].split(",")]
 
-        if options["shape_type"]:
-            shapes = Shape.objects.filter(type__key=options["shape_type"])
-        else:
-            shapes = Shape.objects.all()
+        shapes = get_shapes(options["shape_type"])
 
         # wen can use len(shapes) here, since we iterate over the result anyways.
         # using shapes.count() would lead to an extra query `COUNT * ...`
@@ -62,6 +149,7 @@ class Command(BaseCommand):
             self.stdout.write(self.style.WARNING("No shapes found for processing."))
             return
 
+        layers = []
         for key in keys:
             dls = Datalayer.objects.filter_by_key(key)
 
@@ -71,51 +159,76 @@ class Command(BaseCommand):
                 )
                 return
 
-            for dl in dls:
-                try:
-                    self.stdout.write(f'Starting processing Data Layer "{dl.key}"...')
+            layers.extend(dls)
 
-                    dl.process(shapes)
+        if options["jobs"] > 1 and len(layers) > 1:
+            # all workers would write to the same file
+            if options["output"] != "db":
+                raise CommandError(
+                    "--jobs can only be used with the database output, process the Data Layers one by one to save them to the filesystem."
+                )
 
-                    self.stdout.write(
-                        self.style.SUCCESS(
-                            f'Data Layer "{dl.key}" has been processed ({dl.get_class().len_values()} values).'
-                        )
-                    )
+            self.process_parallel(layers, options)
+            return
 
-                    if not options["dry_run"]:
-                        self.stdout.write(f'Saving processed data for "{dl.key}"...')
-
-                        if options["output"] == "db":
-                            dl.get_class().save(
-                                db_if_exists=options["save_db_if_exists"]
-                            )
-
-                            self.stdout.write(
-                                self.style.SUCCESS(
-                                    f'Data Layer "{dl.key}" has been saved to database.'
-                                )
-                            )
-                        else:
-                            dl.get_class().output = "fs"
-                            dl.get_class().save(fs_path=Path(options["output"]))
-
-                            self.stdout.write(
-                                self.style.SUCCESS(
-                                    f'Data Layer "{dl.key}" has been saved to filesystem.'
-                                )
-                            )
-
-                    else:
-                        self.stdout.write(
-                            self.style.WARNING(
-                                'The "--dry-run" option was set, nothing was saved!'
-                            )
-                        )
-
-                except NotImplementedError:
-                    self.stdout.write(
-                        self.style.ERROR(
-                            f'Data Layer "{dl.key}" has no defined process() method.'
-                        )
-                    )
+        for dl in layers:
+            process_layer(dl, shapes, options, self.stdout, self.style)
+
+    def process_parallel(self, layers: list[Datalayer], options):
+        jobs = min(options["jobs"], len(layers))
+        self.stdout.write(f"Processing {len(layers)} Data Layers with {jobs} jobs...")
+
+        # connections can't be shared with the workers
+        connections.close_all()
+
+        # only the options needed by process_layer(), others might not be picklable
+        # (i.e., stdout when called with call_command())
+        job_options = {
+            name: options.get(name)
+            for name in (
+                "output",
+                "dry_run",
+                "save_db_if_exists",
+                "incremental",
+                "flush_rows",
+                "flush_mb",
+                "shape_type",
+                "force_color",
+            )
+        }
+
+        # the workers are spawned, so they don't inherit the state of this process
+        databases = {
+            alias: connections[alias].settings_dict["NAME"] for alias in connections
+        }
+
+        failed = []
+        with ProcessPoolExecutor(
+            max_workers=jobs,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+            initargs=(databases,),
+        ) as executor:
+            futures = {
+                executor.submit(process_layer_job, dl.pk, job_options): dl
+                for dl in layers
+            }
+
+            # the output of a Data Layer is written at once when it's done, so the
+            # messages of the layers don't interleave
+            for future in as_completed(futures):
+                try:
+                    output, success = future.result()
+                except BrokenProcessPool as e:
+                    raise CommandError(
+                        f"A worker process died while processing {futures[future].key}: {e}"
+                    ) from e
+
+                self.stdout.write(output, ending="")
+                if not success:
+                    failed.append(futures[future].key)
+
+        if failed:
+            raise CommandError(
+                f"Processing failed for {len(failed)} Data Layers: {', '.join(failed)}"
+            )
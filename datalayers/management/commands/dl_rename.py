@@ -8,9 +8,12 @@ from pathlib import Path
 from psycopg import sql
 
 from django.core.management.base import BaseCommand, CommandError
-from django.db import connection
+from django.db import connection, transaction
 
-from datalayers.models import Datalayer, camel
+from datalayers.catalog import catalog
+from datalayers.loader import rename_indexes
+from datalayers.models import Datalayer
+from datalayers.registry import camel
 
 
 class Command(BaseCommand):
@@ -238,8 +241,10 @@ class Command(BaseCommand):
                 query = sql.SQL("ALTER TABLE {old} RENAME TO {new}").format(
                     old=sql.Identifier(old_key), new=sql.Identifier(new_key)
                 )
-                with connection.cursor() as c:
+                with transaction.atomic(), connection.cursor() as c:
                     c.execute(query)
+                    rename_indexes(old_key, new_key)
+                catalog.invalidate()
                 self.stdout.write(self.style.SUCCESS("  Renamed database table"))
             else:
                 self.stdout.write("  Data Layer not loaded — no table to rename")
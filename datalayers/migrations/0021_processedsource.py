@@ -0,0 +1,30 @@
+# Generated by Django 5.2.14 on 2026-10-18 09:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('datalayers', '0020_alter_datalayer_data_access'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProcessedSource',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('name', models.CharField(max_length=1024)),
+                ('size', models.BigIntegerField()),
+                ('mtime', models.BigIntegerField(help_text='Modification time in nanoseconds')),
+                ('hash', models.CharField(blank=True, help_text='SHA-256 of the file content', max_length=64)),
+                ('datalayer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='processed_sources', to='datalayers.datalayer')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('datalayer', 'name'), name='unique_processed_source')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.14 on 2026-10-18 14:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('datalayers', '0021_processedsource'),
+        ('shapes', '0005_shape_description'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DatalayerStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('count', models.BigIntegerField(default=0)),
+                ('first_time', models.CharField(blank=True, max_length=10)),
+                ('last_time', models.CharField(blank=True, max_length=10)),
+                ('years', models.JSONField(default=list)),
+                ('months', models.JSONField(default=list)),
+                ('weeks', models.JSONField(default=list)),
+                ('shape_ids', models.JSONField(default=list)),
+                ('datalayer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='datalayers.datalayer')),
+                ('shape_type', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='shapes.type')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('datalayer', 'shape_type'), name='unique_datalayer_stats')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.14 on 2026-10-18 19:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('datalayers', '0022_datalayerstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='datalayer',
+            name='data_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='datalayer',
+            name='data_updated_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.14 on 2026-10-18 21:12
+
+from django.db import migrations, models
+
+
+def remove_duplicate_totals(apps, schema_editor):
+    DatalayerStats = apps.get_model("datalayers", "DatalayerStats")
+
+    seen = set()
+    for stats in DatalayerStats.objects.filter(shape_type__isnull=True).order_by(
+        "datalayer_id", "-id"
+    ):
+        if stats.datalayer_id in seen:
+            stats.delete()
+        seen.add(stats.datalayer_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('datalayers', '0023_datalayer_data_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_totals, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='datalayerstats',
+            constraint=models.UniqueConstraint(condition=models.Q(('shape_type__isnull', True)), fields=('datalayer',), name='unique_datalayer_stats_total'),
+        ),
+    ]
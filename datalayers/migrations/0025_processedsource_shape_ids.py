@@ -0,0 +1,18 @@
+# Generated by Django 5.2.14 on 2026-10-18 22:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('datalayers', '0024_datalayerstats_unique_datalayer_stats_total'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processedsource',
+            name='shape_ids',
+            field=models.JSONField(default=list, help_text='Shapes the file has been processed for'),
+        ),
+    ]
@@ -4,22 +4,26 @@
 
 import datetime as dt
 import logging
-import os
-import string
+from collections.abc import Iterator
 from pathlib import Path
 from timeit import default_timer as timer
+from typing import Self
 
 import pandas as pd
 from psycopg import sql
 from taggit.managers import TaggableManager
 
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import connection, models
+from django.db import connection, models, transaction
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.functional import cached_property
 from django.utils.translation import gettext_lazy as _
 
-from datalayers.utils import dictfetchone, get_conn_string
+from datalayers.catalog import catalog
+from datalayers.loader import has_unique_index
+from datalayers.registry import registry
+from datalayers.utils import dictfetchone, get_conn_string, iter_chunks
 from shapes.models import Shape, Type
 
 from .datasources.base_layer import BaseLayer, LayerTimeResolution, LayerValueType
@@ -28,12 +32,6 @@ from .datasources.base_layer import BaseLayer, LayerTimeResolution, LayerValueTy
 logger = logging.getLogger(__name__)
 
 
-def camel(s: str) -> str:
-    s = s.replace("_", " ")
-    s = s.replace("-", " ")
-    return string.capwords(s).replace(" ", "")
-
-
 class CategoryManager(models.Manager):
     def get_by_natural_key(self, key):
         return self.get(key=key)
@@ -65,6 +63,57 @@ class Category(models.Model):
         return (self.key,)
 
 
+# Ancestors of a shape (including the shape itself) with their distance to it, see
+# Datalayer.value(fallback_parent=True)
+ANCESTORS_CTE = (
+    "WITH RECURSIVE ancestors AS ("
+    "SELECT id, parent_id, 0 AS depth FROM shapes_shape "
+    "WHERE id = %(shape_id)s "
+    "UNION ALL "
+    "SELECT s.id, s.parent_id, a.depth + 1 FROM shapes_shape AS s "
+    "JOIN ancestors AS a ON s.id = a.parent_id"
+    ") "
+)
+
+# Pandas offset aliases supported by Datalayer.data(resample=...) with the date_trunc()
+# field, the length of a period and if the period is labeled by its first or last
+# day (like pandas does, e.g. "MS" vs "ME")
+RESAMPLE_FREQUENCIES = {
+    "D": ("day", "1 day", "start"),
+    "W": ("week", "1 week", "end"),  # ISO weeks, labeled by their Sunday as W-SUN
+    "W-SUN": ("week", "1 week", "end"),
+    "MS": ("month", "1 month", "start"),
+    "M": ("month", "1 month", "end"),
+    "ME": ("month", "1 month", "end"),
+    "QS": ("quarter", "3 months", "start"),
+    "Q": ("quarter", "3 months", "end"),
+    "QE": ("quarter", "3 months", "end"),
+    "YS": ("year", "1 year", "start"),
+    "AS": ("year", "1 year", "start"),
+    "Y": ("year", "1 year", "end"),
+    "YE": ("year", "1 year", "end"),
+    "A": ("year", "1 year", "end"),
+}
+
+# First key of the advisory locks of Datalayer.update_stats(), the second one is the id
+# of the Data Layer
+STATS_LOCK_NAMESPACE = 1853
+
+# Rows fetched at once by Datalayer.iter_data()
+DATA_CHUNK_SIZE = 5000
+
+# SQL of the pandas aggregate functions supported by Datalayer.data(aggregate=...)
+AGGREGATES = {
+    "sum": "SUM(value)",
+    "min": "MIN(value)",
+    "max": "MAX(value)",
+    "mean": "AVG(value)",
+    "median": "PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY value)",
+    "std": "STDDEV_SAMP(value)",
+    "count": "COUNT(value)",
+}
+
+
 class DatalayerValue:
     def __init__(self, datalayer, row) -> None:
         self.result = row
@@ -77,10 +126,24 @@ class DatalayerValue:
         self.shape_id = None
         self.time = None
 
+        self._shape = None
+
         if row is not None and "value" in row:
             self.value = row["value"]
             self.shape_id = row["shape_id"]
 
+    @classmethod
+    def from_json(cls, datalayer, row: dict) -> Self:
+        """Create the value from a row selected as JSON (dates are strings)."""
+        column = str(datalayer.temporal_resolution)
+        if isinstance(row.get(column), str):
+            row[column] = (
+                dt.datetime.fromisoformat(row[column])
+                if "T" in row[column]
+                else dt.date.fromisoformat(row[column])
+            )
+        return cls(datalayer, row)
+
     def has_value(self) -> bool:
         return self.value is not None
 
@@ -160,10 +223,13 @@ class DatalayerValue:
                 msg = f"Unknown time_col={self.dl.temporal_resolution}"
                 raise ValueError(msg)
 
+    def set_shape(self, shape: Shape | None) -> None:
+        self._shape = shape
+
     def shape(self) -> Shape | None:
-        if self.shape_id:
-            return Shape.objects.get(pk=self.shape_id)
-        return None
+        if self._shape is None and self.shape_id:
+            self._shape = Shape.objects.get(pk=self.shape_id)
+        return self._shape
 
     def timestamp(self):
         if self.result is None:
@@ -338,6 +404,11 @@ class Datalayer(models.Model):
     date_last_accessed = models.DateField(blank=True, null=True)
     citation = models.TextField(blank=True)
 
+    # Changed with every save/reset of the data table, used for the HTTP caching of
+    # the API responses (ETag/Last-Modified)
+    data_version = models.PositiveIntegerField(default=0, editable=False)
+    data_updated_at = models.DateTimeField(blank=True, null=True, editable=False)
+
     objects = DatalayerManager()
 
     # creator       = models.CharField(max_length=255, blank=True)
@@ -487,44 +558,141 @@ class Datalayer(models.Model):
     def debug(self, message, context=None):
         self.log(DatalayerLogEntry.DEBUG, message, context=context)
 
-    @cached_property
-    def get_available_shape_types(self) -> list[Type]:
-        """Determine all shape types the datalayer has values for."""
+    def parse_temporal(self, value: str | None):
+        """Temporal value from its ISO format, as it's returned by the database."""
+        if not value:
+            return None
+        if self.temporal_resolution == LayerTimeResolution.YEAR:
+            return int(value)
+        return dt.date.fromisoformat(value)
+
+    def compute_stats(self) -> list["DatalayerStats"]:
+        """
+        Compute the summary of the saved values, unsaved DatalayerStats.
+
+        One pass over the table, grouped by shape type, see update_stats().
+        """
         if not self.is_loaded():
             return []
 
+        column = sql.Identifier(str(self.temporal_resolution))
+        if self.temporal_resolution == LayerTimeResolution.YEAR:
+            year = sql.SQL("dl.{column}").format(column=column)
+        else:
+            # month/week columns of restored dumps can be TEXT
+            year = sql.SQL("DATE_PART('year', dl.{column}::date)::int").format(
+                column=column
+            )
+
+        # distinct months/weeks, for days those would be too many
+        if self.temporal_resolution in (
+            LayerTimeResolution.MONTH,
+            LayerTimeResolution.WEEK,
+        ):
+            periods = sql.SQL("ARRAY_AGG(DISTINCT dl.{column})").format(column=column)
+        else:
+            periods = sql.SQL("NULL")
+
+        # values of deleted shapes are only counted in the total
+        query = sql.SQL(
+            "SELECT s.type_id, COUNT(*), MIN(dl.{column}), MAX(dl.{column}), "
+            "ARRAY_AGG(DISTINCT {year}), {periods}, ARRAY_AGG(DISTINCT dl.shape_id) "
+            "FROM {table} AS dl LEFT JOIN shapes_shape AS s ON s.id = dl.shape_id "
+            "GROUP BY s.type_id"
+        ).format(
+            column=column, year=year, periods=periods, table=sql.Identifier(self.key)
+        )
         with connection.cursor() as c:
-            query = sql.SQL(
-                "SELECT DISTINCT t.id FROM {table} AS dl \
-                JOIN shapes_shape as s ON s.id = dl.shape_id  \
-                JOIN shapes_type as t ON t.id = s.type_id"
-            ).format(table=sql.Identifier(self.key))
             c.execute(query)
-            results = c.fetchall()
+            rows = c.fetchall()
+
+        def iso(value) -> str:
+            if value is None:
+                return ""
+            if isinstance(value, dt.date):
+                return value.isoformat()
+            return str(value)
+
+        def summary(shape_type_id, rows) -> DatalayerStats:
+            firsts = [row[2] for row in rows if row[2] is not None]
+            lasts = [row[3] for row in rows if row[3] is not None]
+            periods = {p for row in rows for p in row[5] or [] if p is not None}
+
+            return DatalayerStats(
+                datalayer=self,
+                shape_type_id=shape_type_id,
+                count=sum(row[1] for row in rows),
+                first_time=iso(min(firsts, default=None)),
+                last_time=iso(max(lasts, default=None)),
+                years=sorted({y for row in rows for y in row[4] if y is not None}),
+                months=[
+                    iso(p)
+                    for p in sorted(periods)
+                    if self.temporal_resolution == LayerTimeResolution.MONTH
+                ],
+                weeks=[
+                    iso(p)
+                    for p in sorted(periods)
+                    if self.temporal_resolution == LayerTimeResolution.WEEK
+                ],
+                shape_ids=sorted({i for row in rows for i in row[6]}),
+            )
 
-        type_ids = []
-        for row in results:
-            type_ids.append(row[0])
+        stats = [summary(row[0], [row]) for row in rows if row[0] is not None]
+        stats.append(summary(None, rows))
+        return stats
 
-        return list(Type.objects.filter(id__in=type_ids).order_by("position"))
+    def update_stats(self) -> None:
+        """
+        Save the summary of the saved values (DatalayerStats).
 
-    def get_available_shapes(self) -> list[Shape]:
-        """Determine all shapes the datalayer has values for."""
+        Called after each save and by dl_index for tables saved before the summary
+        existed.
+        """
+        self.__dict__.pop("_stats", None)
+        stats = self.compute_stats()
+
+        # concurrent updates of the same Data Layer wait for each other
+        with transaction.atomic(), connection.cursor() as c:
+            c.execute(
+                "SELECT pg_advisory_xact_lock(%s, %s)", [STATS_LOCK_NAMESPACE, self.pk]
+            )
+            self.stats.all().delete()
+            DatalayerStats.objects.bulk_create(stats)
+
+    @cached_property
+    def _stats(self) -> dict:
+        """
+        Summary of the values by shape type id, None for all values.
+
+        Tables saved before the summary existed are summarized on each request (but
+        not saved, that's left to processing and dl_index).
+        """
         if not self.is_loaded():
+            return {}
+
+        stats = list(self.stats.all()) or self.compute_stats()
+        return {s.shape_type_id: s for s in stats}
+
+    def get_stats(self, shape_type: Type | None = None) -> "DatalayerStats | None":
+        return self._stats.get(shape_type.id if shape_type is not None else None)
+
+    @cached_property
+    def get_available_shape_types(self) -> list[Type]:
+        """Determine all shape types the datalayer has values for."""
+        type_ids = [type_id for type_id in self._stats if type_id is not None]
+        if not type_ids:
             return []
 
-        with connection.cursor() as c:
-            query = sql.SQL("SELECT DISTINCT dl.shape_id FROM {table} AS dl").format(
-                table=sql.Identifier(self.key)
-            )
-            c.execute(query)
-            results = c.fetchall()
+        return list(Type.objects.filter(id__in=type_ids).order_by("position"))
 
-        shape_ids = []
-        for row in results:
-            shape_ids.append(row[0])
+    def get_available_shapes(self) -> list[Shape]:
+        """Determine all shapes the datalayer has values for."""
+        stats = self.get_stats()
+        if stats is None:
+            return []
 
-        return Shape.objects.filter(id__in=shape_ids).order_by("type")
+        return Shape.objects.filter(id__in=stats.shape_ids).order_by("type")
 
     @cached_property
     def get_available_years(self) -> list[int]:
@@ -534,110 +702,41 @@ class Datalayer(models.Model):
         In case of data layers with a more detailed time resolution, like month or date,
         it loads the affected years.
         """
-        if not self.is_loaded():
-            # self.logger.warning("Peek of data requested but not loaded for shape_id=%s", shape_id)
+        stats = self.get_stats()
+        if stats is None:
             return []
 
-        match self.temporal_resolution:
-            case LayerTimeResolution.YEAR:
-                query = sql.SQL(
-                    "SELECT DISTINCT year FROM {table} ORDER BY year DESC"
-                ).format(table=sql.Identifier(self.key))
-            case LayerTimeResolution.MONTH:
-                query = sql.SQL(
-                    "SELECT DATE_PART('year', month ::date) AS year \
-                FROM {table} WHERE month is not NULL GROUP BY year ORDER BY year DESC"
-                ).format(table=sql.Identifier(self.key))
-            case LayerTimeResolution.WEEK:
-                query = sql.SQL(
-                    "SELECT DATE_PART('year', week ::date) AS year \
-                FROM {table} WHERE week is not NULL GROUP BY year ORDER BY year DESC"
-                ).format(table=sql.Identifier(self.key))
-
-            case LayerTimeResolution.DAY:
-                query = sql.SQL(
-                    "SELECT DATE_PART('year', date ::date) AS year \
-                FROM {table} WHERE date is not NULL GROUP BY year ORDER BY year DESC"
-                ).format(table=sql.Identifier(self.key))
-            case _:
-                raise ValueError(f"Unknown time_col={self.temporal_resolution}")
-
-        with connection.cursor() as c:
-            c.execute(query)
-            results = c.fetchall()
-
-        years = []
-        for row in results:
-            years.append(int(row[0]))
-
-        return years
+        return sorted(stats.years, reverse=True)
 
     def get_available_months(self) -> list[dt.date]:
-        if not self.is_loaded():
-            # self.logger.warning("Peek of data requested but not loaded for shape_id=%s", shape_id)
+        stats = self.get_stats()
+        if stats is None:
             return []
 
-        match self.temporal_resolution:
-            case LayerTimeResolution.MONTH:
-                query = sql.SQL(
-                    "SELECT DISTINCT month FROM {table} ORDER BY month DESC"
-                ).format(table=sql.Identifier(self.key))
-            case _:
-                raise ValueError(
-                    "Function get_available_months is not defined for Data Layers with time_col != month"
-                )
-
-        with connection.cursor() as c:
-            c.execute(query)
-            results = c.fetchall()
-
-        months = []
-        for row in results:
-            months.append(row[0])
+        if self.temporal_resolution != LayerTimeResolution.MONTH:
+            raise ValueError(
+                "Function get_available_months is not defined for Data Layers with time_col != month"
+            )
 
-        return months
+        return sorted(map(dt.date.fromisoformat, stats.months), reverse=True)
 
     def get_available_weeks(self) -> list[dt.date]:
-        if not self.is_loaded():
-            # self.logger.warning("Peek of data requested but not loaded for shape_id=%s", shape_id)
+        stats = self.get_stats()
+        if stats is None:
             return []
 
-        match self.temporal_resolution:
-            case LayerTimeResolution.WEEK:
-                query = sql.SQL(
-                    "SELECT DISTINCT week FROM {table} ORDER BY week DESC"
-                ).format(table=sql.Identifier(self.key))
-            case _:
-                raise ValueError(
-                    "Function get_available_weeks is not defined for Data Layers with time_col != week"
-                )
-
-        with connection.cursor() as c:
-            c.execute(query)
-            results = c.fetchall()
-
-        months = []
-        for row in results:
-            months.append(row[0])
-
-        return months
-
-    def _import_and_create_class(self) -> BaseLayer:
-        # spec = importlib.util.spec_from_file_location("module.name", settings.DATAHUB_DATALAYER_DIR)
-
-        ns = "src"
-
-        if "PYTEST_CURRENT_TEST" in os.environ:
-            ns = "tests"
+        if self.temporal_resolution != LayerTimeResolution.WEEK:
+            raise ValueError(
+                "Function get_available_weeks is not defined for Data Layers with time_col != week"
+            )
 
-        mod = __import__(f"{ns}.datalayer.{self.key}", fromlist=[camel(self.key)])
-        cls = getattr(mod, camel(self.key))()
-        cls.layer = self
-        return cls
+        return sorted(map(dt.date.fromisoformat, stats.weeks), reverse=True)
 
-    def get_class(self):
+    def get_class(self) -> BaseLayer:
+        """Instance of the Data Layer class, created once per model instance."""
         if self._class_instance is None:
-            self._class_instance = self._import_and_create_class()
+            self._class_instance = registry.get_class(self.key)()
+            self._class_instance.layer = self
         return self._class_instance
 
     def _get_class(self):
@@ -645,24 +744,19 @@ class Datalayer(models.Model):
 
     def has_class(self) -> bool:
         """Check if there is a implementation class for the Data Layer."""
-        has_class = False
-        try:
-            self._get_class()
-            has_class = True
-        except ModuleNotFoundError as e:
-            # TODO: this will also return false if a dependency loaded by the
-            # class is not found
-
-            logger.debug("Could not load Data Layer class for %s: %s", self.key, str(e))
-
-            # raise
+        # import errors are logged once by the registry
+        if not registry.has_class(self.key):
+            return False
 
+        try:
+            self.get_class()
         except Exception as e:
             logger.exception(
-                "Could not load Data Layer class for %s: %s", self.key, str(e)
+                "Could not create Data Layer class for %s: %s", self.key, str(e)
             )
+            return False
 
-        return has_class
+        return True
 
     def has_source_file(self) -> bool:
         """Check if the source file for a Data Layer exists."""
@@ -686,16 +780,6 @@ class Datalayer(models.Model):
 
         return False
 
-    @cached_property
-    def _database_tables(self):
-        """
-        Get all loaded Data Layers (by looking at the database tables).
-
-        This caches the query at least per instance but not yet per request
-        for all instances.
-        """
-        return connection.introspection.table_names()
-
     def is_available(self) -> bool:
         """
         Check if a Data Layer has a class and is loaded into the database.
@@ -716,9 +800,12 @@ class Datalayer(models.Model):
 
     def is_loaded(self) -> bool:
         """Check if the data has been processed and are stored in the database."""
-        # TODO: this runs a database query each time the method is called.
-        # we need to run/cache this once per request.
-        return self.key in self._database_tables
+        return self.key in catalog
+
+    def row_count(self) -> int:
+        """Number of values in the database, estimated by the planner statistics."""
+        info = catalog.get(self.key)
+        return info.rows if info is not None else 0
 
     def has_files(self) -> bool:
         """Check if data of the Data Layer are downloaded and stored locally."""
@@ -741,6 +828,14 @@ class Datalayer(models.Model):
 
     # --
 
+    def bump_data_version(self) -> None:
+        """Mark the data table as changed, cached API responses become stale."""
+        # update only these fields, the model might be changed concurrently
+        Datalayer.objects.filter(pk=self.pk).update(
+            data_version=models.F("data_version") + 1, data_updated_at=timezone.now()
+        )
+        self.refresh_from_db(fields=["data_version", "data_updated_at"])
+
     def reset(self, *, data: bool = True, log: bool = False):
         if not self.is_loaded():
             return
@@ -752,6 +847,12 @@ class Datalayer(models.Model):
             with connection.cursor() as c:
                 c.execute(query)
 
+            catalog.invalidate()
+            self.processed_sources.all().delete()
+            self.stats.all().delete()
+            self.__dict__.pop("_stats", None)
+            self.bump_data_version()
+
         # drop log for data layer
         if log:
             self.logentries.all().delete()
@@ -780,10 +881,44 @@ class Datalayer(models.Model):
         fallback_parent=False,
         mode="down",
     ):
-        """Select a single value of the Data Layer for a shape and optional timestamp."""
+        """
+        Select a single value of the Data Layer for a shape and optional timestamp.
+
+        With fallback_parent the value of the nearest shape up the hierarchy (the
+        shape itself first) that has a value is selected, in a single query.
+        """
         if not self.is_loaded():
             return None
 
+        fallback_parent = fallback_parent and shape is not None
+        query, params = self._value_query(
+            shape, when, mode, fallback_parent=fallback_parent
+        )
+        if fallback_parent:
+            query = sql.SQL(ANCESTORS_CTE) + query
+
+        with connection.cursor() as c:
+            c.execute(query, params)
+            # result = c.fetchone()
+            result = dictfetchone(c)
+
+        return DatalayerValue(self, result)
+
+    def _value_query(
+        self,
+        shape: Shape | None,
+        when: dt.datetime | None,
+        mode: str,
+        *,
+        fallback_parent=False,
+        select: sql.Composable | None = None,
+    ) -> tuple[sql.Composed, dict]:
+        """
+        Query of value(), with fallback_parent it expects ANCESTORS_CTE in front.
+
+        Parameters are named by the temporal resolution, so queries of several Data
+        Layers can be combined.
+        """
         # get the wanted compare operator
         modes = {
             "exact": "=",  # needs to be exactly the given date
@@ -794,29 +929,38 @@ class Datalayer(models.Model):
             raise ValueError(f"Unknown mode={mode}")
 
         params = {}
-        query = "SELECT dl.* FROM {table} AS dl WHERE 1=1 "
-
-        if shape:
+        query = "SELECT {select} FROM {table} AS dl WHERE 1=1 "
+
+        if fallback_parent:
+            # walk up the ancestors of the shape, for each of them the value is
+            # looked up with the index on (shape_id, temporal)
+            query = (
+                "SELECT {select} FROM ancestors AS a CROSS JOIN LATERAL ("
+                "SELECT * FROM {table} AS dl WHERE dl.shape_id = a.id "
+            )
+            params["shape_id"] = shape.id
+        elif shape:
             query += "AND dl.shape_id = %(shape_id)s "
             params["shape_id"] = shape.id
 
         operator = ""
+        when_param = f"when_{self.temporal_resolution}"
 
         if when is not None:
             operator = modes[mode]
             if self.temporal_resolution == LayerTimeResolution.YEAR:
-                query += "AND dl.year {operator} %(when)s "
-                params["when"] = when.year
+                query += "AND dl.year {operator} {when} "
+                params[when_param] = when.year
             elif self.temporal_resolution == LayerTimeResolution.MONTH:
-                query += "AND dl.month {operator} %(when)s "
-                params["when"] = when
+                query += "AND dl.month {operator} {when} "
+                params[when_param] = when
             elif self.temporal_resolution == LayerTimeResolution.WEEK:
-                query += "AND dl.week {operator} %(when)s "
+                query += "AND dl.week {operator} {when} "
                 # Monday of the ISO week where the given date is in
-                params["when"] = when - dt.timedelta(days=when.isoweekday() - 1)
+                params[when_param] = when - dt.timedelta(days=when.isoweekday() - 1)
             elif self.temporal_resolution == LayerTimeResolution.DAY:
-                query += "AND dl.date {operator} %(when)s "
-                params["when"] = when
+                query += "AND dl.date {operator} {when} "
+                params[when_param] = when
 
             else:
                 raise ValueError(f"Unknown time_col={self.temporal_resolution}")
@@ -827,21 +971,103 @@ class Datalayer(models.Model):
 
         query += "ORDER BY dl.{temporal_column} {sort_operator} LIMIT 1"
 
+        if fallback_parent:
+            query += ") AS dl ORDER BY a.depth LIMIT 1"
+
         query = sql.SQL(query).format(
+            select=select or sql.SQL("dl.*"),
             table=sql.Identifier(self.key),
             temporal_column=sql.Identifier(str(self.temporal_resolution)),
             operator=sql.SQL(operator),
             sort_operator=sql.SQL(sort_operator),
+            when=sql.Placeholder(when_param),
         )
 
-        with connection.cursor() as c:
-            c.execute(query, params)
-            # result = c.fetchone()
-            result = dictfetchone(c)
+        return query, params
 
-        return DatalayerValue(self, result)
+    @staticmethod
+    def values_for_shape(
+        shape: Shape, layers, when: dt.date | None = None, mode="down"
+    ) -> dict[int, DatalayerValue]:
+        """
+        Select the values of several Data Layers for a shape in one query.
 
-    def data(
+        Same as shape.datalayer_value(dl, when=when, mode=mode) for each of the
+        Data Layers, including the fallback to parent shapes. Returns the values by
+        the id of the Data Layer, layers that are not loaded have an empty value.
+        """
+        values = {dl.id: DatalayerValue(dl, None) for dl in layers}
+
+        loaded = [dl for dl in layers if dl.is_loaded()]
+        if loaded:
+            # rows are returned as JSON, since the tables have different columns
+            branches = []
+            params = {}
+            for position, dl in enumerate(loaded):
+                query, dl_params = dl._value_query(  # noqa: SLF001
+                    shape,
+                    when,
+                    mode,
+                    fallback_parent=True,
+                    select=sql.SQL(
+                        "{position} AS position, to_jsonb(dl) AS result"
+                    ).format(position=sql.Literal(position)),
+                )
+                branches.append(sql.SQL("(") + query + sql.SQL(")"))
+                params |= dl_params
+
+            query = sql.SQL(ANCESTORS_CTE) + sql.SQL(" UNION ALL ").join(branches)
+
+            with connection.cursor() as c:
+                c.execute(query, params)
+                rows = c.fetchall()
+
+            for position, row in rows:
+                dl = loaded[position]
+                values[dl.id] = DatalayerValue.from_json(dl, row)
+
+            # the shapes the values are derived from are shown next to them
+            shapes = Shape.objects.select_related("type").in_bulk(
+                {value.shape_id for value in values.values() if value.has_value()}
+            )
+            for value in values.values():
+                value.set_shape(shapes.get(value.shape_id))
+
+        for value in values.values():
+            if value.shape_id != shape.id and shape.parent_id is not None:
+                value.set_requested_shape(shape)
+            value.set_requested_ts(when)
+
+        return values
+
+    def resample_column(self, resample: str) -> sql.Composable:
+        """
+        SQL expression of the period of the temporal column.
+
+        resample is a pandas offset alias, see RESAMPLE_FREQUENCIES. The period is
+        a date labeled by its first or last day, as pandas.resample() would.
+        """
+        if resample not in RESAMPLE_FREQUENCIES:
+            raise ValueError(
+                f"Unsupported resample frequency {resample}, supported are {', '.join(RESAMPLE_FREQUENCIES)}"
+            )
+        field, period, label = RESAMPLE_FREQUENCIES[resample]
+
+        temporal_column = sql.Identifier(str(self.temporal_resolution))
+        if self.temporal_resolution == LayerTimeResolution.YEAR:
+            temporal_column = sql.SQL("MAKE_DATE({}, 1, 1)").format(temporal_column)
+
+        bucket = sql.SQL("DATE_TRUNC({field}, {column})").format(
+            field=sql.Literal(field), column=temporal_column
+        )
+        if label == "end":
+            bucket = sql.SQL(
+                "{bucket} + {period}::interval - '1 day'::interval"
+            ).format(bucket=bucket, period=sql.Literal(period))
+
+        return sql.SQL("({})::date").format(bucket)
+
+    def data_query(
         self,
         shape: Shape | None = None,
         when: dt.datetime | None = None,
@@ -851,16 +1077,61 @@ class Datalayer(models.Model):
         select_shape_name=True,
         fallback_previous=False,
         latest_value_only=False,
-    ) -> pd.DataFrame:
-        """Aggregate the specified data of the data layer."""
+        resample: str | None = None,
+        aggregate: str | None = None,
+        after: tuple | None = None,
+        limit: int | None = None,
+    ) -> tuple[sql.Composed, dict]:
+        """Query and parameters of the rows returned by data()."""
         params = {}
 
+        grouped = resample is not None or aggregate is not None
+        if grouped and latest_value_only:
+            raise ValueError(
+                "latest_value_only can not be combined with resample or aggregate"
+            )
+
+        paginated = after is not None or limit is not None
+        if paginated and (grouped or latest_value_only):
+            raise ValueError(
+                "Pagination can not be combined with resample, aggregate or latest_value_only"
+            )
+
+        # the key of the last row only identifies it if there is one row per shape
+        # and time, not for Data Layers with property columns
+        if paginated and not has_unique_index(
+            self.key, ["shape_id", str(self.temporal_resolution)]
+        ):
+            raise ValueError(
+                "Pagination is only supported for Data Layers with one value per shape and time"
+            )
+
+        aggregate = aggregate or "mean"
+        if aggregate not in AGGREGATES:
+            raise ValueError(
+                f"Unsupported aggregate {aggregate}, supported are {', '.join(AGGREGATES)}"
+            )
+
         distinct = ""
         if latest_value_only:
             distinct = "DISTINCT ON ({table}.shape_id) "
 
+        if not grouped:
+            columns = "{temporal_column}, value "
+        elif resample:
+            columns = (
+                f"{{bucket}} AS {{temporal_column}}, {AGGREGATES[aggregate]} AS value "
+            )
+        else:
+            columns = f"{AGGREGATES[aggregate]} AS value "
+
         query = f"SELECT {distinct}"
-        query += "shape_id as dh_shape_id, s.key as shape_key, st.key as type_key, s.name as shape_name, {temporal_column}, value FROM {table} "
+        query += "shape_id as dh_shape_id, "
+        # one value per shape has only the shape id, like the pandas groupby() before
+        if not grouped or resample:
+            query += "s.key as shape_key, st.key as type_key, s.name as shape_name, "
+        query += columns
+        query += "FROM {table} "
 
         # JOIN
         query += "JOIN shapes_shape s ON s.id = {table}.shape_id "
@@ -895,20 +1166,150 @@ class Datalayer(models.Model):
             query += "AND s.type_id = %(type)s "
             params["type"] = shape_type.id
 
-        if latest_value_only:
+        # keyset pagination, uses the (temporal, shape_id) index
+        if after is not None:
+            query += "AND ({table}.{temporal_column}, {table}.shape_id) > (%(after_temporal)s, %(after_shape_id)s) "
+            params["after_temporal"], params["after_shape_id"] = after
+
+        # GROUP BY, shape and type columns depend on their primary keys
+        if grouped:
+            query += "GROUP BY {table}.shape_id, s.id, st.id"
+            query += ", {bucket} " if resample else " "
+
+        if paginated:
+            query += "ORDER BY {table}.{temporal_column}, {table}.shape_id"
+            if limit is not None:
+                query += " LIMIT %(limit)s"
+                params["limit"] = limit
+        elif latest_value_only:
             query += "ORDER BY {table}.shape_id, {temporal_column} DESC"
+        elif grouped and not resample:
+            query += "ORDER BY {table}.shape_id"
         else:
             query += "ORDER BY {temporal_column}, st.position ASC"
 
         query = sql.SQL(query).format(
             table=sql.Identifier(self.key),
             temporal_column=sql.Identifier(str(self.temporal_resolution)),
+            bucket=self.resample_column(resample) if resample else sql.SQL(""),
+        )
+
+        return query, params
+
+    def data(
+        self,
+        shape: Shape | None = None,
+        when: dt.datetime | None = None,
+        start_date: dt.datetime | None = None,
+        end_date: dt.datetime | None = None,
+        shape_type: Type | None = None,
+        select_shape_name=True,
+        fallback_previous=False,
+        latest_value_only=False,
+        resample: str | None = None,
+        aggregate: str | None = None,
+        after: tuple | None = None,
+        limit: int | None = None,
+    ) -> pd.DataFrame:
+        """
+        Aggregate the specified data of the data layer.
+
+        With resample (pandas offset alias, like "MS") the values of each shape are
+        grouped into periods, with aggregate (pandas function name, like "sum") they
+        are reduced to one value per shape, or per shape and period if resampled
+        (mean by default). Both are done by the database, only the reduced rows are
+        returned. Values reduced per shape only have the dh_shape_id and value
+        columns.
+
+        For pagination the rows are ordered by (temporal, shape_id), limit is the
+        number of rows and after the (temporal, shape_id) of the last row of the
+        previous page, see data_next_key().
+        """
+        query, params = self.data_query(
+            shape=shape,
+            when=when,
+            start_date=start_date,
+            end_date=end_date,
+            shape_type=shape_type,
+            select_shape_name=select_shape_name,
+            fallback_previous=fallback_previous,
+            latest_value_only=latest_value_only,
+            resample=resample,
+            aggregate=aggregate,
+            after=after,
+            limit=limit,
         )
 
         return pd.read_sql(
             query.as_string(connection), con=get_conn_string(), params=params
         )
 
+    def iter_data(
+        self,
+        shape: Shape | None = None,
+        when: dt.datetime | None = None,
+        start_date: dt.datetime | None = None,
+        end_date: dt.datetime | None = None,
+        shape_type: Type | None = None,
+        select_shape_name=True,
+        fallback_previous=False,
+        latest_value_only=False,
+        resample: str | None = None,
+        aggregate: str | None = None,
+        after: tuple | None = None,
+        limit: int | None = None,
+        chunk_size: int = DATA_CHUNK_SIZE,
+    ) -> Iterator[tuple[list, list[tuple]]]:
+        """
+        Rows of data() in chunks of chunk_size, as (columns, rows) tuples, see
+        utils.iter_chunks().
+
+        The rows are read with a server-side cursor, so the memory used doesn't depend
+        on the size of the Data Layer. Invalid arguments raise a ValueError right
+        away, not on the first chunk.
+        """
+        query, params = self.data_query(
+            shape=shape,
+            when=when,
+            start_date=start_date,
+            end_date=end_date,
+            shape_type=shape_type,
+            select_shape_name=select_shape_name,
+            fallback_previous=fallback_previous,
+            latest_value_only=latest_value_only,
+            resample=resample,
+            aggregate=aggregate,
+            after=after,
+            limit=limit,
+        )
+
+        return iter_chunks(query.as_string(connection), params, chunk_size)
+
+    def data_next_key(self, limit: int, **filters) -> tuple | None:
+        """
+        Key (temporal, shape_id) of the last row of data(limit=limit, ...).
+
+        None if there are no rows after it, so it's the last page. The filters are
+        the same as for data().
+        """
+        query, params = self.data_query(limit=limit + 1, **filters)
+        query = sql.SQL(
+            "SELECT {temporal_column}, dh_shape_id FROM ({query}) AS page "
+            "ORDER BY {temporal_column}, dh_shape_id OFFSET %(offset)s"
+        ).format(
+            temporal_column=sql.Identifier(str(self.temporal_resolution)),
+            query=query,
+        )
+        params["offset"] = limit - 1
+
+        with connection.cursor() as c:
+            c.execute(query, params)
+            rows = c.fetchall()
+
+        if len(rows) < 2:
+            return None
+        return tuple(rows[0])
+
     def value_coverage(self, shape_type: Type | None = None) -> float:
         if not self.is_loaded():
             return None
@@ -962,26 +1363,18 @@ class Datalayer(models.Model):
         if not self.is_loaded():
             return None
 
-        params = {}
-        query = "SELECT COUNT(*) AS count FROM {table} AS dl "
-
-        if shape_type is not None:
-            query += "JOIN shapes_shape AS s ON  s.id = dl.shape_id "
-            query += "WHERE s.type_id = %(type_id)s "
-            params["type_id"] = shape_type.id
-
-        query = sql.SQL(query).format(table=sql.Identifier(self.key))
-        with connection.cursor() as c:
-            c.execute(query, params)
-            result = c.fetchone()
-
-        return result[0]
+        stats = self.get_stats(shape_type)
+        return stats.count if stats is not None else 0
 
     def first_time(self, shape_type: Type | None = None, shape: Shape | None = None):
         """Determine the first point in time a value is available."""
         if not self.is_loaded():
             return None
 
+        if shape is None:
+            stats = self.get_stats(shape_type)
+            return self.parse_temporal(stats.first_time) if stats is not None else None
+
         params = {}
         match self.temporal_resolution:
             case LayerTimeResolution.YEAR:
@@ -1006,7 +1399,7 @@ class Datalayer(models.Model):
             query += "WHERE s.type_id = %(type_id)s "
             params["type_id"] = shape_type.id
         elif shape is not None:
-            query += "WHERE s.shape_id = %(shape_id)s "
+            query += "WHERE dl.shape_id = %(shape_id)s "
             params["shape_id"] = shape.id
 
         query += query_order
@@ -1028,10 +1421,14 @@ class Datalayer(models.Model):
         return self.value(mode="down")
 
     def last_time(self, shape_type: Type | None = None, shape: Shape | None = None):
-        """Determine the first point in time a value is available."""
+        """Determine the last point in time a value is available."""
         if not self.is_loaded():
             return None
 
+        if shape is None:
+            stats = self.get_stats(shape_type)
+            return self.parse_temporal(stats.last_time) if stats is not None else None
+
         params = {}
         match self.temporal_resolution:
             case LayerTimeResolution.YEAR:
@@ -1054,7 +1451,7 @@ class Datalayer(models.Model):
             query += "WHERE s.type_id = %(type_id)s "
             params["type_id"] = shape_type.id
         elif shape is not None:
-            query += "WHERE s.shape_id = %(shape_id)s "
+            query += "WHERE dl.shape_id = %(shape_id)s "
             params["shape_id"] = shape.id
 
         query += query_order
@@ -1413,3 +1810,94 @@ class DatalayerLogEntry(models.Model):
     level = models.CharField(max_length=10, choices=SEVERITY_CHOICES)
     message = models.TextField()
     context = models.JSONField(default=list)
+
+
+class ProcessedSource(models.Model):
+    """
+    Source file of a Data Layer that has been processed and saved.
+
+    Used by incremental processing (dl_process --incremental) to skip files that
+    did not change since the last run. Files are identified by size and
+    modification time, if those changed the file content is compared by hash.
+    Files are only skipped if they have been processed for all requested shapes.
+    """
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    datalayer = models.ForeignKey(
+        Datalayer,
+        on_delete=models.CASCADE,
+        related_name="processed_sources",
+    )
+
+    name = models.CharField(max_length=1024)
+    size = models.BigIntegerField()
+    mtime = models.BigIntegerField(help_text=_("Modification time in nanoseconds"))
+    hash = models.CharField(
+        max_length=64, blank=True, help_text=_("SHA-256 of the file content")
+    )
+    shape_ids = models.JSONField(
+        default=list, help_text=_("Shapes the file has been processed for")
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["datalayer", "name"], name="unique_processed_source"
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class DatalayerStats(models.Model):
+    """
+    Summary of the saved values of a Data Layer per shape type.
+
+    Computed in one pass over the table after each save, so pages and the metadata
+    API don't need to scan the table. The row without shape type summarizes all
+    values. first_time/last_time and months/weeks are stored in ISO format, see
+    Datalayer.parse_temporal().
+    """
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    datalayer = models.ForeignKey(
+        Datalayer,
+        on_delete=models.CASCADE,
+        related_name="stats",
+    )
+    shape_type = models.ForeignKey(
+        Type,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="+",
+    )
+
+    count = models.BigIntegerField(default=0)
+    first_time = models.CharField(max_length=10, blank=True)
+    last_time = models.CharField(max_length=10, blank=True)
+
+    years = models.JSONField(default=list)
+    months = models.JSONField(default=list)
+    weeks = models.JSONField(default=list)
+    shape_ids = models.JSONField(default=list)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["datalayer", "shape_type"], name="unique_datalayer_stats"
+            ),
+            # NULLs are distinct, so the summary of all values needs its own
+            models.UniqueConstraint(
+                fields=["datalayer"],
+                condition=models.Q(shape_type__isnull=True),
+                name="unique_datalayer_stats_total",
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.datalayer} ({self.shape_type or 'all'})"
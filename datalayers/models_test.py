@@ -0,0 +1,118 @@
+# SPDX-FileCopyrightText: 2026 Jonathan Ströbele <mail@jonathanstroebele.de>
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import datetime as dt
+
+import pytest
+
+from datalayers.models import Datalayer
+from shapes.models import Shape, Type
+
+
+@pytest.fixture
+def shape_region(shape_country):
+    type_region = Type.objects.create(name="Region", key="region")
+
+    return Shape.objects.create(
+        name="Test Region",
+        key="TEST01-01",
+        geometry=shape_country.geometry,
+        type=type_region,
+        parent=shape_country,
+    )
+
+
+def test_datalayer_value_fallback_parent(dl_listed, shape_country, shape_region):
+    value = shape_region.datalayer_value(dl_listed, when=dt.date(2005, 6, 1))
+
+    assert value.has_value()
+    assert value.value == 5
+    assert value.shape_id == shape_country.id
+    assert value.requested_shape == shape_region
+    assert value.is_derived_spatial()
+
+    value = shape_country.datalayer_value(dl_listed, when=dt.date(2005, 6, 1))
+
+    assert value.value == 5
+    assert value.requested_shape is None
+    assert not value.is_derived_spatial()
+
+
+def test_datalayer_value_fallback_parent_no_value(dl_listed, shape_region):
+    value = shape_region.datalayer_value(dl_listed, when=dt.date(1990, 1, 1))
+
+    assert not value.has_value()
+    assert value.requested_shape == shape_region
+
+
+def test_values_for_shape(dl_listed, dl_private, shape_region):
+    layers = [dl_listed, dl_private]
+    when = dt.date(2005, 6, 1)
+
+    values = Datalayer.values_for_shape(shape_region, layers, when=when)
+
+    for dl in layers:
+        expected = shape_region.datalayer_value(dl, when=when)
+
+        assert values[dl.id].value == expected.value
+        assert values[dl.id].date() == expected.date()
+        assert values[dl.id].shape_id == expected.shape_id
+        assert values[dl.id].requested_shape == shape_region
+
+    first_values = Datalayer.values_for_shape(shape_region, layers, mode="up")
+    assert first_values[dl_listed.id].date() == 2001
+
+
+def test_catalog_loaded_tables(dl_listed, shape_country):
+    assert dl_listed.is_loaded()
+    assert dl_listed.first_time() == 2001
+    assert dl_listed.last_time() == 2020
+    assert dl_listed.last_time(shape=shape_country) == 2020
+
+    dl_listed.reset()
+
+    assert not dl_listed.is_loaded()
+    assert dl_listed.last_time() is None
+
+
+def test_datalayer_stats(dl_listed, shape_country):
+    assert dl_listed.count_values() == 20
+    assert dl_listed.get_available_years == list(range(2020, 2000, -1))
+    assert shape_country.type in dl_listed.get_available_shape_types
+
+    stats = dl_listed.get_stats(shape_type=shape_country.type)
+    assert stats.first_time == "2001"
+    assert stats.shape_ids == [shape_country.id]
+
+    # missing stats are computed on read paths, but only saved by dl_index
+    dl_listed.stats.all().delete()
+    dl = Datalayer.objects.get(pk=dl_listed.pk)
+    assert dl.count_values() == 20
+    assert dl.first_time() == 2001
+    assert dl.first_time(shape_type=shape_country.type) == 2001
+    assert not dl.stats.exists()
+
+    dl.update_stats()
+    dl.update_stats()
+    assert dl.stats.count() == 2
+
+
+def test_data_resample_aggregate(dl_listed, shape_country):
+    df = dl_listed.data(shape=shape_country, aggregate="sum")
+    assert df["value"].tolist() == [210]
+    assert df["dh_shape_id"].tolist() == [shape_country.id]
+
+    df = dl_listed.data(shape=shape_country, resample="YS")
+    assert len(df) == 20
+    assert df.loc[0, "year"] == dt.date(2001, 1, 1)
+    assert df.loc[0, "value"] == 1
+
+    df = dl_listed.data(
+        start_date=dt.date(2005, 1, 1), resample="YE", aggregate="count"
+    )
+    assert df.loc[0, "year"] == dt.date(2005, 12, 31)
+    assert df["value"].tolist() == [1] * 16
+
+    with pytest.raises(ValueError, match="Unsupported resample"):
+        dl_listed.data(resample="5min")
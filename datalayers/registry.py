@@ -0,0 +1,132 @@
+# SPDX-FileCopyrightText: 2026 Jonathan Ströbele <mail@jonathanstroebele.de>
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import importlib
+import logging
+import os
+import string
+import traceback
+from dataclasses import dataclass
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+def camel(s: str) -> str:
+    s = s.replace("_", " ")
+    s = s.replace("-", " ")
+    return string.capwords(s).replace(" ", "")
+
+
+class DatalayerClassError(ImportError):
+    """The class of a Data Layer could not be imported."""
+
+
+@dataclass
+class ImportFailure:
+    """Failed import of a Data Layer class file."""
+
+    key: str
+    error: str
+    traceback: str
+
+    # modification time of the class file at the import, None if there is no file
+    mtime_ns: int | None
+
+
+class DatalayerClassRegistry:
+    """
+    Classes of the Data Layers (src/datalayer/<key>.py), imported once per process.
+
+    Model instances only create a new instance of the cached class. Failed imports
+    are recorded with their traceback and logged once, they are only tried again
+    if the class file was added or changed since.
+    """
+
+    def __init__(self, namespace: str | None = None) -> None:
+        self._namespace = namespace
+        self._classes: dict[str, type] = {}
+        self.failures: dict[str, ImportFailure] = {}
+        self._keys: list[str] | None = None
+
+    @property
+    def namespace(self) -> str:
+        if self._namespace is not None:
+            return self._namespace
+
+        # the Data Layers used by tests are in tests/datalayer/
+        if "PYTEST_CURRENT_TEST" in os.environ:
+            return "tests"
+
+        return "src"
+
+    def get_path(self, key: str) -> Path:
+        return Path(self.namespace) / "datalayer" / f"{key}.py"
+
+    def keys(self) -> list[str]:
+        """Keys of all Data Layer class files, discovered on the first call."""
+        if self._keys is None:
+            directory = Path(self.namespace) / "datalayer"
+            self._keys = sorted(
+                path.stem for path in directory.glob("*.py") if path.stem != "__init__"
+            )
+        return self._keys
+
+    def _mtime(self, key: str) -> int | None:
+        try:
+            return self.get_path(key).stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def get_class(self, key: str) -> type:
+        """Import the class of the Data Layer, raises DatalayerClassError on failure."""
+        if key in self._classes:
+            return self._classes[key]
+
+        failure = self.failures.get(key)
+        if failure is not None:
+            if failure.mtime_ns == self._mtime(key):
+                raise DatalayerClassError(failure.error)
+
+            # the finders cache the directory contents
+            importlib.invalidate_caches()
+
+        try:
+            module = importlib.import_module(f"{self.namespace}.datalayer.{key}")
+            cls = getattr(module, camel(key))
+        except Exception as e:
+            failure = ImportFailure(
+                key=key,
+                error=f"Could not load Data Layer class for {key}: {e}",
+                traceback=traceback.format_exc(),
+                mtime_ns=self._mtime(key),
+            )
+            self.failures[key] = failure
+
+            if failure.mtime_ns is None:
+                logger.debug(failure.error)
+            else:
+                logger.error("%s\n%s", failure.error, failure.traceback)
+
+            raise DatalayerClassError(failure.error) from e
+
+        self.failures.pop(key, None)
+        self._classes[key] = cls
+        return cls
+
+    def has_class(self, key: str) -> bool:
+        try:
+            self.get_class(key)
+        except DatalayerClassError:
+            return False
+        return True
+
+    def reset(self) -> None:
+        """Forget all classes, failures and discovered keys."""
+        self._classes = {}
+        self.failures = {}
+        self._keys = None
+
+
+registry = DatalayerClassRegistry()
@@ -0,0 +1,38 @@
+# SPDX-FileCopyrightText: 2026 Jonathan Ströbele <mail@jonathanstroebele.de>
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import pytest
+
+from .registry import DatalayerClassError, DatalayerClassRegistry
+
+
+def test_registry(tmp_path, monkeypatch):
+    directory = tmp_path / "registry_test_layers" / "datalayer"
+    directory.mkdir(parents=True)
+    (directory / "my_layer.py").write_text("class MyLayer:\n    pass\n")
+    (directory / "broken_layer.py").write_text("raise RuntimeError('broken')\n")
+
+    monkeypatch.syspath_prepend(tmp_path)
+    monkeypatch.chdir(tmp_path)
+
+    registry = DatalayerClassRegistry(namespace="registry_test_layers")
+
+    assert registry.keys() == ["broken_layer", "my_layer"]
+
+    cls = registry.get_class("my_layer")
+    assert cls.__name__ == "MyLayer"
+    assert registry.get_class("my_layer") is cls
+
+    assert not registry.has_class("broken_layer")
+    assert "RuntimeError: broken" in registry.failures["broken_layer"].traceback
+    with pytest.raises(DatalayerClassError):
+        registry.get_class("broken_layer")
+
+    assert not registry.has_class("missing_layer")
+    assert registry.failures["missing_layer"].mtime_ns is None
+
+    # added class files are picked up
+    (directory / "missing_layer.py").write_text("class MissingLayer:\n    pass\n")
+    assert registry.has_class("missing_layer")
+    assert "missing_layer" not in registry.failures
@@ -3,12 +3,14 @@
 # SPDX-License-Identifier: AGPL-3.0-only
 
 import json
+from collections.abc import Iterator
 
 from sqlalchemy import create_engine
 
 from django.conf import settings
 from django.contrib import messages
 from django.core import serializers
+from django.db import connection, transaction
 
 
 def dumpdata(datalayers) -> str:
@@ -147,3 +149,27 @@ def dictfetchall(cursor):
     """
     columns = [col[0] for col in cursor.description]
     return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def iter_chunks(
+    query: str, params: dict | None, chunk_size: int
+) -> Iterator[tuple[list, list[tuple]]]:
+    """
+    Rows of a query in chunks of chunk_size, as (columns, rows) tuples.
+
+    columns is the cursor description, with name and type_code of each column. Uses
+    a server-side cursor, so only one chunk is in memory at a time. There is at
+    least one chunk, so the columns are known even without any rows.
+    """
+    # a server-side cursor outside of a transaction is declared WITH HOLD, which
+    # materializes the whole result before the first row can be fetched
+    with transaction.atomic(), connection.chunked_cursor() as cursor:
+        cursor.execute(query, params)
+        columns = list(cursor.description)
+
+        rows = cursor.fetchmany(chunk_size)
+        yield columns, rows
+        while rows:
+            rows = cursor.fetchmany(chunk_size)
+            if rows:
+                yield columns, rows
@@ -0,0 +1,62 @@
+# SPDX-FileCopyrightText: 2026 Jonathan Ströbele <mail@jonathanstroebele.de>
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+"""
+Jobs of the worker processes of dl_process --jobs.
+
+The workers are spawned, they import this module to unpickle the jobs before Django
+is set up. So it must not import any models (or modules importing them) at module
+level.
+"""
+
+import traceback
+from io import StringIO
+
+import django
+from django.conf import settings
+from django.core.management.base import OutputWrapper
+from django.core.management.color import color_style
+from django.db import DatabaseError, connections
+
+# Errors of processing a Data Layer that fail only this layer, others are bugs and
+# end the command
+LAYER_ERRORS = (DatabaseError, OSError, LookupError, ValueError)
+
+
+def init_worker(databases: dict[str, str]) -> None:
+    """
+    Set up Django in a spawned worker.
+
+    databases are the names of the databases of the parent by alias, so the workers
+    use the same ones even if they were changed after the settings were loaded
+    (i.e., the test databases).
+    """
+    django.setup()
+
+    for alias, name in databases.items():
+        settings.DATABASES[alias]["NAME"] = name
+        connections[alias].settings_dict["NAME"] = name
+
+
+def process_layer_job(pk: int, options: dict) -> tuple[str, bool]:
+    """Process a Data Layer in a worker, returns the output and if it succeeded."""
+    from datalayers.management.commands.dl_process import get_shapes, process_layer
+    from datalayers.models import Datalayer
+
+    out = StringIO()
+    stdout = OutputWrapper(out)
+    style = color_style(force_color=bool(options["force_color"]))
+
+    dl = Datalayer.objects.get(pk=pk)
+    try:
+        process_layer(dl, get_shapes(options["shape_type"]), options, stdout, style)
+        success = True
+    except LAYER_ERRORS:
+        stdout.write(style.ERROR(f'Processing Data Layer "{dl.key}" failed:'))
+        stdout.write(traceback.format_exc())
+        success = False
+    finally:
+        connections.close_all()
+
+    return out.getvalue(), success
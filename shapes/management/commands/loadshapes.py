@@ -11,7 +11,7 @@ from django.core.management.base import BaseCommand, CommandError
 from django.db import connection
 from django.utils.timezone import now
 
-from datalayers.utils import get_engine
+from datalayers.loader import copy_dataframe
 from shapes.models import Shape, Type
 
 
@@ -40,8 +40,6 @@ class Command(BaseCommand):
                     )
                 )
 
-        engine = get_engine()
-
         gdf = geopandas.read_file(file.name)
         required_cols = [
             "id",
@@ -106,17 +104,15 @@ class Command(BaseCommand):
         # In Geopandas/Pandas there is no None/Null value for Integers. So our
         # parent_id column with the int reference is of type float (b/c upper most
         # shapes have no parent_id).
-        # SQLAlchemy / Geopandas to_postgis() can't handle a float in enforcing the
-        # foreign key to the parent row.
+        # COPY can't load a float into the integer foreign key to the parent row.
         # ...so we need to split our input data in parent only rows and child rows
         # and import them separately.
         #
-        # Also GeoPandas to_postgis() uses intermediary CSV files, which cast empty
-        # strings to NULL. so the Django way of "nullable/empty" strings stored as "" (empty string)
-        # clashes during imports, this is why we use `null=True, blank=True` for optional
-        # fields in the model (see https://github.com/geopandas/geopandas/issues/2588).
+        # Earlier imports used GeoPandas to_postgis(), which casts empty strings to
+        # NULL, this is why we use `null=True, blank=True` for optional fields in the
+        # model (see https://github.com/geopandas/geopandas/issues/2588).
         gdf_no_parent = gdf[gdf["parent_id"].isna()].copy()
-        gdf_no_parent[
+        gdf_no_parent = gdf_no_parent[
             [
                 "created_at",
                 "updated_at",
@@ -133,14 +129,15 @@ class Command(BaseCommand):
                 "properties",
                 "geometry",
             ]
-        ].to_postgis(Shape._meta.db_table, engine, if_exists="append")
+        ]
+        copy_dataframe(gdf_no_parent, Shape._meta.db_table, if_exists="append")
 
         gdf_with_parent = gdf[gdf["parent_id"].notna()].copy()
 
-        # no isna() rows left => cast to int, so SQLAlchemy can write to PostGIS
+        # no isna() rows left => cast to int, so it can be written to PostGIS
         gdf_with_parent["parent_id"] = gdf_with_parent["parent_id"].astype("int")
 
-        gdf_with_parent[
+        gdf_with_parent = gdf_with_parent[
             [
                 "created_at",
                 "updated_at",
@@ -158,7 +155,8 @@ class Command(BaseCommand):
                 "properties",
                 "geometry",
             ]
-        ].to_postgis(Shape._meta.db_table, engine, if_exists="append")
+        ]
+        copy_dataframe(gdf_with_parent, Shape._meta.db_table, if_exists="append")
 
         # calculate shape area
         # Date are in ESPG:4326 (deg based), so for ST_Area() to produce m2
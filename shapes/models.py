@@ -126,11 +126,10 @@ class Shape(models.Model):
         return False
 
     def datalayer_value(self, dl, when=None, mode="down"):
-        value = dl.value(self, mode=mode, when=when)
-
-        if not value.has_value() and self.has_parent():
-            value = self.parent.datalayer_value(dl, when=when, mode=mode)
+        # the nearest shape up the hierarchy with a value is selected in one query
+        value = dl.value(self, mode=mode, when=when, fallback_parent=True)
 
+        if value.shape_id != self.id and self.parent_id is not None:
             value.set_requested_shape(self)
 
         value.set_requested_ts(when)
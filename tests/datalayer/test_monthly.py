@@ -0,0 +1,29 @@
+# SPDX-FileCopyrightText: 2026 Jonathan Ströbele <mail@jonathanstroebele.de>
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import datetime as dt
+
+from datalayers.datasources.base_layer import (
+    BaseLayer,
+    LayerTimeResolution,
+    LayerValueType,
+)
+from shapes.models import Shape
+
+
+class TestMonthly(BaseLayer):
+    __test__ = False
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.time_col = LayerTimeResolution.MONTH
+        self.value_type = LayerValueType.INTEGER
+
+    def download(self):
+        pass
+
+    def process(self, shapes: list[Shape]):
+        for shape in shapes:
+            for month in range(1, 12 + 1):
+                self.add_value(shape, dt.date(2020, month, 1), month)